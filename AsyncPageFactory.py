@@ -0,0 +1,499 @@
+# Page objects for asyncio. The selenium client blocks a thread per browser for every command, and page objects
+# spend most of their time waiting, so driving many browsers meant many threads or processes. Here the WebDriver
+# protocol is spoken over asyncio streams instead (AsyncWebDriver), and pages, waits and page chains are coroutines,
+# so one event loop can steer dozens of sessions:
+#
+#   async def login(url):
+#       driver = await AsyncWebDriver.start("http://localhost:4444")
+#       login_page = await DemoLoginPageUsernameAsync.open(driver, url=f"{FIXTURE_URL}/loginuser.html")
+#       profile_page = await login_page.login_to_profile("user", "pass")
+#       await driver.quit()
+#
+#   await asyncio.gather(*(login(url) for _ in range(50)))
+#
+# The waits and the page logic are the blocking page objects' own, written as steps (see WaitEngine and
+# PageFactory.PageSteps) that are awaited here instead. Waiting inside the page costs the event loop nothing, the
+# driver simply answers the request later.
+import ssl
+import json
+import base64
+import asyncio
+import functools
+import urllib.parse
+import concurrent.futures
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import (WebDriverException, NoSuchElementException, StaleElementReferenceException,
+                                        TimeoutException, JavascriptException, NoSuchWindowException,
+                                        InvalidSelectorException, UnknownMethodException)
+try:
+    from selenium.webdriver.remote.remote_connection import remote_commands as W3C_ROUTES
+except ImportError:  # selenium 3 keeps them on the connection
+    from selenium.webdriver.remote.remote_connection import RemoteConnection
+    W3C_ROUTES = RemoteConnection("http://localhost")._commands
+from selenium.webdriver.remote.command import Command
+
+from TestBase import DEFAULT_TIMEOUT
+from WaitEngine import WaitEngine, SLEEP, SCRIPT_TIMEOUT_MARGIN
+from PageFactory import PageSteps, SETTLE, SETTLE_CAP, turbo
+from LatencyStore import browser_name
+
+ELEMENT_KEY = "element-6066-11e4-a52e-4f735466cecf"
+REQUEST_TIMEOUT = 120  # seconds to wait for the answer to a command, as selenium's client does
+# W3C error codes, as the selenium client maps them
+ERRORS = {"no such element": NoSuchElementException,
+          "stale element reference": StaleElementReferenceException,
+          "script timeout": TimeoutException,
+          "timeout": TimeoutException,
+          "javascript error": JavascriptException,
+          "no such window": NoSuchWindowException,
+          "invalid selector": InvalidSelectorException,
+          "unknown command": UnknownMethodException,
+          "unknown method": UnknownMethodException}
+
+
+class AsyncElement(object):
+    """
+    A WebElement reference for AsyncWebDriver
+    """
+    def __init__(self, driver, element_id):
+        self.driver = driver
+        self.id = element_id
+
+    async def _command(self, command, params=None):
+        return await self.driver.command(command, dict(params or {}, id=self.id))
+
+    async def click(self):
+        await self._command(Command.CLICK_ELEMENT)
+
+    async def clear(self):
+        await self._command(Command.CLEAR_ELEMENT)
+
+    async def send_keys(self, text):
+        text = str(text)
+        await self._command(Command.SEND_KEYS_TO_ELEMENT, {"text": text, "value": list(text)})
+
+    async def text(self):
+        return await self._command(Command.GET_ELEMENT_TEXT)
+
+    async def get_attribute(self, name):
+        return await self._command(Command.GET_ELEMENT_ATTRIBUTE, {"name": name})
+
+
+class AsyncWebDriver(object):
+    """
+    A WebDriver session spoken to over asyncio streams, with keep-alive connections
+    """
+    def __init__(self, url, session_id=None, timeout=REQUEST_TIMEOUT):
+        """
+        :param url: the WebDriver endpoint, such as http://localhost:4444
+        :param session_id: an existing session, see start() to begin a new one
+        :param timeout: seconds to wait for the answer to a command, longer for scripts that wait longer
+        """
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"Can't speak WebDriver over {parts.scheme or 'no scheme'}: {url}")
+        self._host = parts.hostname
+        self._port = parts.port or (443 if parts.scheme == "https" else 80)
+        self._ssl = ssl.create_default_context() if parts.scheme == "https" else None
+        self._path = parts.path.rstrip("/")
+        self._headers = f"Host: {parts.netloc.rpartition('@')[2]}\r\n"
+        if parts.username is not None:  # a grid with credentials in its url
+            userinfo = urllib.parse.unquote(parts.username) + ":" + urllib.parse.unquote(parts.password or "")
+            self._headers += f"Authorization: Basic {base64.b64encode(userinfo.encode('utf-8')).decode('ascii')}\r\n"
+        self._idle = []  # (reader, writer, event loop) of open connections waiting for the next request
+        self.timeout = timeout
+        self.session_id = session_id
+        self.capabilities = {}  # what the session was started with, see start()
+        self._pom_script_timeout = 0
+
+    @classmethod
+    async def start(cls, url, capabilities=None):
+        """
+        :param capabilities: W3C alwaysMatch capabilities, for example {"browserName": "firefox"}
+        :return: a driver with a new session
+        """
+        driver = cls(url)
+        value = await driver.command(Command.NEW_SESSION, {"capabilities": {"alwaysMatch": capabilities or {}}})
+        driver.session_id = value["sessionId"]
+        driver.capabilities = value.get("capabilities") or {}
+        return driver
+
+    async def _connection(self):
+        loop = asyncio.get_running_loop()
+        while self._idle:
+            reader, writer, idle_loop = self._idle.pop()
+            if idle_loop is loop:
+                return reader, writer, True
+            # opened on an earlier event loop, which closed it when it finished
+        reader, writer = await asyncio.open_connection(self._host, self._port, ssl=self._ssl)
+        return reader, writer, False
+
+    async def _request(self, method, path, body):
+        payload = b"" if body is None else json.dumps(body).encode("utf-8")
+        request = (f"{method} {self._path}{path} HTTP/1.1\r\n{self._headers}"
+                   f"Content-Type: application/json;charset=utf-8\r\nContent-Length: {len(payload)}\r\n"
+                   f"Connection: keep-alive\r\n\r\n").encode("ascii") + payload
+        timeout = max(self.timeout, self._pom_script_timeout + SCRIPT_TIMEOUT_MARGIN)
+        while True:
+            reader, writer, reused = await self._connection()
+            keep = False  # only a connection that answered in full can take the next request
+            try:
+                status, headers, data = await asyncio.wait_for(self._exchange(reader, writer, request), timeout)
+                keep = headers.get("connection", "").lower() != "close"
+            except (ConnectionError, asyncio.IncompleteReadError):
+                if reused:
+                    continue  # the server closed an idle connection, try a fresh one
+                raise
+            except asyncio.TimeoutError:
+                raise WebDriverException(f"No answer to {method} {path} within {timeout}s") from None
+            finally:
+                if keep:
+                    self._idle.append((reader, writer, asyncio.get_running_loop()))
+                else:
+                    writer.close()
+            return status, data
+
+    async def _exchange(self, reader, writer, request):
+        writer.write(request)
+        await writer.drain()
+        return await self._response(reader)
+
+    @staticmethod
+    async def _response(reader):
+        status = int((await reader.readuntil(b"\r\n")).split()[1])
+        headers = {}
+        while True:
+            line = (await reader.readuntil(b"\r\n")).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            data = b""
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                chunk = await reader.readexactly(size + 2)
+                if not size:
+                    break
+                data += chunk[:-2]
+        else:
+            data = await reader.readexactly(int(headers.get("content-length", 0)))
+        return status, headers, data
+
+    async def command(self, command, params=None):
+        """
+        Send a WebDriver command, by its selenium Command name
+        :param params: parameters, those named in the route ($sessionId, $id, $name) go in the path
+        :return: the value of the response, with element references as AsyncElement
+        :raises WebDriverException: or the subclass for the W3C error code
+        """
+        method, path = W3C_ROUTES[command]
+        params = dict(params or {})
+        params.setdefault("sessionId", self.session_id)
+        for name in ("sessionId", "id", "name"):
+            if f"${name}" in path:
+                path = path.replace(f"${name}", urllib.parse.quote(str(params.pop(name)), safe=""))
+        params.pop("sessionId", None)
+        status, data = await self._request(method, path, self._unwrap(params) if method == "POST" else None)
+        value = json.loads(data or b"null")
+        value = value.get("value") if isinstance(value, dict) else None
+        if status >= 400 or (isinstance(value, dict) and "error" in value):
+            value = value or {}
+            raise ERRORS.get(value.get("error"), WebDriverException)(value.get("message", f"HTTP {status}"))
+        return self._wrap(value)
+
+    def _wrap(self, value):
+        if isinstance(value, dict):
+            if ELEMENT_KEY in value:
+                return AsyncElement(self, value[ELEMENT_KEY])
+            return {key: self._wrap(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._wrap(item) for item in value]
+        return value
+
+    def _unwrap(self, value):
+        if isinstance(value, AsyncElement):
+            return {ELEMENT_KEY: value.id}
+        if isinstance(value, dict):
+            return {key: self._unwrap(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._unwrap(item) for item in value]
+        return value
+
+    async def get(self, url):
+        await self.command(Command.GET, {"url": url})
+
+    async def title(self):
+        return await self.command(Command.GET_TITLE)
+
+    async def current_url(self):
+        return await self.command(Command.GET_CURRENT_URL)
+
+    async def page_source(self):
+        return await self.command(Command.GET_PAGE_SOURCE)
+
+    async def get_screenshot_as_png(self):
+        return base64.b64decode(await self.command(Command.SCREENSHOT))
+
+    async def execute_script(self, script, *args):
+        return await self.command(Command.W3C_EXECUTE_SCRIPT, {"script": script, "args": list(args)})
+
+    async def execute_async_script(self, script, *args):
+        return await self.command(Command.W3C_EXECUTE_SCRIPT_ASYNC, {"script": script, "args": list(args)})
+
+    async def find_element(self, by=By.ID, value=None):
+        # W3C has no id, name or class name strategies, selenium rewrites them as css the same way
+        if by in (By.ID, By.NAME):
+            quoted = value.replace("\\", "\\\\").replace('"', '\\"')
+            by, value = By.CSS_SELECTOR, f'[{by}="{quoted}"]'
+        elif by == By.CLASS_NAME:
+            by, value = By.CSS_SELECTOR, f".{value}"
+        elif by == By.TAG_NAME:
+            by = By.CSS_SELECTOR
+        return await self.command(Command.FIND_ELEMENT, {"using": by, "value": value})
+
+    async def set_script_timeout(self, seconds):
+        await self.command(Command.SET_TIMEOUTS, {"script": int(seconds * 1000)})
+
+    def grab_evidence(self):
+        """
+        The url, screenshot and page source, for POMException.capture, which is not a coroutine. They are read on
+        an event loop of its own, in another thread, as the loop the session was driven from may be gone or busy
+        :return: (url, png, html)
+        """
+        async def grab():
+            return await self.current_url(), await self.get_screenshot_as_png(), await self.page_source()
+
+        with concurrent.futures.ThreadPoolExecutor(1) as pool:
+            return pool.submit(asyncio.run, grab()).result()
+
+    async def quit(self):
+        try:
+            await self.command(Command.QUIT)
+        finally:
+            for _, writer, loop in self._idle:
+                if loop is asyncio.get_running_loop():
+                    writer.close()
+            self._idle = []
+
+
+async def run_steps_async(steps, perform):
+    """
+    WaitEngine.run_steps for a coroutine perform
+    """
+    result, error = None, None
+    while True:
+        try:
+            step = steps.send(result) if error is None else steps.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            result, error = await perform(*step), None
+        except Exception as ex:
+            result, error = None, ex
+
+
+class AsyncWaitEngine(WaitEngine):
+    """
+    The waits of WaitEngine on an AsyncWebDriver, they return coroutines
+    """
+    async def perform(self, name, *args):
+        if name == SLEEP:
+            return await asyncio.sleep(*args)
+        return await getattr(self.driver, name)(*args)
+
+    def run(self, steps):
+        return run_steps_async(steps, self.perform)
+
+
+class AsyncPageFactory(PageSteps):
+    # Declare locators, keystroke_locators, ready_locators and locator_timeouts as for PageFactory. Pages are made
+    # with "await Page.open(driver, ...)", and locators are awaited:
+    #   element = await self.btnContinue
+    #   await self.set("editUserName", "JoeBloggs")
+
+    def __init__(self,
+                 driver,
+                 timeout=None,
+                 highlight=True,
+                 animation_delay=SETTLE,
+                 settle_cap=SETTLE_CAP,
+                 ready_locators=None,
+                 app=None):
+        """
+        Use open(), which also loads the page
+        :param driver: an AsyncWebDriver
+        :param timeout: seconds, or None to use learned per-locator timeouts of at most DEFAULT_TIMEOUT
+        :param highlight: highlight elements as we use them
+        :param animation_delay: SETTLE, or seconds to sleep after element access, see PageFactory
+        :param settle_cap: most seconds to wait for the page to settle
+        :param ready_locators: optional aliases to wait for while loading
+        :param app: optional WebAppBase, its rewrite_url is applied to urls
+        """
+        super().__init__("APOM")
+        self.driver = driver
+        self.waits = AsyncWaitEngine(driver)
+        self._page = type(self).__name__
+        self._browser = browser_name(driver)
+        self._options = {"timeout": timeout, "highlight": highlight, "animation_delay": animation_delay,
+                         "settle_cap": settle_cap, "app": app}
+        self._app = app
+        self._learned_timeouts = timeout is None
+        self.timeout = DEFAULT_TIMEOUT if timeout is None else timeout
+        self._highlight = highlight and not turbo()
+        self._delay = 0 if turbo() else animation_delay
+        self._settle_cap = settle_cap
+        if ready_locators is not None:
+            self.ready_locators = ready_locators
+        self.missing_locators = []
+
+    @classmethod
+    async def open(cls, driver, url=None, wait_title_contains=None, **options):
+        """
+        Make the page object and check the page is there, as PageFactory's constructor does
+        :param driver: an AsyncWebDriver
+        :param url: optional url to navigate to first
+        :param wait_title_contains: optional case-sensitive page title substring to wait for
+        :param options: see __init__
+        :raises POMException: if the page does not load
+        """
+        page = cls(driver, **options)
+        await page.waits.run(page._load_steps(url, wait_title_contains))
+        return page
+
+    async def element(self, alias):
+        """
+        The element for a locator, once visible, scrolled into view and highlighted; also `await self.alias`
+        """
+        if alias not in self.locators:
+            raise Exception(f"No page element with the alias {alias} was defined!")
+        self.debug("element %s", alias)
+        element = await self.waits.run(self._locate_steps(alias))
+        await self.waits.run(self._after_action_steps())
+        return element
+
+    async def set(self, alias, value):
+        """
+        Type into a locator, the async form of assigning to it
+        """
+        self.debug("set %s = '%s'", alias, value)
+        element = await self.waits.run(self._locate_steps(alias))
+        await element.clear()
+        await element.send_keys(value)
+
+    async def fill(self, values, keystrokes=()):
+        """
+        Set many fields in one round trip, see PageFactory.fill
+        """
+        for alias in await self.waits.run(self._fill_steps(values, keystrokes)):
+            await self.set(alias, values[alias])
+
+    async def snapshot(self, attributes=(), aliases=None):
+        """
+        Read the state of every locator in one script call, see PageFactory.snapshot
+        """
+        return await self.waits.run(self._snapshot_steps(attributes, aliases))
+
+    def __getattr__(self, alias):
+        # only called for names that are not attributes, so locators; await the result
+        if alias != "locators" and alias in getattr(type(self), "locators", {}):
+            return self.element(alias)
+        raise AttributeError(alias)
+
+
+ASYNC_MAP = {}  # async pages add themselves here to use @async_next_page, as with PageChains.MAP
+
+
+def register_async_page(page_class):
+    ASYNC_MAP[page_class.__name__] = page_class
+
+
+def async_next_page(next_, ready=None):
+    """
+    PageChains.next_page for async pages: await the decorated method, then open the next page in the same
+    driver with the same options
+    """
+    def deco(func):
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            result = await func(self, *args, **kwargs)
+            page_class = ASYNC_MAP[next_]
+            if result is not self and type(result) is page_class:
+                return result
+            options = dict(self._options)
+            if ready is not None:
+                options["ready_locators"] = ready
+            return await page_class.open(self.driver, **options)
+        wrapper._next_page = next_
+        return wrapper
+    return deco
+
+
+class DemoLoginPageUsernameAsync(AsyncPageFactory):
+
+    locators = {
+        "editUserName": (By.ID, "usernameOrEmail"),
+        "btnContinue": (By.NAME, "Continue")
+    }
+
+    @async_next_page("DemoLoginPagePasswordAsync", ready=["editPassword"])
+    async def next(self, username):
+        await self.set("editUserName", username)
+        await (await self.btnContinue).click()
+        return self
+
+    @async_next_page("DemoProfilePageAsync")
+    async def login_to_profile(self, username, password):
+        password_page = await self.next(username)
+        home_page = await password_page.next(password)
+        return await home_page.next()
+
+
+register_async_page(DemoLoginPageUsernameAsync)
+
+
+class DemoLoginPagePasswordAsync(AsyncPageFactory):
+
+    locators = {
+        "editPassword": (By.ID, "password"),
+        "btnLogin": (By.NAME, "LogIn"),
+    }
+
+    @async_next_page("DemoHomePageAsync")
+    async def next(self, password):
+        await self.set("editPassword", password)
+        await (await self.btnLogin).click()
+        return self
+
+
+register_async_page(DemoLoginPagePasswordAsync)
+
+
+class DemoHomePageAsync(AsyncPageFactory):
+
+    locators = {
+        "btnProfile": (By.NAME, "Profile"),
+    }
+
+    @async_next_page("DemoProfilePageAsync")
+    async def next(self):
+        await (await self.btnProfile).click()
+        return self
+
+
+register_async_page(DemoHomePageAsync)
+
+
+class DemoProfilePageAsync(AsyncPageFactory):
+
+    locators = {
+        "btnLogout": (By.NAME, "LogOut")
+    }
+
+    @async_next_page("DemoLoginPageUsernameAsync")
+    async def next(self):
+        await (await self.btnLogout).click()
+        return self
+
+
+register_async_page(DemoProfilePageAsync)
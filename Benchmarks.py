@@ -0,0 +1,170 @@
+# Micro-benchmarks for the PageFactory and ChainingPageFactory hot paths, run against FakeDriver so that they
+# measure our own overhead and WebDriver command counts rather than a browser.
+#
+#   python Benchmarks.py            compare against the stored baseline
+#   python Benchmarks.py --save     run and store a new baseline
+#
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import tracemalloc
+
+from TestBase import WebAppBase, WrapFake, FIXTURE_URL
+from Instrumentation import instrument
+from LatencyStore import LATENCIES
+from Helpers import percentile
+from main import DemoLoginPageUsername, WelcomePage
+from PageChains import DemoLoginPageUsernameV2
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+LOGIN_URL = f"{FIXTURE_URL}/loginuser.html"
+WELCOME_URL = f"{FIXTURE_URL}/welcome.html"
+
+
+class BenchApp(WebAppBase):
+    """
+    A WebAppBase on a FakeDriver
+    """
+    def __init__(self):
+        self.webdriver = WrapFake.get_driver(None)
+
+
+def _page_construction(app):
+    app.get(LOGIN_URL)
+    return lambda: DemoLoginPageUsername(app)
+
+
+def _getattr_cached(app):
+    app.get(WELCOME_URL)
+    page = WelcomePage(app)
+    page._delay = 0
+    return lambda: page.firstname
+
+
+def _getattr_uncached(app):
+    app.get(WELCOME_URL)
+    page = WelcomePage(app)
+    page._delay = 0
+
+    def op():
+        page.invalidate_cache()
+        return page.firstname
+    return op
+
+
+def _setattr(app):
+    app.get(WELCOME_URL)
+    page = WelcomePage(app)
+
+    def op():
+        page.firstname = "firstname"
+    return op
+
+
+def _fill(app):
+    app.get(WELCOME_URL)
+    page = WelcomePage(app)
+    return lambda: page.fill({"firstname": "firstname", "lastname": "lastname"})
+
+
+def _chaining_construction(app):
+    app.get(LOGIN_URL)
+    return lambda: DemoLoginPageUsernameV2(driver=app, animation_delay=0)
+
+
+def _chain_to_profile(app):
+    def op():
+        page = DemoLoginPageUsernameV2(driver=app, url=LOGIN_URL, animation_delay=0)
+        return page.login_to_profile(username="user", password="pass")
+    return op
+
+
+BENCHMARKS = {
+    "page_construction": _page_construction,
+    "getattr_cached": _getattr_cached,
+    "getattr_uncached": _getattr_uncached,
+    "setattr": _setattr,
+    "fill": _fill,
+    "chaining_construction": _chaining_construction,
+    "chain_to_profile": _chain_to_profile,
+}
+
+
+def run_benchmark(name, iterations):
+    """
+    :return: dict of mean/p50/p99 microseconds, WebDriver commands and peak KiB allocated per operation
+    """
+    app = BenchApp()
+    recorder = instrument(app.webdriver)
+    op = BENCHMARKS[name](app)
+    op()  # warm up
+    samples = []
+    commands = recorder.total_commands
+    for _ in range(iterations):
+        start = time.perf_counter()
+        op()
+        samples.append((time.perf_counter() - start) * 1e6)
+    commands = (recorder.total_commands - commands) / iterations
+
+    tracemalloc.start()
+    peaks = []
+    for _ in range(min(iterations, 50)):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        op()
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    samples.sort()
+    return {"mean_us": round(sum(samples) / len(samples), 1),
+            "p50_us": round(percentile(samples, 0.50), 1),
+            "p99_us": round(percentile(samples, 0.99), 1),
+            "commands": round(commands, 2),
+            "alloc_kib": round(sum(peaks) / len(peaks) / 1024, 1)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PageFactory micro-benchmarks")
+    parser.add_argument("names", nargs="*", default=list(BENCHMARKS), help="benchmarks to run, default all")
+    parser.add_argument("-n", "--iterations", type=int, default=200)
+    parser.add_argument("--save", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--fail-over", type=float, default=None,
+                        help="exit non-zero if a mean is this many times the baseline, or commands went up")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+
+    logging.getLogger("pom").setLevel(logging.WARNING)  # page objects log a lot
+    LATENCIES.use(None)  # a throwaway history, what the benchmarks learn is no use to real test runs
+    results, regressed = {}, False
+    print(f"{'benchmark':24}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}{'cmds':>7}{'KiB':>8}  vs baseline")
+    for name in args.names:
+        result = results[name] = run_benchmark(name, args.iterations)
+        base = baseline.get(name)
+        versus = ""
+        if base:
+            ratio = result["mean_us"] / base["mean_us"]
+            versus = f"x{ratio:.2f} mean, {result['commands'] - base['commands']:+.2f} cmds"
+            if args.fail_over and (ratio > args.fail_over or result["commands"] > base["commands"]):
+                regressed = True
+                versus += "  REGRESSED"
+        print(f"{name:24}{result['mean_us']:>10}{result['p50_us']:>10}{result['p99_us']:>10}"
+              f"{result['commands']:>7}{result['alloc_kib']:>8}  {versus}")
+
+    if args.save:
+        baseline.update(results)
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline saved to {BASELINE_FILE}")
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
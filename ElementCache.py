@@ -0,0 +1,84 @@
+# A per-page cache of located elements. Using a locator twice should not cost a second wait, lookup and scroll,
+# so the page keeps the WebElement it found and only looks it up again once the browser says it went stale.
+from selenium.webdriver.remote.webelement import WebElement
+from selenium.common.exceptions import StaleElementReferenceException
+
+
+class CachedElement(WebElement):
+    """
+    A WebElement that re-locates itself, once, when the page has replaced the element it was pointing at
+    """
+    def __init__(self, element, relocate, scope=None):
+        """
+        :param element: the WebElement that was found
+        :param relocate: callable returning a fresh WebElement for the same locator
+        :param scope: optional callable returning a context manager to run element commands in, such as
+            CommandRecorder.scope(), so that clicks and reads are attributed to the page and locator
+        """
+        super().__init__(element.parent, element.id)
+        self._relocate = relocate
+        self._scope = scope
+
+    def _execute(self, command, params=None):
+        if self._scope is None:
+            return self._execute_fresh(command, params)
+        with self._scope():
+            return self._execute_fresh(command, params)
+
+    def _execute_fresh(self, command, params):
+        try:
+            return super()._execute(command, params)
+        except StaleElementReferenceException:
+            self._id = self._relocate().id
+            return super()._execute(command, params)
+
+
+class ElementCache(object):
+    """
+    Elements keyed by locator alias, with hit/miss/stale counters so you can see what the cache saves
+    """
+    def __init__(self, locate, scope=None, relocate=None):
+        """
+        :param locate: callable taking a locator alias and returning a visible WebElement
+        :param scope: optional callable taking a locator alias and returning a context manager, see CachedElement
+        :param relocate: optional callable like locate, for finding an element again once it went stale
+        """
+        self._locate = locate
+        self._relocate = relocate or locate
+        self._scope = scope
+        self._elements = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def get(self, alias):
+        """
+        :param alias: the key in the page locators dictionary
+        :return: the cached element, located now if it was not already cached
+        """
+        element = self._elements.get(alias)
+        if element is not None:
+            self.hits += 1
+            return element
+        self.misses += 1
+        scope = (lambda: self._scope(alias)) if self._scope else None
+        element = CachedElement(self._locate(alias), lambda: self._refresh(alias), scope)
+        self._elements[alias] = element
+        return element
+
+    def _refresh(self, alias):
+        self.stale += 1
+        return self._relocate(alias)
+
+    def invalidate(self, alias=None):
+        """
+        Forget one cached element, or all of them (for example after navigating)
+        :param alias: optional locator alias
+        """
+        if alias is None:
+            self._elements.clear()
+        else:
+            self._elements.pop(alias, None)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "stale": self.stale, "cached": len(self._elements)}
@@ -0,0 +1,136 @@
+# Collection locators, for lists and tables with many rows. A collection is a lazy, sliceable sequence over
+# everything a locator matches: reading it fetches row text and attributes in batches through one script call per
+# batch, instead of creating a WebElement (and sending several commands) for every row. WebElements are only
+# fetched for the rows you ask for.
+import time
+import collections
+from collections.abc import Sequence
+
+from PageScripts import COLLECTION_ROWS, COLLECTION_FIND
+from WaitEngine import POLL_FREQUENCY
+
+BATCH_SIZE = 100
+STREAM_WINDOW = 10000  # most rows a virtualized list is expected to have rendered at once
+# attributes: ((name, value), ...) for the attribute names the collection was asked to read
+Row = collections.namedtuple("Row", "index text attributes")
+
+
+class ElementCollection(Sequence):
+    """
+    Everything one collection locator matches, see PageFactory.collection_locators
+    """
+    def __init__(self, page, alias, attributes=(), batch_size=BATCH_SIZE):
+        """
+        :param page: the PageFactory the locator belongs to
+        :param alias: key in the page collection_locators dictionary
+        :param attributes: attribute names to read along with the text of every row
+        :param batch_size: rows per script call
+        """
+        self._page = page
+        self.alias = alias
+        self.by, self.value = page.collection_locators[alias]
+        self.attributes = list(attributes)
+        self.batch_size = batch_size
+
+    def _rows(self, start, count, elements=False, scroll=False, step=1, attributes=None):
+        attributes = self.attributes if attributes is None else attributes
+        with self._page.recorder.scope(self._page._page, self.alias):
+            result = self._page.driver.execute_script(COLLECTION_ROWS, self.by, self.value, start, count,
+                                                      attributes, elements, scroll, step)
+        rows = [Row(start + i * step, text, tuple(zip(attributes, values)))
+                for i, (text, values) in enumerate(result["rows"])]
+        return result["total"], rows, result["elements"]
+
+    def __len__(self):
+        total, _, _ = self._rows(0, 0)
+        return total
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            indexes = range(*index.indices(len(self)))
+            if not indexes:
+                return []
+            ascending = indexes if indexes.step > 0 else indexes[::-1]
+            rows = list(self.rows(ascending[0], ascending[-1] + 1, ascending.step))  # only the rows picked
+            return rows if indexes.step > 0 else rows[::-1]
+        position = index + len(self) if index < 0 else index
+        if position < 0:
+            raise IndexError(f"{self.alias} index {index} out of range")
+        _, rows, _ = self._rows(position, 1)
+        if not rows:
+            raise IndexError(f"{self.alias} index {index} out of range")
+        return rows[0]
+
+    def __iter__(self):
+        return self.rows()
+
+    def rows(self, start=0, stop=None, step=1):
+        """
+        Stream rows a batch at a time
+        :param start: first index
+        :param stop: optional index to stop before
+        :param step: read every step-th row, only those are fetched
+        """
+        index = start
+        while stop is None or index < stop:
+            count = self.batch_size if stop is None else min(self.batch_size, -(-(stop - index) // step))
+            total, rows, _ = self._rows(index, count, step=step)
+            yield from rows
+            index += len(rows) * step
+            if len(rows) < count or index >= total:
+                return
+
+    def elements(self, start=0, stop=None):
+        """
+        WebElements for a range of rows, fetched in one call
+        :return: list of WebElement
+        """
+        stop = len(self) if stop is None else stop
+        _, _, elements = self._rows(start, stop - start, elements=True)
+        return elements
+
+    def element(self, index):
+        elements = self.elements(index, index + 1)
+        if not elements:
+            raise IndexError(f"{self.alias} index {index} out of range")
+        return elements[0]
+
+    def find(self, text, timeout=0):
+        """
+        The first row whose text contains text, searched inside the page in one call
+        :param timeout: seconds to keep looking for, while the list fills in
+        :return: (index, WebElement) or None
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._page.recorder.scope(self._page._page, self.alias):
+                found = self._page.driver.execute_script(COLLECTION_FIND, self.by, self.value, text)
+            if found or time.monotonic() >= deadline:
+                return tuple(found) if found else None
+            time.sleep(POLL_FREQUENCY)
+
+    def stream(self, key=None, settle=0.2, max_idle=3):
+        """
+        Stream the rows of a virtualized list, which only renders the rows near the viewport: read what is
+        rendered, scroll the last row into view so the list renders more, and repeat until scrolling stops
+        producing new rows. Rows are told apart by the key attribute, or by their text. Indexes are the order seen.
+        :param key: attribute that identifies a row, such as "data-id"; it is read along with the attributes
+        :param settle: seconds to give the list to render after each scroll
+        :param max_idle: give up after this many scrolls in a row without new rows
+        """
+        attributes = self.attributes + [key] if key and key not in self.attributes else self.attributes
+        seen = set()
+        idle = 0
+        while idle < max_idle:
+            _, rows, _ = self._rows(0, STREAM_WINDOW, scroll=True, attributes=attributes)
+            new = 0
+            for row in rows:
+                identity = dict(row.attributes).get(key) if key else row.text
+                if identity in seen:
+                    continue
+                seen.add(identity)
+                new += 1
+                yield row._replace(index=len(seen) - 1)
+            idle = 0 if new else idle + 1
+            if idle < max_idle:  # no point waiting for a render we won't read
+                time.sleep(settle)
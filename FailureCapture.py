@@ -0,0 +1,95 @@
+# Writes the evidence of failed tests: a screenshot, the page source and the url. Grabbing them from the browser
+# has to happen on the test's thread while the page is still in its failed state, but the compression and disk
+# writes are handed to a background thread through a bounded queue, so failing tests don't wait on I/O.
+# Screenshots and page sources are stored gzipped under the sha256 of their content, so the same failure seen by
+# many tests (or many parallel workers) is only stored once. The hashing stays on the test's thread, it takes well
+# under a millisecond and gives the paths that submit returns. Each failure gets a small json report pointing at them.
+#
+#   <root>/blobs/<sha256>.png.gz    <root>/blobs/<sha256>.html.gz    <root>/<test id>.json
+import os
+import re
+import gzip
+import json
+import queue
+import atexit
+import hashlib
+import datetime
+import threading
+
+MAX_PENDING = 16  # captures waiting to be written, beyond this the failing test waits for the writer
+
+
+class FailureWriter(object):
+    """
+    Background writer for failure captures
+    """
+    def __init__(self, root, max_pending=MAX_PENDING):
+        """
+        :param root: folder to write to, created when first needed
+        :param max_pending: bound on the write queue
+        """
+        self.root = root
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _blob(self, content, suffix):
+        return os.path.join(self.root, "blobs", f"{hashlib.sha256(content).hexdigest()}{suffix}.gz")
+
+    def submit(self, test_id, message, url, png, html, log=()):
+        """
+        Queue a failure capture for writing
+        :param test_id: the unittest id of the failing test
+        :param message: what went wrong
+        :param url: the page url
+        :param png: screenshot bytes
+        :param html: page source
+        :param log: the test's log lines
+        :return: (screenshot path, page source path, report path) where the files will be written
+        """
+        html = html.encode("utf-8")
+        screenshot = self._blob(png, ".png")
+        dom = self._blob(html, ".html")
+        report = os.path.join(self.root, re.sub(r"[^\w.-]", "_", test_id) + ".json")
+        record = {"test": test_id, "message": message, "url": url, "screenshot": screenshot, "dom": dom,
+                  "log": list(log), "time": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")}
+        self._start()
+        self._queue.put(((screenshot, png), (dom, html), (report, record)))
+        return screenshot, dom, report
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(name="failure_writer", target=self._run, daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            blobs = self._queue.get()
+            try:
+                self._write(*blobs)
+            except OSError as ex:
+                from TestBase import Logger  # TestBase imports this module, so not at the top
+                Logger("CAP").warning("Failure capture not written: %s", ex)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, screenshot, dom, report):
+        for path, content in (screenshot, dom):
+            if not os.path.exists(path):  # content addressed, so an existing file is already the same
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with gzip.open(temp, "wb") as f:
+                    f.write(content)
+                os.replace(temp, path)
+        path, record = report
+        with open(path, "w") as f:
+            json.dump(record, f, indent=1)
+
+    def flush(self):
+        """
+        Wait until everything queued so far is written
+        """
+        if self._thread is not None:
+            self._queue.join()
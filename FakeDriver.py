@@ -0,0 +1,1029 @@
+# A pure Python stand in for a browser, for running page objects without Firefox.
+#
+# FakeDriver parses the served html into a small DOM and answers the WebDriver commands that the page objects
+# use, through the same execute(command, params) entry point as a real RemoteWebDriver, so real selenium
+# WebElements, waits, ActionChains and the Instrumentation command counts all work against it unchanged.
+# There is no JavaScript engine:
+#  * execute_script() does nothing and returns None, except for the scripts the page objects inject (see
+#    PageScripts) which have Python emulations registered with FakeDriver.emulate()
+#  * clicks follow links, submit and reset forms, and run the click_handlers, which by default understand the
+#    little check() functions the demo fixture pages use to move from page to page
+# It is good for checking page object logic and flows quickly, not for checking how a real browser behaves.
+# FakeWebDriverServer puts FakeDrivers behind the W3C WebDriver HTTP protocol, for clients that talk to a
+# WebDriver endpoint themselves, such as AsyncPageFactory.AsyncWebDriver.
+import os
+import re
+import base64
+import json
+import socket
+import itertools
+import threading
+import urllib.parse
+import urllib.request
+from html.parser import HTMLParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.remote.command import Command
+from selenium.webdriver.remote.webelement import WebElement
+from selenium.common.exceptions import (NoSuchElementException, StaleElementReferenceException,
+                                        InvalidSelectorException, NoSuchWindowException, WebDriverException)
+from selenium.webdriver.remote import webelement as _webelement
+
+from PageScripts import (LOCATOR_STATES, ACTIVATE_ELEMENT, WAIT_FOR, FILL_FIELDS, SNAPSHOT, COLLECTION_ROWS,
+                         COLLECTION_FIND, SETTLE_STATE, READ_STORAGE, WRITE_STORAGE)
+from SessionPool import RESET_STORAGE_SCRIPT
+
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track",
+             "wbr"}
+VALUE_TAGS = {"input", "textarea", "select", "button", "option"}
+ELEMENT_KEY = "element-6066-11e4-a52e-4f735466cecf"  # how the W3C protocol marks an element reference
+NOT_RENDERED = {"head", "title", "script", "style", "meta", "link", "template", "noscript"}
+# a 1x1 transparent png, what you get from a screenshot
+PLACEHOLDER_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg==")
+
+
+class Node(object):
+    """
+    An element in the fake DOM, the document itself is a Node with tag "#document"
+    """
+    def __init__(self, tag, attrs=None, parent=None):
+        self.tag = tag
+        self.attrs = dict(attrs or {})
+        self.parent = parent
+        self.children = []  # Nodes and str text
+        self.value = self.attrs.get("value", "")
+
+    def elements(self):
+        return [child for child in self.children if isinstance(child, Node)]
+
+    def descendants(self):
+        for child in self.elements():
+            yield child
+            yield from child.descendants()
+
+    def ancestors(self):
+        node = self.parent
+        while node is not None:
+            yield node
+            node = node.parent
+
+    def text_content(self):
+        return "".join(child if isinstance(child, str) else child.text_content() for child in self.children)
+
+    def first_text(self):
+        for child in self.children:
+            if isinstance(child, str):
+                return child
+        return None
+
+    def form(self):
+        return next((node for node in self.ancestors() if node.tag == "form"), None)
+
+    def is_displayed(self):
+        for node in itertools.chain([self], self.ancestors()):
+            if node.tag in NOT_RENDERED or "hidden" in node.attrs:
+                return False
+            style = node.attrs.get("style", "").replace(" ", "").lower()
+            if "display:none" in style or (node is self and "visibility:hidden" in style):
+                return False
+        return not (self.tag == "input" and self.attrs.get("type", "").lower() == "hidden")
+
+    def is_enabled(self):
+        return not any("disabled" in node.attrs for node in itertools.chain([self], self.ancestors())
+                       if node.tag in ("input", "button", "select", "textarea", "option", "fieldset"))
+
+    def visible_text(self):
+        if not self.is_displayed():
+            return ""
+        parts = []
+        for child in self.children:
+            if isinstance(child, str):
+                parts.append(child)
+            elif child.tag == "br":
+                parts.append("\n")
+            elif child.is_displayed():
+                parts.append(child.visible_text())
+        lines = (" ".join(line.split()) for line in "".join(parts).split("\n"))
+        return "\n".join(line for line in lines if line)
+
+    def __repr__(self):
+        return f"<{self.tag} {self.attrs}>"
+
+
+class _DomBuilder(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.document = Node("#document")
+        self._open = [self.document]
+
+    def handle_starttag(self, tag, attrs):
+        node = Node(tag, {name: ("" if value is None else value) for name, value in attrs}, self._open[-1])
+        self._open[-1].children.append(node)
+        if tag not in VOID_TAGS:
+            self._open.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self._open.pop()
+
+    def handle_endtag(self, tag):
+        # be lenient with badly nested html: close everything up to the matching open tag, if there is one
+        for i in range(len(self._open) - 1, 0, -1):
+            if self._open[i].tag == tag:
+                del self._open[i:]
+                return
+
+    def handle_data(self, data):
+        self._open[-1].children.append(data)
+
+
+def parse_html(html):
+    builder = _DomBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder.document
+
+
+# --- a small XPath 1.0 subset: location paths with / // .. . * and predicates using @attr, text(), ., numbers,
+# strings, = != and or, contains() starts-with() normalize-space() not() string() position() last()
+
+_XPATH_TOKEN = re.compile(r"""\s*(?:(//|/|\.\.|\.|@|\[|\]|\(|\)|,|!=|=|\*)|("[^"]*"|'[^']*')|(\d+(?:\.\d+)?)"""
+                          r"""|([A-Za-z_][\w\-.:]*))""")
+
+
+def _tokenize(expression):
+    tokens, pos = [], 0
+    expression = expression.strip()
+    while pos < len(expression):
+        match = _XPATH_TOKEN.match(expression, pos)
+        if not match or match.end() == pos:
+            raise InvalidSelectorException(f"Unsupported xpath: {expression}")
+        symbol, string, number, name = match.groups()
+        if symbol:
+            tokens.append(("sym", symbol))
+        elif string:
+            tokens.append(("str", string[1:-1]))
+        elif number:
+            tokens.append(("num", float(number)))
+        else:
+            tokens.append(("name", name))
+        pos = match.end()
+    return tokens
+
+
+def _string(value):
+    if value is None:
+        return ""
+    if isinstance(value, Node):
+        return value.text_content()
+    if isinstance(value, float):
+        return str(int(value)) if value == int(value) else str(value)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
+
+
+class _XPath(object):
+    def __init__(self, expression):
+        self.expression = expression
+        self.tokens = _tokenize(expression)
+        self.pos = 0
+        self.absolute, self.steps = self._path()
+        if self.pos != len(self.tokens):
+            raise InvalidSelectorException(f"Unsupported xpath: {expression}")
+
+    def _peek(self, kind=None, value=None):
+        if self.pos >= len(self.tokens):
+            return None
+        token = self.tokens[self.pos]
+        if (kind and token[0] != kind) or (value is not None and token[1] != value):
+            return None
+        return token
+
+    def _take(self, kind=None, value=None):
+        token = self._peek(kind, value)
+        if token is None:
+            raise InvalidSelectorException(f"Unsupported xpath: {self.expression}")
+        self.pos += 1
+        return token
+
+    def _path(self):
+        absolute = bool(self._peek("sym", "/") or self._peek("sym", "//"))
+        steps = []
+        axis = "child"
+        while True:
+            if self._peek("sym", "//"):
+                self._take()
+                axis = "descendant"
+            elif self._peek("sym", "/"):
+                self._take()
+                axis = "child"
+            if self._peek("sym", ".."):
+                self._take()
+                steps.append(("parent", None, []))
+            elif self._peek("sym", "."):
+                self._take()
+                steps.append(("self", None, []))
+            else:
+                name = self._take("sym", "*")[1] if self._peek("sym", "*") else self._take("name")[1]
+                predicates = []
+                while self._peek("sym", "["):
+                    self._take()
+                    predicates.append(self._or())
+                    self._take("sym", "]")
+                steps.append((axis, name.lower(), predicates))
+            axis = "child"
+            if not (self._peek("sym", "/") or self._peek("sym", "//")):
+                return absolute, steps
+
+    def _or(self):
+        left = self._and()
+        while self._peek("name", "or"):
+            self._take()
+            left = (lambda a, b: lambda n, p, s: bool(a(n, p, s)) or bool(b(n, p, s)))(left, self._and())
+        return left
+
+    def _and(self):
+        left = self._compare()
+        while self._peek("name", "and"):
+            self._take()
+            left = (lambda a, b: lambda n, p, s: bool(a(n, p, s)) and bool(b(n, p, s)))(left, self._compare())
+        return left
+
+    def _compare(self):
+        left = self._value()
+        for op in ("=", "!="):
+            if self._peek("sym", op):
+                self._take()
+                right = self._value()
+                equal = (lambda a, b: lambda n, p, s: self._equals(a(n, p, s), b(n, p, s)))(left, right)
+                return equal if op == "=" else (lambda f: lambda n, p, s: not f(n, p, s))(equal)
+        return left
+
+    @staticmethod
+    def _equals(a, b):
+        if a is None or b is None:
+            return False
+        if isinstance(a, float) or isinstance(b, float):
+            try:
+                return float(_string(a)) == float(_string(b))
+            except ValueError:
+                return False
+        return _string(a) == _string(b)
+
+    def _value(self):
+        if self._peek("str"):
+            value = self._take()[1]
+            return lambda n, p, s: value
+        if self._peek("num"):
+            value = self._take()[1]
+            return lambda n, p, s: value
+        if self._peek("sym", "@"):
+            self._take()
+            name = self._take("name")[1].lower()
+            return lambda n, p, s: n.attrs.get(name)
+        if self._peek("sym", "."):
+            self._take()
+            return lambda n, p, s: n.text_content()
+        if self._peek("sym", "("):
+            self._take()
+            inner = self._or()
+            self._take("sym", ")")
+            return inner
+        name = self._take("name")[1]
+        self._take("sym", "(")
+        args = []
+        while not self._peek("sym", ")"):
+            args.append(self._or())
+            if self._peek("sym", ","):
+                self._take()
+        self._take("sym", ")")
+        return self._function(name, args)
+
+    def _function(self, name, args):
+        def arg(i, n, p, s):
+            return _string(args[i](n, p, s)) if i < len(args) else n.text_content()
+        if name == "text":
+            return lambda n, p, s: n.first_text()
+        if name == "contains":
+            return lambda n, p, s: arg(1, n, p, s) in arg(0, n, p, s)
+        if name == "starts-with":
+            return lambda n, p, s: arg(0, n, p, s).startswith(arg(1, n, p, s))
+        if name == "normalize-space":
+            return lambda n, p, s: " ".join(arg(0, n, p, s).split())
+        if name == "string":
+            return lambda n, p, s: arg(0, n, p, s)
+        if name == "not":
+            return lambda n, p, s: not args[0](n, p, s)
+        if name == "position":
+            return lambda n, p, s: float(p)
+        if name == "last":
+            return lambda n, p, s: float(s)
+        raise InvalidSelectorException(f"Unsupported xpath function {name}() in {self.expression}")
+
+    def select(self, context):
+        nodes = [context]
+        if self.absolute:
+            while nodes[0].parent is not None:
+                nodes = [nodes[0].parent]
+        for axis, name, predicates in self.steps:
+            found = []
+            for node in nodes:
+                if axis == "parent":
+                    candidates = [node.parent] if node.parent is not None else []
+                elif axis == "self":
+                    candidates = [node]
+                else:
+                    pool = node.elements() if axis == "child" else node.descendants()
+                    candidates = [child for child in pool if name == "*" or child.tag == name]
+                for predicate in predicates:
+                    size = len(candidates)
+                    kept = []
+                    for position, candidate in enumerate(candidates, 1):
+                        result = predicate(candidate, position, size)
+                        if (result == position) if isinstance(result, float) else result:
+                            kept.append(candidate)
+                    candidates = kept
+                for candidate in candidates:
+                    if not any(candidate is seen for seen in found):
+                        found.append(candidate)
+            nodes = found
+        return nodes
+
+
+# --- and a CSS subset: tag, #id, .class, [attr], [attr="value"], and descendant combinators
+
+_CSS_PART = re.compile(r"""([\w\-]+|\*)|#([\w\-]+)|\.([\w\-]+)|\[\s*([\w\-]+)\s*(?:([~^$*|]?=)\s*("[^"]*"|'[^']*'|[^\]\s]+))?\s*\]""")
+
+
+def _css_compound(selector):
+    tests, pos = [], 0
+    while pos < len(selector):
+        match = _CSS_PART.match(selector, pos)
+        if not match:
+            raise InvalidSelectorException(f"Unsupported css selector: {selector}")
+        tag, ident, cls, attr, op, value = match.groups()
+        if tag:
+            tests.append(lambda n, t=tag.lower(): t == "*" or n.tag == t)
+        elif ident:
+            tests.append(lambda n, v=ident: n.attrs.get("id") == v)
+        elif cls:
+            tests.append(lambda n, v=cls: v in n.attrs.get("class", "").split())
+        else:
+            if value and value[0] in "\"'":
+                value = value[1:-1]
+            tests.append(lambda n, a=attr.lower(), o=op, v=value: _css_attr(n.attrs.get(a), o, v))
+        pos = match.end()
+    return lambda node: all(test(node) for test in tests)
+
+
+def _css_attr(actual, op, value):
+    if actual is None:
+        return False
+    if op is None:
+        return True
+    return {"=": actual == value, "~=": value in actual.split(), "^=": actual.startswith(value),
+            "$=": actual.endswith(value), "*=": value in actual,
+            "|=": actual == value or actual.startswith(value + "-")}[op]
+
+
+def css_select(selector, context):
+    found = []
+    for alternative in selector.split(","):
+        compounds = [_css_compound(part) for part in alternative.split()]
+        for node in context.descendants():
+            if not compounds[-1](node):
+                continue
+            ancestors = list(node.ancestors())
+            remaining = compounds[:-1]
+            for ancestor in ancestors:
+                if remaining and remaining[-1](ancestor):
+                    remaining = remaining[:-1]
+            if not remaining and not any(node is seen for seen in found):
+                found.append(node)
+    return found
+
+
+def find_nodes(using, value, context):
+    """
+    :param using: selenium locator strategy (By.ID, By.XPATH, ...)
+    :param value: the selector
+    :param context: the Node to search under
+    :return: matching Nodes in document order
+    """
+    if using == By.XPATH:
+        return _XPath(value).select(context)
+    if using == By.CSS_SELECTOR:
+        return css_select(value, context)
+    if using == By.ID:
+        return [node for node in context.descendants() if node.attrs.get("id") == value]
+    if using == By.NAME:
+        return [node for node in context.descendants() if node.attrs.get("name") == value]
+    if using == By.CLASS_NAME:
+        return [node for node in context.descendants() if value in node.attrs.get("class", "").split()]
+    if using == By.TAG_NAME:
+        return [node for node in context.descendants() if node.tag == value.lower()]
+    if using in (By.LINK_TEXT, By.PARTIAL_LINK_TEXT):
+        links = [node for node in context.descendants() if node.tag == "a"]
+        if using == By.LINK_TEXT:
+            return [node for node in links if node.visible_text() == value]
+        return [node for node in links if value in node.visible_text()]
+    raise InvalidSelectorException(f"Unsupported locator strategy: {using}")
+
+
+def demo_check_handler(driver, node):
+    """
+    Click handler for the fixture pages, whose buttons call a javascript check() function that optionally
+    compares one form field with a constant and then sets window.location, else raises an alert.
+    :return: True if the click was handled
+    """
+    call = re.match(r"\s*(\w+)\s*\(", node.attrs.get("onclick", ""))
+    if not call:
+        return False
+    scripts = "\n".join(script.text_content() for script in find_nodes(By.TAG_NAME, "script", driver.document))
+    body = re.search(r"function\s+" + call.group(1) + r"\s*\([^)]*\)[^{]*\{(.*?)\n\}", scripts, re.S)
+    if not body:
+        return False
+    body = body.group(1)
+    target = re.search(r"""window\.location\s*=\s*['"]([^'"]+)['"]""", body)
+    condition = re.search(r"""if\s*\(\s*form\.(\w+)\.value\s*==\s*['"]([^'"]*)['"]\s*\)""", body)
+    if condition:
+        form = node.form()
+        fields = [field for field in (form.descendants() if form else []) if field.attrs.get("name") ==
+                  condition.group(1)]
+        if not fields or fields[0].value != condition.group(2):
+            alert = re.search(r"""alert\(\s*['"]([^'"]*)['"]""", body)
+            driver.alert_text = alert.group(1) if alert else ""
+            return True
+    if target:
+        driver.navigate(target.group(1))
+    return True
+
+
+class _SwitchTo(object):
+    def __init__(self, driver):
+        self._driver = driver
+
+    def window(self, handle):
+        self._driver.execute(Command.SWITCH_TO_WINDOW, {"handle": handle})
+
+
+class FakeDriver(object):
+    """
+    In memory WebDriver, see the notes at the top of this module
+    """
+    emulations = {}  # injected script text -> python function(driver, *args)
+    click_handlers = [demo_check_handler]  # callables(driver, node) -> True if they dealt with the click
+    _ids = itertools.count(1)
+
+    def __init__(self, local_root=None, local_hosts=("localhost", "127.0.0.1")):
+        """
+        :param local_root: optional folder to serve urls on local_hosts from, without a web server
+        :param local_hosts: host names that local_root stands in for
+        """
+        self.local_root = local_root
+        self.local_hosts = local_hosts
+        self.session_id = f"fake-{next(self._ids)}"
+        self.capabilities = {"browserName": "fake"}
+        self.w3c = True
+        self._is_remote = False
+        self.switch_to = _SwitchTo(self)
+        self._sites = {}  # origin -> (cookies, local storage, session storage), like a browser keeps sites apart
+        self.alert_text = None
+        self._windows = {"window-1": None}  # handle -> saved page state of the windows in the background
+        self._handle = "window-1"
+        self._load("about:blank", "")
+
+    # --- per origin state
+
+    def _site(self):
+        parts = urllib.parse.urlsplit(self.current_url)
+        return self._sites.setdefault(f"{parts.scheme}://{parts.netloc}", ({}, {}, {}))
+
+    @property
+    def cookies(self):
+        return self._site()[0]
+
+    @property
+    def local_storage(self):
+        return self._site()[1]
+
+    @property
+    def session_storage(self):
+        return self._site()[2]
+
+    # --- page loading
+
+    def _load(self, url, html):
+        self.current_url = url
+        self.page_source = html
+        self.document = parse_html(html)
+        self._nodes = {}  # element id -> Node, rebuilt per document so old elements go stale
+
+    def navigate(self, url):
+        url = urllib.parse.urljoin(self.current_url, url)
+        if url == "about:blank":
+            self._load(url, "")
+            return
+        self._load(url, self._fetch(url))
+
+    def _fetch(self, url):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme == "file" or (self.local_root and parts.hostname in self.local_hosts):
+            if parts.scheme == "file":
+                path = urllib.request.url2pathname(parts.path)
+            else:
+                path = os.path.join(self.local_root, urllib.parse.unquote(parts.path).lstrip("/") or "index.html")
+            try:
+                with open(path, encoding="utf-8") as f:
+                    return f.read()
+            except OSError:
+                return "<html><head><title>404 Not Found</title></head><body>Not Found</body></html>"
+        with urllib.request.urlopen(url) as response:
+            return response.read().decode(response.headers.get_content_charset() or "utf-8", "replace")
+
+    # --- element references
+
+    def _element(self, node):
+        for element_id, known in self._nodes.items():
+            if known is node:
+                return WebElement(self, element_id)
+        element_id = f"fake-element-{next(self._ids)}"
+        self._nodes[element_id] = node
+        return WebElement(self, element_id)
+
+    def _node(self, element_id):
+        node = self._nodes.get(element_id)
+        if node is None:
+            raise StaleElementReferenceException(f"Element {element_id} is not part of the current document")
+        return node
+
+    def _unwrap(self, value):
+        if isinstance(value, WebElement):
+            return self._node(value.id)
+        if isinstance(value, dict):
+            element_id = value.get(ELEMENT_KEY, value.get("ELEMENT"))
+            if element_id:
+                return self._node(element_id)
+            return {key: self._unwrap(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._unwrap(item) for item in value]
+        return value
+
+    def _wrap(self, value):
+        if isinstance(value, Node):
+            return self._element(value)
+        if isinstance(value, (list, tuple)):
+            return [self._wrap(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self._wrap(item) for key, item in value.items()}
+        return value
+
+    # --- the WebDriver protocol
+
+    def execute(self, driver_command, params=None):
+        params = params or {}
+        handler = self._commands.get(driver_command)
+        value = handler(self, params) if handler else None
+        return {"value": self._wrap(value), "sessionId": self.session_id, "status": 0}
+
+    def _find(self, params, context=None, many=False):
+        nodes = find_nodes(params["using"], params["value"], context or self.document)
+        if many:
+            return nodes
+        if not nodes:
+            raise NoSuchElementException(f"Unable to locate element: {params['using']}={params['value']}")
+        return nodes[0]
+
+    def _click(self, node):
+        if not node.is_enabled():
+            return
+        for handler in self.click_handlers:
+            if handler(self, node):
+                return
+        kind = node.attrs.get("type", "").lower()
+        if node.tag == "a" and "href" in node.attrs:
+            self.navigate(node.attrs["href"])
+        elif node.tag == "input" and kind in ("checkbox", "radio"):
+            node.attrs["checked"] = "" if "checked" not in node.attrs else node.attrs.pop("checked")
+            if "checked" in node.attrs and kind == "radio":
+                self._uncheck_radio_group(node)
+        elif kind == "reset" and node.form():
+            for field in node.form().descendants():
+                field.value = field.attrs.get("value", "")
+        elif (node.tag == "button" and kind in ("", "submit")) or (node.tag == "input" and kind == "submit"):
+            if node.form():
+                self._submit(node.form())
+
+    def _uncheck_radio_group(self, node):
+        for other in self.document.descendants():
+            if other is not node and other.attrs.get("type") == "radio" and \
+                    other.attrs.get("name") == node.attrs.get("name"):
+                other.attrs.pop("checked", None)
+
+    def _submit(self, form):
+        fields = [(field.attrs["name"], field.value) for field in form.descendants()
+                  if field.tag in ("input", "textarea", "select") and "name" in field.attrs and field.is_enabled()
+                  and field.attrs.get("type", "").lower() not in ("button", "submit", "reset")]
+        action = urllib.parse.urljoin(self.current_url, form.attrs.get("action", ""))
+        self.navigate(action.split("?")[0] + "?" + urllib.parse.urlencode(fields))
+
+    def _send_keys(self, node, params):
+        text = params.get("text")
+        if text is None:
+            text = "".join(params.get("value", []))
+        for char in text:
+            if char in (Keys.ENTER, Keys.RETURN):
+                if node.form():
+                    self._submit(node.form())
+                    return
+            elif char == Keys.BACKSPACE:
+                node.value = node.value[:-1]
+            elif not Keys.NULL <= char <= "\uf8ff":  # other special keys are ignored
+                node.value += char
+
+    def _script(self, params):
+        script = params["script"]
+        args = self._unwrap(params.get("args", []))
+        emulation = self.emulations.get(script)
+        if emulation:
+            return emulation(self, *args)
+        if "isDisplayed" in script or script == _atom("isDisplayed_js"):
+            return args[0].is_displayed()
+        if "getAttribute" in script or script == _atom("getAttribute_js"):
+            return self._attribute(*args)
+        return None  # no javascript engine, so anything else is a no-op
+
+    def _attribute(self, node, name):
+        name = name.lower()
+        if name == "value":
+            return node.value
+        if name in node.attrs:
+            value = node.attrs[name]
+            return "true" if value == "" and name in ("checked", "disabled", "selected", "readonly",
+                                                        "required", "hidden", "multiple") else value
+        return None
+
+    def _close(self, params):
+        # like a real browser, after closing the current window you must switch to another one
+        self._windows.pop(self._handle, None)
+        self._load("about:blank", "")
+
+    def _switch(self, params):
+        handle = params.get("handle", params.get("name"))
+        if handle not in self._windows:
+            raise NoSuchWindowException(f"No window {handle}")
+        if handle == self._handle:
+            return
+        if self._handle in self._windows:
+            self._windows[self._handle] = (self.current_url, self.page_source, self.document, self._nodes)
+        saved = self._windows[handle]
+        self._handle = handle
+        if saved is None:
+            self._load("about:blank", "")
+        else:
+            self.current_url, self.page_source, self.document, self._nodes = saved
+
+    def _new_window(self, params):
+        handle = f"window-{next(self._ids)}"
+        self._windows[handle] = None
+        return {"handle": handle, "type": "tab"}
+
+    _commands = {
+        Command.GET: lambda self, p: self.navigate(p["url"]),
+        Command.GET_TITLE: lambda self, p: next((n.text_content().strip() for n in self.document.descendants()
+                                                  if n.tag == "title"), ""),
+        Command.GET_CURRENT_URL: lambda self, p: self.current_url,
+        Command.GET_PAGE_SOURCE: lambda self, p: self.page_source,
+        Command.REFRESH: lambda self, p: self.navigate(self.current_url),
+        Command.FIND_ELEMENT: lambda self, p: self._find(p),
+        Command.FIND_ELEMENTS: lambda self, p: self._find(p, many=True),
+        Command.FIND_CHILD_ELEMENT: lambda self, p: self._find(p, self._node(p["id"])),
+        Command.FIND_CHILD_ELEMENTS: lambda self, p: self._find(p, self._node(p["id"]), many=True),
+        Command.CLICK_ELEMENT: lambda self, p: self._click(self._node(p["id"])),
+        Command.CLEAR_ELEMENT: lambda self, p: setattr(self._node(p["id"]), "value", ""),
+        Command.SEND_KEYS_TO_ELEMENT: lambda self, p: self._send_keys(self._node(p["id"]), p),
+        Command.GET_ELEMENT_TEXT: lambda self, p: self._node(p["id"]).visible_text(),
+        Command.GET_ELEMENT_TAG_NAME: lambda self, p: self._node(p["id"]).tag,
+        Command.GET_ELEMENT_ATTRIBUTE: lambda self, p: self._attribute(self._node(p["id"]), p["name"]),
+        Command.GET_ELEMENT_PROPERTY: lambda self, p: self._attribute(self._node(p["id"]), p["name"]),
+        Command.IS_ELEMENT_ENABLED: lambda self, p: self._node(p["id"]).is_enabled(),
+        Command.IS_ELEMENT_SELECTED: lambda self, p: "checked" in self._node(p["id"]).attrs or
+                                                     "selected" in self._node(p["id"]).attrs,
+        Command.W3C_EXECUTE_SCRIPT: lambda self, p: self._script(p),
+        Command.W3C_EXECUTE_SCRIPT_ASYNC: lambda self, p: self._script(p),
+        Command.SCREENSHOT: lambda self, p: base64.b64encode(PLACEHOLDER_PNG).decode("ascii"),
+        Command.ELEMENT_SCREENSHOT: lambda self, p: base64.b64encode(PLACEHOLDER_PNG).decode("ascii"),
+        Command.GET_ALL_COOKIES: lambda self, p: list(self.cookies.values()),
+        Command.ADD_COOKIE: lambda self, p: self.cookies.__setitem__(p["cookie"]["name"], dict(p["cookie"])),
+        Command.DELETE_COOKIE: lambda self, p: self.cookies.pop(p["name"], None),
+        Command.DELETE_ALL_COOKIES: lambda self, p: self.cookies.clear(),
+        Command.W3C_GET_CURRENT_WINDOW_HANDLE: lambda self, p: self._handle,
+        Command.W3C_GET_WINDOW_HANDLES: lambda self, p: list(self._windows),
+        Command.SWITCH_TO_WINDOW: lambda self, p: self._switch(p),
+        Command.CLOSE: lambda self, p: self._close(p),
+        Command.W3C_ACCEPT_ALERT: lambda self, p: setattr(self, "alert_text", None),
+        Command.W3C_DISMISS_ALERT: lambda self, p: setattr(self, "alert_text", None),
+        Command.W3C_GET_ALERT_TEXT: lambda self, p: self.alert_text,
+    }
+    if hasattr(Command, "NEW_WINDOW"):  # selenium 4
+        _commands[Command.NEW_WINDOW] = lambda self, p: self._new_window(p)
+    if hasattr(Command, "IS_ELEMENT_DISPLAYED"):  # selenium 3
+        _commands[Command.IS_ELEMENT_DISPLAYED] = lambda self, p: self._node(p["id"]).is_displayed()
+
+    # --- the bits of the RemoteWebDriver api that page objects and tests call directly
+
+    def get(self, url):
+        self.execute(Command.GET, {"url": url})
+
+    @property
+    def title(self):
+        return self.execute(Command.GET_TITLE)["value"]
+
+    def find_element(self, by=By.ID, value=None):
+        return self.execute(Command.FIND_ELEMENT, {"using": by, "value": value})["value"]
+
+    def find_elements(self, by=By.ID, value=None):
+        return self.execute(Command.FIND_ELEMENTS, {"using": by, "value": value})["value"]
+
+    def execute_script(self, script, *args):
+        return self.execute(Command.W3C_EXECUTE_SCRIPT, {"script": script, "args": list(args)})["value"]
+
+    def execute_async_script(self, script, *args):
+        return self.execute(Command.W3C_EXECUTE_SCRIPT_ASYNC, {"script": script, "args": list(args)})["value"]
+
+    def get_screenshot_as_base64(self):
+        return self.execute(Command.SCREENSHOT)["value"]
+
+    def get_screenshot_as_png(self):
+        return base64.b64decode(self.get_screenshot_as_base64())
+
+    def get_screenshot_as_file(self, filename):
+        with open(filename, "wb") as f:
+            f.write(self.get_screenshot_as_png())
+        return True
+
+    save_screenshot = get_screenshot_as_file
+
+    def get_cookies(self):
+        return self.execute(Command.GET_ALL_COOKIES)["value"]
+
+    def add_cookie(self, cookie_dict):
+        self.execute(Command.ADD_COOKIE, {"cookie": cookie_dict})
+
+    def delete_all_cookies(self):
+        self.execute(Command.DELETE_ALL_COOKIES)
+
+    @property
+    def window_handles(self):
+        return self.execute(Command.W3C_GET_WINDOW_HANDLES)["value"]
+
+    @property
+    def current_window_handle(self):
+        return self.execute(Command.W3C_GET_CURRENT_WINDOW_HANDLE)["value"]
+
+    def close(self):
+        self.execute(Command.CLOSE)
+
+    def quit(self):
+        self._windows = {}
+
+    def refresh(self):
+        self.execute(Command.REFRESH)
+
+    def set_script_timeout(self, time_to_wait):
+        pass
+
+    def implicitly_wait(self, time_to_wait):
+        pass
+
+    def set_window_position(self, x, y, windowHandle="current"):
+        pass
+
+    @classmethod
+    def emulate(cls, script):
+        """
+        Decorator registering a Python stand in for an injected script
+        :param script: the exact script text the page objects pass to execute_script
+        """
+        def deco(func):
+            cls.emulations[script] = func
+            return func
+        return deco
+
+
+def _atom(name):
+    # selenium loads its getAttribute and isDisplayed javascript atoms lazily
+    if getattr(_webelement, name, None) is None and hasattr(_webelement, "_load_js"):
+        _webelement._load_js()
+    return getattr(_webelement, name, None)
+
+
+@FakeDriver.emulate(LOCATOR_STATES)
+def _locator_states(driver, locators):
+    pending = []
+    for alias, by, value in locators:
+        found = find_nodes(by, value, driver.document)
+        if not found:
+            pending.append([alias, "missing"])
+        elif not found[0].is_displayed():
+            pending.append([alias, "hidden"])
+    return pending
+
+
+@FakeDriver.emulate(ACTIVATE_ELEMENT)
+def _activate_element(driver, by, value, border):
+    found = find_nodes(by, value, driver.document)
+    return found[0] if found and found[0].is_displayed() else None
+
+
+@FakeDriver.emulate(WAIT_FOR)
+def _wait_for(driver, kind, payload, timeout, interval):
+    # nothing changes the fake DOM while we wait, so the first answer is the final one
+    if kind == "settle":
+        return {"ok": True, "value": []}  # no network, no animations, and pages load all at once
+    if kind == "title":
+        title = driver.title
+        return {"ok": payload in title, "value": title}
+    if kind == "locators":
+        pending = _locator_states(driver, payload)
+        appeared = {alias: 0 for alias, _, _ in payload if alias not in {p[0] for p in pending}}
+        return {"ok": not pending, "value": {"pending": pending, "appeared": appeared}}
+    node = _activate_element(driver, *payload)
+    return {"ok": node is not None, "value": node}
+
+
+@FakeDriver.emulate(SETTLE_STATE)
+def _settle_state(driver):
+    return []
+
+
+@FakeDriver.emulate(FILL_FIELDS)
+def _fill_fields(driver, fields, border):
+    pending = []
+    for alias, by, value, text in fields:
+        found = find_nodes(by, value, driver.document)
+        if not found or not found[0].is_displayed():
+            pending.append([alias, "hidden" if found else "missing"])
+        elif found[0].attrs.get("type", "").lower() in ("checkbox", "radio"):
+            if text and text != "false":
+                found[0].attrs["checked"] = ""
+            else:
+                found[0].attrs.pop("checked", None)
+        else:
+            found[0].value = text
+    return pending
+
+
+@FakeDriver.emulate(SNAPSHOT)
+def _snapshot(driver, locators, names):
+    states = {}
+    for alias, by, value in locators:
+        found = find_nodes(by, value, driver.document)
+        if not found:
+            states[alias] = None
+            continue
+        node = found[0]
+        states[alias] = [node.visible_text(), node.value if node.tag in VALUE_TAGS else None,
+                         node.is_displayed(), node.is_enabled(), [node.attrs.get(name) for name in names]]
+    return states
+
+
+@FakeDriver.emulate(COLLECTION_ROWS)
+def _collection_rows(driver, by, value, start, count, names, elements, scroll, step):
+    # the fake DOM has no viewport, so every row is already "rendered" and scrolling does nothing
+    found = find_nodes(by, value, driver.document)
+    rows = found[start::step][:count]
+    return {"total": len(found),
+            "rows": [[node.visible_text(), [node.attrs.get(name) for name in names]] for node in rows],
+            "elements": rows if elements else None}
+
+
+@FakeDriver.emulate(COLLECTION_FIND)
+def _collection_find(driver, by, value, text):
+    for index, node in enumerate(find_nodes(by, value, driver.document)):
+        if text in node.text_content():
+            return [index, node]
+    return None
+
+
+@FakeDriver.emulate(READ_STORAGE)
+def _read_storage(driver):
+    return {"local": dict(driver.local_storage), "session": dict(driver.session_storage)}
+
+
+@FakeDriver.emulate(WRITE_STORAGE)
+def _write_storage(driver, local, session):
+    driver.local_storage.update(local)
+    driver.session_storage.update(session)
+
+
+@FakeDriver.emulate(RESET_STORAGE_SCRIPT)
+def _reset_storage(driver):
+    driver.local_storage.clear()
+    driver.session_storage.clear()
+
+
+# W3C error codes for the exceptions FakeDriver raises
+_W3C_ERRORS = [(NoSuchElementException, 404, "no such element"),
+               (StaleElementReferenceException, 404, "stale element reference"),
+               (NoSuchWindowException, 404, "no such window"),
+               (InvalidSelectorException, 400, "invalid selector")]
+
+
+class _W3CHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # headers and body go out as separate writes, without this every keep-alive reply waits on a delayed ack
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _route(self):
+        segments = self.path.rstrip("/").split("/")
+        for command, method, template in self.server.routes:
+            parts = template.rstrip("/").split("/")
+            if method != self.command or len(parts) != len(segments):
+                continue
+            params = {}
+            for part, segment in zip(parts, segments):
+                if part.startswith("$"):
+                    params[part[1:]] = urllib.parse.unquote(segment)
+                elif part != segment:
+                    break
+            else:
+                return command, params
+        return None, {}
+
+    def _reply(self, status, value):
+        body = json.dumps({"value": value}, default=lambda element: {ELEMENT_KEY: element.id}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json;charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+        command, params = self._route()
+        if command == Command.NEW_SESSION:
+            driver = FakeDriver(self.server.local_root)
+            self.server.sessions[driver.session_id] = (driver, threading.Lock())
+            return self._reply(200, {"sessionId": driver.session_id, "capabilities": {"browserName": "fake"}})
+        session = self.server.sessions.get(params.get("sessionId"))
+        if command is None or session is None:
+            return self._reply(404, {"error": "unknown command" if command is None else "invalid session id",
+                                     "message": self.path})
+        if command == Command.QUIT:
+            self.server.sessions.pop(params["sessionId"], None)
+            return self._reply(200, None)
+        driver, lock = session
+        body.update(params)
+        try:
+            with lock:
+                value = driver.execute(command, body)["value"]
+        except WebDriverException as ex:
+            status, error = next(((status, error) for kind, status, error in _W3C_ERRORS if isinstance(ex, kind)),
+                                 (500, "unknown error"))
+            return self._reply(status, {"error": error, "message": ex.msg or ""})
+        self._reply(200, value)
+
+    do_GET = do_POST = do_DELETE = _handle
+
+
+class _W3CServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # many sessions connect at once, the default backlog of 5 drops their connections
+
+
+class FakeWebDriverServer(object):
+    """
+    A W3C WebDriver endpoint whose sessions are FakeDrivers, running on a thread
+    """
+    def __init__(self, local_root=None):
+        """
+        :param local_root: passed to every FakeDriver, see FakeDriver
+        """
+        from AsyncPageFactory import W3C_ROUTES
+        self._server = _W3CServer(("localhost", 0), _W3CHandler)
+        # literal path segments win over $parameters, so /element/active is not taken for an element id
+        routes = [(command, method, template) for command, (method, template) in W3C_ROUTES.items()]
+        self._server.routes = sorted(routes, key=lambda route: route[2].count("$"))
+        self._server.sessions = {}
+        self._server.local_root = local_root
+        self._thread = threading.Thread(name="fake_webdriver", target=self._server.serve_forever,
+                                        kwargs={"poll_interval": 0.05}, daemon=True)
+        self._thread.start()
+        self.url = f"http://localhost:{self._server.server_address[1]}"
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
@@ -0,0 +1,31 @@
+# Small helpers shared by the modules that keep state on disk or report latencies.
+import os
+import json
+import threading
+
+
+def atomic_write_json(path, data, mode=0o666, **options):
+    """
+    Write json to a file whole: into a temporary file first, then renamed over it, so that readers, and parallel
+    workers writing the same file, never see half of one
+    :param path: the file, its folder is created when needed
+    :param mode: permissions of a new file, before the umask
+    :param options: passed on to json.dump, such as indent
+    :raises OSError: if it could not be written
+    """
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode), "w") as f:
+        json.dump(data, f, **options)
+    os.replace(temp, path)
+
+
+def percentile(ordered, fraction):
+    """
+    :param ordered: sorted samples, at least one
+    :param fraction: 0.5 for the median, 0.99 for the 99th percentile
+    :return: the sample at that rank
+    """
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
@@ -0,0 +1,160 @@
+# Accounting for the WebDriver commands a page object sends. Every command goes through driver.execute(), so
+# wrapping that one method lets us count commands by type and time them. Page objects push a scope (page class
+# and locator alias) while they work, so the cost lands on the locator that caused it. Time spent in waits, in
+# waiting for the page to settle and in fixed animation_delay sleeps is recorded as the pseudo commands "wait",
+# "settle" and "delay"; note that wait time includes the commands sent while polling. The most recent durations of
+# each pseudo command are also kept per locator, see samples(). With steps switched on, the time taken by each
+# page object operation (loading a page, getting or setting a locator) is kept as the pseudo command "step" too, for
+# load test latency reports (see LoadRunner). Commands sent to an element afterwards are not steps of their own.
+import time
+import threading
+import contextlib
+import collections
+
+WAIT = "wait"
+SETTLE = "settle"
+DELAY = "delay"
+STEP = "step"
+SAMPLES = 1000  # durations kept per (page, alias, pseudo command)
+
+
+class BudgetExceeded(AssertionError):
+    pass
+
+
+class CommandRecorder(object):
+    """
+    Counts and times WebDriver commands, keyed by (page class, locator alias, command)
+    """
+    def __init__(self, steps=False):
+        """
+        :param steps: also time every scope, as the STEP pseudo command
+        """
+        self.steps = steps
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.records = collections.defaultdict(lambda: [0, 0.0])  # (page, alias, command) -> [count, seconds]
+        self._samples = collections.defaultdict(lambda: collections.deque(maxlen=SAMPLES))
+        self.total_commands = 0
+        self.total_seconds = 0.0
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextlib.contextmanager
+    def scope(self, page, alias, step=True):
+        """
+        Attribute everything recorded inside the with block to a page and locator
+        :param page: page class name
+        :param alias: locator alias, or a made up name such as "<load>"
+        :param step: time the block as a STEP, unless it is inside another scope of the same page and locator
+        """
+        stack = self._stack()
+        start = time.perf_counter() if self.steps and step and (page, alias) not in stack else None
+        stack.append((page, alias))
+        try:
+            yield
+        finally:
+            if start is not None:
+                self._add(STEP, time.perf_counter() - start, command=False)
+            stack.pop()
+
+    @contextlib.contextmanager
+    def timing(self, kind):
+        """
+        Time the with block as a pseudo command, WAIT, SETTLE or DELAY
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(kind, time.perf_counter() - start, command=False)
+
+    def add(self, command, seconds):
+        self._add(command, seconds, command=True)
+
+    def _add(self, name, seconds, command):
+        stack = self._stack()
+        page, alias = stack[-1] if stack else (None, None)
+        with self._lock:
+            record = self.records[(page, alias, name)]
+            record[0] += 1
+            record[1] += seconds
+            if command:
+                self.total_commands += 1
+                self.total_seconds += seconds
+            else:
+                self._samples[(page, alias, name)].append(seconds)
+
+    def samples(self, kind):
+        """
+        Recent durations of one pseudo command per locator, for example how long each locator took to settle:
+            recorder.samples(SETTLE)[("WelcomePage", "btnContinue")]
+        :param kind: WAIT, SETTLE, DELAY or STEP
+        :return: dict of (page, alias) -> list of seconds, oldest first
+        """
+        with self._lock:
+            return {(page, alias): list(durations) for (page, alias, name), durations in self._samples.items()
+                    if name == kind}
+
+    def reset(self):
+        with self._lock:
+            self.records.clear()
+            self._samples.clear()
+            self.total_commands = 0
+            self.total_seconds = 0.0
+
+    def report(self):
+        """
+        :return: one line per (page, alias, command), most expensive first
+        """
+        with self._lock:
+            rows = sorted(self.records.items(), key=lambda item: -item[1][1])
+        return [f"{page}.{alias} {name}: {count} x, {seconds * 1000:.1f}ms"
+                for (page, alias, name), (count, seconds) in rows]
+
+    @contextlib.contextmanager
+    def budget(self, name, commands=None, ms=None):
+        """
+        Fail if the with block sends more than `commands` WebDriver commands or takes longer than `ms`
+        milliseconds, for example:
+            with recorder.budget("DemoLoginPageUsername.submit", commands=6, ms=300):
+                page.submit("user")
+        :raises BudgetExceeded: an AssertionError, so unittest reports it as a test failure
+        """
+        start_commands = self.total_commands
+        start = time.perf_counter()
+        yield
+        used = self.total_commands - start_commands
+        elapsed = (time.perf_counter() - start) * 1000
+        if commands is not None and used > commands:
+            raise BudgetExceeded(f"{name} sent {used} WebDriver commands, budget is {commands}")
+        if ms is not None and elapsed > ms:
+            raise BudgetExceeded(f"{name} took {elapsed:.0f}ms, budget is {ms}ms")
+
+
+def instrument(driver):
+    """
+    Start recording the commands sent through a webdriver, safe to call more than once
+    :param driver: a selenium webdriver
+    :return: the CommandRecorder attached to the driver
+    """
+    recorder = getattr(driver, "_pom_recorder", None)
+    if recorder is not None:
+        return recorder
+    recorder = CommandRecorder()
+    send = driver.execute
+
+    def execute(driver_command, params=None):
+        start = time.perf_counter()
+        try:
+            return send(driver_command, params)
+        finally:
+            recorder.add(driver_command, time.perf_counter() - start)
+
+    driver.execute = execute
+    driver._pom_recorder = recorder
+    return recorder
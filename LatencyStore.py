@@ -0,0 +1,132 @@
+# Learned timeouts. Every wait used to allow DEFAULT_TIMEOUT seconds, so a locator that is genuinely missing burned
+# the whole 20s before the test failed. The store remembers how long each (page class, locator) actually took to
+# become visible, on disk so that it carries over between runs, and derives a timeout for it from that history:
+# the 99th percentile times SAFETY_FACTOR, never less than MIN_TIMEOUT nor more than the page's own timeout. The
+# history is kept per browser, so that FakeDriver runs, which find everything at once, don't shorten the waits of
+# a real browser.
+# Until a locator has MIN_SAMPLES observations it gets the page timeout. Timeouts are not recorded as samples, a
+# locator that keeps failing does not teach the store to wait longer. PageChains keeps the time page transitions
+# take here too, under the alias "method()".
+import os
+import json
+import atexit
+import threading
+import collections
+
+from TestBase import CACHE_DIR
+from Helpers import atomic_write_json, percentile
+
+SAFETY_FACTOR = 3
+MIN_SAMPLES = 10
+MIN_TIMEOUT = 2  # seconds
+MAX_SAMPLES = 200  # the most recent observations kept per locator
+POLL_MIN, POLL_MAX = 0.05, 0.5  # seconds, bounds on the learned polling interval
+
+
+def browser_name(driver):
+    """
+    :return: the name of the browser a webdriver drives, such as "firefox", or "fake"
+    """
+    capabilities = getattr(driver, "capabilities", None) or {}
+    return capabilities.get("browserName") or type(driver).__name__
+
+
+class LatencyStore(object):
+    """
+    Appearance latencies per "browser/PageClass.alias", kept in a json file
+    """
+    def __init__(self, path=os.path.join(CACHE_DIR, "latencies.json")):
+        """
+        :param path: the json file, or None to keep the history in memory only
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._history = None  # loaded on first use
+        self._new = collections.defaultdict(list)  # observations not yet written to disk
+        atexit.register(self.flush)
+
+    def _load(self):
+        if self.path is None:
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _samples(self, key):
+        if self._history is None:
+            self._history = self._load()
+        return self._history.setdefault(key, [])
+
+    def use(self, path):
+        """
+        Start over with an empty history, kept in another file, or with None only in memory
+        """
+        with self._lock:
+            self.path = path
+            self._history = None
+            self._new.clear()
+
+    def record(self, browser, page, alias, seconds):
+        """
+        :param browser: see browser_name
+        :param page: page class name
+        :param alias: locator alias
+        :param seconds: how long the locator took to become visible
+        """
+        key = f"{browser}/{page}.{alias}"
+        with self._lock:
+            samples = self._samples(key)
+            samples.append(round(seconds, 3))
+            del samples[:-MAX_SAMPLES]
+            self._new[key].append(round(seconds, 3))
+
+    def timeout(self, browser, page, alias, limit):
+        """
+        :param limit: the page timeout, returned as is until there is enough history
+        :return: seconds to wait for this locator
+        """
+        with self._lock:
+            samples = sorted(self._samples(f"{browser}/{page}.{alias}"))
+        if len(samples) < MIN_SAMPLES:
+            return limit
+        return min(limit, max(MIN_TIMEOUT, percentile(samples, 0.99) * SAFETY_FACTOR))
+
+    def median(self, browser, page, alias, default):
+        """
+        :return: the typical latency, or default until there is any history
+        """
+        with self._lock:
+            samples = sorted(self._samples(f"{browser}/{page}.{alias}"))
+        return percentile(samples, 0.5) if samples else default
+
+    def poll_frequency(self, browser, page, alias, default):
+        """
+        :return: seconds between checks when waits fall back to polling, a quarter of the typical latency
+        """
+        with self._lock:
+            samples = sorted(self._samples(f"{browser}/{page}.{alias}"))
+        if len(samples) < MIN_SAMPLES:
+            return default
+        return min(POLL_MAX, max(POLL_MIN, percentile(samples, 0.5) / 4))
+
+    def flush(self):
+        """
+        Merge the new observations into the file. Parallel workers each merge their own, the rename makes every
+        write whole, though two workers flushing at the same moment can lose one side's observations
+        """
+        with self._lock:
+            if not self._new or self.path is None:
+                return
+            entries = self._load()
+            for key, samples in self._new.items():
+                entries[key] = (entries.get(key, []) + samples)[-MAX_SAMPLES:]
+            self._new.clear()
+        try:
+            atomic_write_json(self.path, entries, indent=1, sort_keys=True)
+        except OSError:
+            pass  # a read-only cache only costs us the learning
+
+
+LATENCIES = LatencyStore()
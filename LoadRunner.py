@@ -0,0 +1,305 @@
+# Load generation with page object flows. The functional flows we already have (log in, walk the chain to the
+# profile page, log out) double as load scripts: a flow is registered under a name and replayed over and over by a
+# pool of browser sessions, at a target arrival rate that ramps up from zero. Arrivals are scheduled on the clock
+# rather than when a session comes free, so when the sessions cannot keep up the queueing shows in the report
+# instead of quietly lowering the load. Each flow run takes its parameters from a JSONL or CSV dataset, streamed a
+# row at a time and wrapped around when it runs out. The report gives flows per second and p50/p95/p99 for every
+# flow and for every page object step, keyed by page class and locator (see Instrumentation, STEP).
+#
+#   python LoadRunner.py main login_logout --sessions 4 --rate 2 --ramp-up 30 --duration 120 --data users.csv
+#
+# Flows are functions taking the app (use it where a test would use self) and the dataset columns they name:
+#
+#   @flow("login_logout")
+#   def login_logout(app, username="user", password="pass"):
+#       ...
+import os
+import csv
+import sys
+import json
+import math
+import time
+import queue
+import inspect
+import argparse
+import importlib
+import threading
+import collections
+
+from TestBase import WebAppBase, Logger
+from Instrumentation import instrument, STEP
+from Helpers import percentile
+
+FLOWS = {}  # name -> flow function, see flow()
+
+
+class SessionStartError(Exception):
+    pass
+
+
+def flow(name):
+    """
+    Decorator, registers a function as a named load test flow
+    :param name: what to call it on the command line
+    """
+    def register(function):
+        FLOWS[name] = function
+        return function
+    return register
+
+
+def dataset(path=None):
+    """
+    Stream flow parameters, one dict per run, starting over at the end of the file
+    :param path: a .jsonl file with one json object per line, or a .csv file with a header row; None for no
+        parameters at all
+    :return: an endless generator of dicts
+    """
+    if path is None:
+        while True:
+            yield {}
+    while True:
+        rows = 0
+        with open(path, newline="") as f:
+            if path.endswith(".csv"):
+                lines = csv.DictReader(f)
+            else:
+                lines = (json.loads(line) for line in f if line.strip())
+            for row in lines:
+                rows += 1
+                yield row
+        if not rows:
+            raise ValueError(f"No rows in dataset {path}")
+
+
+def arrival_times(rate, ramp_up, duration):
+    """
+    When each flow run is due, in seconds from the start. The rate climbs linearly from zero to `rate` over
+    `ramp_up` seconds, then holds
+    :param rate: target flows per second
+    """
+    n = 0
+    while True:
+        # invert the number of arrivals due by time t: rate * t^2 / (2 * ramp_up) during the ramp, then linear
+        if n < rate * ramp_up / 2:
+            due = math.sqrt(2 * n * ramp_up / rate)
+        else:
+            due = n / rate + ramp_up / 2
+        if due > duration:
+            return
+        yield due
+        n += 1
+
+
+def _percentiles(samples):
+    ordered = sorted(samples)
+    return [percentile(ordered, fraction) * 1000 for fraction in (0.50, 0.95, 0.99)]
+
+
+class LoadReport(object):
+    """
+    What a load run did: throughput, failures and latency percentiles
+    """
+    def __init__(self, name, elapsed, flows, lateness, failures, steps):
+        """
+        :param flows: seconds each successful flow run took
+        :param lateness: seconds each run started after it was due, waiting for a free session
+        :param failures: Counter of exception type name -> runs that raised it
+        :param steps: dict of (page, alias) -> seconds, see CommandRecorder.samples
+        """
+        self.name = name
+        self.elapsed = elapsed
+        self.flows = flows
+        self.lateness = lateness
+        self.failures = failures
+        self.steps = steps
+
+    @property
+    def throughput(self):
+        return len(self.flows) / self.elapsed if self.elapsed else 0.0
+
+    def lines(self):
+        lines = [f"{self.name}: {len(self.flows)} flows in {self.elapsed:.1f}s, {self.throughput:.2f} flows/s, "
+                 f"{sum(self.failures.values())} failed"]
+        lines.extend(f"  failed with {error}: {count}" for error, count in self.failures.most_common())
+        lines.append(f"{'':48}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        rows = [("flow", self.flows), ("late start", self.lateness)]
+        rows.extend(sorted(((f"{page}.{alias}", samples) for (page, alias), samples in self.steps.items()),
+                           key=lambda row: -sum(row[1])))
+        for label, samples in rows:
+            if samples:
+                p50, p95, p99 = _percentiles(samples)
+                lines.append(f"  {label:46}{len(samples):>7}{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}")
+        return lines
+
+    def as_dict(self):
+        def summary(samples):
+            if not samples:
+                return {"count": 0}
+            p50, p95, p99 = _percentiles(samples)
+            return {"count": len(samples), "p50_ms": round(p50, 1), "p95_ms": round(p95, 1),
+                    "p99_ms": round(p99, 1)}
+        return {"flow": self.name, "elapsed": round(self.elapsed, 3), "throughput": round(self.throughput, 3),
+                "failures": dict(self.failures), "flows": summary(self.flows), "late_start": summary(self.lateness),
+                "steps": {f"{page}.{alias}": summary(samples) for (page, alias), samples in self.steps.items()}}
+
+
+class _LoadApp(WebAppBase):
+    """
+    One session of the pool, a WebAppBase on a leased browser
+    """
+    def __init__(self):
+        self.lease_browser()
+
+
+class LoadRunner(object):
+    """
+    Replays a flow across a pool of browser sessions at a target arrival rate
+    """
+    log = Logger("LOD")
+
+    def __init__(self, name, sessions=1, rate=1.0, ramp_up=0.0, duration=60.0, data=None):
+        """
+        :param name: a registered flow, see flow()
+        :param sessions: browser sessions running flows side by side
+        :param rate: target flow runs started per second
+        :param ramp_up: seconds to climb from no load to the target rate
+        :param duration: seconds to keep starting new runs, runs already started are finished
+        :param data: path of a .jsonl or .csv dataset of flow parameters
+        """
+        if name not in FLOWS:
+            raise KeyError(f"No flow named {name}, known flows are {', '.join(sorted(FLOWS))}")
+        self.name = name
+        self.function = FLOWS[name]
+        self.sessions = sessions
+        self.rate = rate
+        self.ramp_up = ramp_up
+        self.duration = duration
+        self.data = data
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._flows = []
+        self._lateness = []
+        self._failures = collections.Counter()
+        self._start_failures = []  # why sessions that never started failed
+        self._recorders = []
+
+    def _arguments(self, row):
+        # pass a flow only the dataset columns it takes, unless it takes **kwargs
+        parameters = inspect.signature(self.function).parameters.values()
+        if any(parameter.kind == parameter.VAR_KEYWORD for parameter in parameters):
+            return row
+        return {key: value for key, value in row.items() if key in {parameter.name for parameter in parameters}}
+
+    def _session(self, ready):
+        try:
+            app = _LoadApp()
+        except Exception as ex:
+            self.log.warning("session failed to start: %r", ex)
+            with self._lock:
+                self._start_failures.append(ex)
+            return
+        finally:
+            ready.release()
+        recorder = instrument(app.webdriver)
+        recorder.steps = True
+        with self._lock:
+            self._recorders.append(recorder)
+        try:
+            while True:
+                job = self._queue.get()
+                if job is None:
+                    return
+                due, row = job
+                started = time.perf_counter()
+                try:
+                    self.function(app, **self._arguments(row))
+                except Exception as ex:
+                    self.log.warning("%s failed: %s", self.name, ex)
+                    with self._lock:
+                        self._failures[type(ex).__name__] += 1
+                else:
+                    with self._lock:
+                        self._flows.append(time.perf_counter() - started)
+                with self._lock:
+                    self._lateness.append(max(0.0, started - due))
+                app.webdriver.delete_all_cookies()  # the next run is a new visitor
+        finally:
+            recorder.steps = False
+            app.release_browser()
+
+    def run(self):
+        """
+        :return: a LoadReport
+        """
+        ready = threading.Semaphore(0)
+        threads = [threading.Thread(name=f"load{i}", target=self._session, args=(ready,), daemon=True)
+                   for i in range(self.sessions)]
+        for thread in threads:
+            thread.start()
+        for _ in threads:
+            ready.acquire()  # browsers start slowly, don't count that against the first arrivals
+        if self._start_failures:  # fewer sessions than asked for would quietly measure a different load
+            for _ in threads:
+                self._queue.put(None)
+            for thread in threads:
+                thread.join()
+            raise SessionStartError(f"{len(self._start_failures)} of {self.sessions} sessions failed to start: "
+                                    f"{self._start_failures[0]!r}")
+        self.log.log("%s: %s sessions, %s/s after %ss ramp up", self.name, self.sessions, self.rate, self.ramp_up)
+        rows = dataset(self.data)
+        start = time.perf_counter()
+        for due in arrival_times(self.rate, self.ramp_up, self.duration):
+            wait = start + due - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            self._queue.put((start + due, next(rows)))
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        steps = collections.defaultdict(list)
+        for recorder in self._recorders:
+            for key, samples in recorder.samples(STEP).items():
+                steps[key].extend(samples)
+        return LoadReport(self.name, elapsed, self._flows, self._lateness, self._failures, dict(steps))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay page object flows as load")
+    parser.add_argument("module", help="module that registers the flows, for example main")
+    parser.add_argument("flow", help="name of the flow to run")
+    parser.add_argument("--sessions", type=int, default=1, help="browser sessions, default 1")
+    parser.add_argument("--rate", type=float, default=1.0, help="target flows started per second, default 1")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="seconds to reach the target rate")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds to keep starting flows")
+    parser.add_argument("--data", default=None, help=".jsonl or .csv file of flow parameters")
+    parser.add_argument("--browser", default=None, help="chrome, firefox or fake, default POM_BROWSER")
+    parser.add_argument("--json", default=None, help="also write the report to this json file")
+    args = parser.parse_args(argv)
+
+    from WebServer import WebServer
+    importlib.import_module(args.module)
+    # run as a script this module is __main__, the flows registered themselves with the importable copy
+    runner = importlib.import_module("LoadRunner")
+    WebAppBase.set_browser(args.browser or os.environ.get("POM_BROWSER", "firefox"))
+    server = WebServer()  # serve the fixture pages, as the tests do
+    WebAppBase.fixture_base = f"http://localhost:{server.start()}"
+    try:
+        report = runner.LoadRunner(args.flow, args.sessions, args.rate, args.ramp_up, args.duration, args.data).run()
+    except runner.SessionStartError as ex:
+        print(ex)
+        return 1
+    finally:
+        server.stop()
+    print("\n".join(report.lines()))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report.as_dict(), f, indent=2)
+    return 1 if report.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
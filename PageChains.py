@@ -5,44 +5,168 @@
 #
 # If a page has to deal with intervening page branches or runtime variation, it becomes incumbent
 # on the implementor to implement the branches and still return just one page.
+#
+# Together the registered pages and their @next_page methods form a graph of the app's page flow, which
+# register_page compiles into TRANSITIONS. navigate_to() uses it to get from the current page to any other page
+# by the quickest known route, timing every transition as it goes so that the routes improve with use.
 
 from selenium.webdriver.common.by import By
 from PageFactory import PageFactory
+from TestBase import POMException, FIXTURE_URL
+from LatencyStore import LATENCIES
+import time
+import heapq
 import inspect
+import functools
+import collections
 
 MAP = {}  # Page objects can add themselves to this map to use the @next_page decorator
+# source page class name -> [Transition, ...] for every @next_page method of the registered pages
+TRANSITIONS = {}
+# params: the names of the method's parameters, required: those without a default
+Transition = collections.namedtuple("Transition", "source method target params required")
+DEFAULT_TRANSITION_COST = 1.0  # seconds, assumed for transitions that have not been timed yet
+
+
 # This allows us to reference classes before their definitions are known
 def register_page(page_class):
     MAP[page_class.__name__] = page_class
+    _init_params(page_class)  # resolve the constructor signature once, rather than on every page
+    TRANSITIONS[page_class.__name__] = _transitions(page_class)
+
+
+def _transitions(page_class):
+    transitions = []
+    for name in dir(page_class):
+        method = getattr(page_class, name, None)
+        target = getattr(method, "_next_page", None)
+        if target is None:
+            continue
+        params = list(inspect.signature(method).parameters.values())[1:]  # not self
+        transitions.append(Transition(page_class.__name__, name, target, tuple(p.name for p in params),
+                                      frozenset(p.name for p in params if p.default is p.empty)))
+    return transitions
+
+
+def transition_cost(transition, browser=None):
+    """
+    :param browser: whose timings to go by, see LatencyStore.browser_name
+    :return: seconds, the typical time the transition has taken so far
+    """
+    return LATENCIES.median(browser, transition.source, f"{transition.method}()", DEFAULT_TRANSITION_COST)
 
 
-# You can decorate the page next() method if the page is added to the MAP
-def next_page(next_):
+def find_route(source, target, params=(), browser=None):
+    """
+    The quickest known sequence of transitions between two registered pages (Dijkstra, weighted by
+    transition_cost), using only transitions whose required parameters are available
+    :param source: page class name
+    :param target: page class name
+    :param params: names of the parameters the caller can supply
+    :param browser: whose transition timings to weigh the route by
+    :return: list of Transition, empty when source is target, or None if there is no route
+    """
+    params = set(params)
+    queue = [(0.0, 0, source, [])]
+    done = set()
+    tie = 1  # keeps heapq from comparing routes
+    while queue:
+        cost, _, page, route = heapq.heappop(queue)
+        if page == target:
+            return route
+        if page in done:
+            continue
+        done.add(page)
+        for transition in TRANSITIONS.get(page, ()):
+            if transition.target not in done and transition.required <= params:
+                heapq.heappush(queue, (cost + transition_cost(transition, browser), tie, transition.target,
+                                       route + [transition]))
+                tie += 1
+    return None
+
+
+def _init_params(page_class):
+    """
+    :return: the names of the PageFactory constructor parameters a ChainingPageFactory class passes on
+    """
+    params = page_class.__dict__.get("_init_params")
+    if params is None:
+        params = frozenset(inspect.signature(super(ChainingPageFactory, page_class).__init__).parameters)
+        page_class._init_params = params
+    return params
+
+
+# You can decorate the page next() method if the page is added to the MAP.
+# ready optionally names the locators of the next page that prove we got there, the new page waits for just those
+# rather than all of its locators. When the method already returns another page of the next class (see
+# login_to_profile), that page is passed on rather than built again; a method returning self always gets a new
+# page, even when the next page is of its own class (a "next" button that pages through results, say).
+def next_page(next_, ready=None):
     def deco(func):
+        @functools.wraps(func)
         def wrapper(self, *args, **kwargs):
-            func(self, *args, **kwargs)
-            return MAP[next_](**self._kwargs)
+            started = time.monotonic()
+            result = func(self, *args, **kwargs)
+            page_class = MAP[next_]
+            if result is self or type(result) is not page_class:
+                if ready is not None:
+                    result = page_class(ready_locators=ready, **self._kwargs)
+                else:
+                    result = page_class(**self._kwargs)
+            LATENCIES.record(self._browser, type(self).__name__, f"{func.__name__}()", time.monotonic() - started)
+            return result
+        wrapper._next_page = next_
         return wrapper
     return deco
 
 
 class ChainingPageFactory(PageFactory):
+    # a url that opens this page directly, which works once the browser is logged in, see navigate_to
+    direct_url = None
+
     def __init__(self, **kwargs):
         # renames one of the parameters before calling the base class
-        args = {"base": kwargs['driver']}
-        for k in inspect.getfullargspec(super().__init__)[0]:
-            if k in kwargs.keys():
-                args[k] = kwargs[k]
+        params = _init_params(type(self))
+        args = {k: v for k, v in kwargs.items() if k in params}
+        args["base"] = kwargs['driver']
 
         # the starting page in a chain of pages may have a url
         super().__init__(**args)
         # remove url, subsequent pages don't use the starting url
         self._kwargs = kwargs
         self._kwargs.pop('url', None)
+        self._kwargs.pop('ready_locators', None)  # only meant for this page
 
     def next(self):
         raise NotImplemented("Must be implemented to return the Chained PageObject!")
 
+    def navigate_to(self, target, **params):
+        """
+        Get to another registered page by the quickest known route from this one, for example
+            profile_page = login_page.navigate_to(DemoProfilePageV2, username="user", password="pass")
+        When the browser session was restored (see WebAppBase.session_restored) and the target page has a
+        direct_url, that is opened instead of clicking through.
+        :param target: page class, or its name
+        :param params: arguments for the transition methods on the way, matched by name
+        :return: the target page
+        """
+        name = target if isinstance(target, str) else target.__name__
+        if name == type(self).__name__:
+            return self
+        page_class = MAP[name]
+        if page_class.direct_url and getattr(self._app, "session_restored", False):
+            self.log("navigate_to %s: direct to %s", name, page_class.direct_url)
+            return page_class(url=page_class.direct_url, **self._kwargs)
+        route = find_route(type(self).__name__, name, params, self._browser)
+        if route is None:
+            raise POMException(self.driver, f"No known route from {type(self).__name__} to {name} "
+                                            f"with parameters {', '.join(params) or 'none'}")
+        self.log("navigate_to %s: %s", name, " -> ".join(f"{t.source}.{t.method}" for t in route))
+        page = self
+        for transition in route:
+            page = getattr(page, transition.method)(**{k: params[k] for k in transition.params if k in params})
+        return page
+
 
 class DemoLoginPageUsernameV2(ChainingPageFactory):
 
@@ -51,7 +175,7 @@ class DemoLoginPageUsernameV2(ChainingPageFactory):
         "btnContinue": (By.NAME, "Continue")
     }
 
-    @next_page("DemoLoginPagePasswordV2")
+    @next_page("DemoLoginPagePasswordV2", ready=["editPassword"])
     def next(self, username):
         self._submit(username)
         return self
@@ -123,6 +247,7 @@ register_page(DemoHomePageV2)
 
 class DemoProfilePageV2(ChainingPageFactory):
     # simple page, with only one button we worry about.
+    direct_url = f"{FIXTURE_URL}/profile.html"
     locators = {
         "btnLogout": (By.NAME, "LogOut")
     }
@@ -1,17 +1,196 @@
+import os
 import time
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.wait import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.action_chains import ActionChains
+import contextlib
 from selenium.common.exceptions import *
 
 # PageObject base classes
 from TestBase import Logger, DEFAULT_TIMEOUT, POMException
+from PageScripts import FILL_FIELDS, SNAPSHOT, locator_args
+from PageSnapshot import PageSnapshot
+from WaitEngine import WaitEngine, POLL_FREQUENCY, SLEEP
+from LatencyStore import LATENCIES, browser_name
+from ElementCache import ElementCache
+from ElementCollection import ElementCollection
+from Instrumentation import instrument, WAIT, SETTLE, DELAY
 
-ANIMATION_DELAY = 1  # make this 0 when you want to run fast as possible
+SETTLE_CAP = 3  # seconds, the longest an animation_delay=SETTLE page waits for the page to go quiet
+ANIMATION_DELAY = SETTLE  # a number of seconds to sleep instead, or 0 when you want to run fast as possible
+HIGHLIGHT_BORDER = "3px ridge #ff33ff"
+TURBO = os.environ.get("POM_TURBO", "0") != "0"  # no highlighting and no animation delays, for CI
 
-class PageFactory(Logger):
+
+def set_turbo(enabled=True):
+    """
+    Turbo mode switches off element highlighting and animation_delay waits for every page created afterwards
+    """
+    global TURBO
+    TURBO = enabled
+
+
+def turbo():
+    """
+    :return: True if turbo mode is on, see set_turbo
+    """
+    return TURBO
+
+
+class PageSteps(Logger):
+    """
+    The page logic PageFactory and AsyncPageFactory share. It is written as generators of driver steps (see
+    WaitEngine), which each page runs on its own kind of driver with self.waits.run(). Pages set driver, waits,
+    timeout, _app, _page, _browser, _learned_timeouts, _highlight, _delay and _settle_cap.
+    """
+    keystroke_locators = ()
+    locator_timeouts = {}
+    ready_locators = None
+
+    def locator_timeout(self, alias):
+        """
+        :return: seconds to wait for a locator, from locator_timeouts, else learned, else the page timeout
+        """
+        if alias in self.locator_timeouts:
+            return self.locator_timeouts[alias]
+        if not self._learned_timeouts:
+            return self.timeout
+        return LATENCIES.timeout(self._browser, self._page, alias, self.timeout)
+
+    def _timing(self, kind):
+        """
+        :return: a context manager timing the steps inside it as kind, see Instrumentation; nothing by default
+        """
+        return contextlib.nullcontext()
+
+    def _failure(self, message):
+        """
+        Steps making the exception for a page failure, raise what they return. The browser state is captured
+        later, when the exception escapes a test, see POMException.capture
+        """
+        return POMException(self.driver, message)
+        yield  # a generator like the other steps, though it sends no commands
+
+    def _load_steps(self, url, wait_title_contains):
+        if url:
+            yield from self._pre_navigate_steps(url)
+        if wait_title_contains:
+            self.log("Wait for title to contain '%s'", wait_title_contains)
+            if not (yield from self._is_title_containing_steps(wait_title_contains)):
+                raise (yield from self._failure(f"Expected page title containing '{wait_title_contains}' not found."))
+        if not (yield from self._are_locators_loaded_steps()):
+            missing = ", ".join(f"{alias} ({reason})" for alias, reason in self.missing_locators)
+            raise (yield from self._failure(f"One or more locators on this page were not found: {missing}"))
+
+    def _pre_navigate_steps(self, url):
+        url = self._app.rewrite_url(url) if self._app else url
+        self.log("pre_navigate:%s", url)
+        yield ("get", url)
+
+    def _is_title_containing_steps(self, expect_title_contains):
+        with self._timing(WAIT):
+            if (yield from self.waits.title_contains_steps(expect_title_contains, self.timeout)):
+                return True
+        self.log("Page %s title = '%s'", (yield ("current_url",)), (yield ("title",)))
+        return False
+
+    def _are_locators_loaded_steps(self):
+        """
+        Wait for all the locators, or just the ready_locators, to become visible. Every locator is checked by one
+        script that waits in the page (see WaitEngine), and the whole page shares one timeout, so a broken page
+        fails after one timeout and reports every missing or hidden locator at once.
+        :return: True or False, the locators that never showed up are left in self.missing_locators
+        """
+        self.missing_locators = []
+        aliases = self.locators if self.ready_locators is None else self.ready_locators
+        if not aliases:
+            return True
+        args = locator_args(self.locators, aliases)  # these must be defined in the derived class
+        timeout = max(self.locator_timeout(alias) for alias in aliases)
+        poll = min(LATENCIES.poll_frequency(self._browser, self._page, alias, POLL_FREQUENCY) for alias in aliases)
+        appeared = {}
+        with self._timing(WAIT):
+            pending = yield from self.waits.locators_visible_steps(args, timeout, appeared, poll)
+        for alias, seconds in appeared.items():
+            LATENCIES.record(self._browser, self._page, alias, seconds)
+        if not pending:
+            return True
+        url = yield ("current_url",)
+        for alias, reason in pending:
+            self.log("Page %s did not contain %s %s: %s %s", url, alias, reason, *self.locators[alias])
+        self.missing_locators = pending
+        return False
+
+    def _ensure_visible_steps(self, by, criteria, timeout=None, poll_frequency=POLL_FREQUENCY):
+        """
+        Wait for element to exist, and scroll it into view, but NOT checking that it is enabled.
+        The visibility check, scrolling and highlighting are all one script call, so an element that is already
+        there costs a single WebDriver command.
+        """
+        border = HIGHLIGHT_BORDER if self._highlight else None
+        with self._timing(WAIT):
+            return (yield from self.waits.activate_steps(by, criteria, border, timeout or self.timeout,
+                                                         poll_frequency))
+
+    def _locate_steps(self, alias, record=True):
+        """
+        Find the element for a locator alias, scrolled into view and highlighted
+        :param record: add how long it took to the learned latencies, not for an element found again after it went
+            stale, that is no page load and so much quicker that it would cut the learned timeouts short
+        """
+        by, criteria = self.locators[alias]
+        started = time.monotonic()
+        element = yield from self._ensure_visible_steps(by, criteria, self.locator_timeout(alias),
+                                                        LATENCIES.poll_frequency(self._browser, self._page, alias,
+                                                                                 POLL_FREQUENCY))
+        if record:
+            LATENCIES.record(self._browser, self._page, alias, time.monotonic() - started)
+        return element
+
+    def _after_action_steps(self):
+        """
+        Give the page time to react to what we just did, see animation_delay
+        """
+        if self._delay == SETTLE:
+            with self._timing(SETTLE):
+                settled, busy = yield from self.waits.settle_steps(self._settle_cap)
+            if not settled:
+                self.log("Page did not settle within %ss, still busy: %s", self._settle_cap, ", ".join(busy))
+        elif self._delay:
+            with self._timing(DELAY):
+                yield (SLEEP, self._delay)
+
+    def _fill_steps(self, values, keystrokes=()):
+        """
+        Set the fields that can be set by script, see fill
+        :return: the aliases left to type, in order
+        """
+        typed = set(keystrokes) | set(self.keystroke_locators)
+        scripted = [alias for alias in values if alias not in typed]
+        for alias in values:
+            if alias not in self.locators:
+                raise Exception(f"No page element with the alias {alias} was defined!")
+        self.debug("fill %s", ", ".join(values))
+        border = HIGHLIGHT_BORDER if self._highlight else None
+        fields = [args + [str(values[args[0]])] for args in locator_args(self.locators, scripted)]
+        pending = (yield ("execute_script", FILL_FIELDS, fields, border)) if fields else []
+        if pending:
+            # some fields are not there yet, wait for those and try them again
+            retry = [alias for alias, _ in pending]
+            with self._timing(WAIT):
+                timeout = max(self.locator_timeout(alias) for alias in retry)
+                pending = yield from self.waits.locators_visible_steps(locator_args(self.locators, retry), timeout)
+            if pending:
+                missing = ", ".join(f"{alias} ({reason})" for alias, reason in pending)
+                raise (yield from self._failure(f"Could not fill fields: {missing}"))
+            fields = [args + [str(values[args[0]])] for args in locator_args(self.locators, retry)]
+            yield ("execute_script", FILL_FIELDS, fields, border)
+        return [alias for alias in values if alias in typed]
+
+    def _snapshot_steps(self, attributes=(), aliases=None):
+        attributes = list(attributes)
+        raw = yield ("execute_script", SNAPSHOT, locator_args(self.locators, aliases), attributes)
+        return PageSnapshot.from_script(self._page, raw, attributes)
+
+
+class PageFactory(PageSteps):
     # To use this page object declare locators in your child class
     #locators = {
     # "editUserName": (By.ID, "usernameOrEmail"),
@@ -22,108 +201,151 @@ class PageFactory(Logger):
     # self.editUserName = "JoeBloggs"
     # if self.editUserName.text != "JoeBloggs":
     #   print("Oops, that should not happen!")
+    # Many fields can be set at once with fill(), list any that need real typing in keystroke_locators.
+    # Lists and tables go in collection_locators, and read as a lazy ElementCollection over every match:
+    # collection_locators = {"serverRows": (By.XPATH, "//table[@id='servers']//tr")}
+    # for row in self.serverRows: print(row.text)
+    # Each locator gets a timeout learned from how long it took to show up before (see LatencyStore), to fix one
+    # for a locator, give it seconds in locator_timeouts.
+    # ready_locators optionally names the locators that prove the page has loaded, the others are then only waited
+    # for when used.
+    collection_locators = {}
 
     def __init__(self,
                  base,
                  url=None,
                  wait_title_contains=None,
-                 timeout=DEFAULT_TIMEOUT,
+                 timeout=None,
                  highlight=True,
-                 animation_delay=ANIMATION_DELAY):
+                 animation_delay=ANIMATION_DELAY,
+                 settle_cap=SETTLE_CAP,
+                 ready_locators=None):
         """
 
         :param base: a PageBaseTest object
         :param url: optional url to navigate to first
         :param wait_title_contains: optional case-sensitive page title substring to wait for
-        :param timeout: seconds
+        :param timeout: seconds, or None to use learned per-locator timeouts of at most DEFAULT_TIMEOUT
         :param highlight: highlight elements as we use them
-        :param animation_delay: wait after most actions (a demo/debugging aid)
+        :param animation_delay: wait after most actions: SETTLE waits until the page has gone quiet (loaded, no
+            requests in flight, no animations running), a number sleeps that many seconds (a demo/debugging aid)
+        :param settle_cap: most seconds to wait for the page to settle
+        :param ready_locators: optional aliases to wait for while loading, instead of the class ready_locators
         """
         super().__init__("POM")  # logger prefix
         # It is necessary to initialise driver as page class member to implement Page Factory
+        self._app = base
         self.driver = base.get_webdriver()
+        self.recorder = instrument(self.driver)  # counts our WebDriver commands, see Instrumentation
+        self.waits = WaitEngine(self.driver)
+        self._page = type(self).__name__
+        self._browser = browser_name(self.driver)  # learned latencies are per browser
         self.timeout = DEFAULT_TIMEOUT
-        self.set_timeout(timeout)
-        self._highlight = highlight
+        self._learned_timeouts = timeout is None
+        self.set_timeout(DEFAULT_TIMEOUT if timeout is None else timeout)
+        self._highlight = highlight and not TURBO
         self._delay = 0  # disable getter delays during object init
+        self._settle_cap = settle_cap
+        if ready_locators is not None:
+            self.ready_locators = ready_locators
+        self.missing_locators = []  # [alias, reason] pairs left over from a failed page load
+        self.element_cache = ElementCache(self._locate,
+                                          lambda alias: self.recorder.scope(self._page, alias, step=False),
+                                          lambda alias: self._locate(alias, record=False))
 
-        if url:
-            self._pre_navigate(url)
-        if wait_title_contains:
-            self.log(f"Wait for title to contain '{wait_title_contains}'")
-            if not self._is_title_containing(wait_title_contains):
-                raise POMException(self.driver, f"Expected page title containing '{wait_title_contains}' not found.")
-        if not self._are_locators_loaded():
-            raise POMException(self.driver, "One or more locators on this page were not found.")
-        self._delay = animation_delay
+        with self.recorder.scope(self._page, "<load>"):
+            self.waits.run(self._load_steps(url, wait_title_contains))
+        self._delay = 0 if TURBO else animation_delay
 
     def set_timeout(self, to):
         self.timeout = to
 
-    def _pre_navigate(self, url):
-        self.log(f"pre_navigate:{url}")
-        self.driver.get(url)
+    def _timing(self, kind):
+        return self.recorder.timing(kind)
 
-    def _is_title_containing(self, expect_title_contains):
-        try:
-            WebDriverWait(self.driver, self.timeout).until(
-                EC.title_contains(expect_title_contains)
-            )
-            return True
-        except (StaleElementReferenceException, NoSuchElementException, TimeoutException) as ex:
-            self.log(f"Page {self.driver.current_url} title = '{self.driver.title}'")
-        return False
+    def _pre_navigate_steps(self, url):
+        self.element_cache.invalidate()
+        yield from super()._pre_navigate_steps(url)
 
-    def _are_locators_loaded(self):
-        """
-        True if the page fails to present the desired locators
-        :return: True or False
-        """
-        loaded = True
-        for key in self.locators:  # these must be defined in the derived class
-            try:
-                WebDriverWait(self.driver, self.timeout).until(
-                    EC.visibility_of_element_located((self.locators[key][0], self.locators[key][1]))
-                )
-            except (StaleElementReferenceException, NoSuchElementException, TimeoutException) as ex:
-                self.log(f"Page {self.driver.current_url} did not contain {self.locators[key][0]}" +
-                         f"{self.locators[key][1]}")
-                loaded = False
-        return loaded
-
-    def _ensure_visible(self,
-                        by: webdriver.common.by,
-                        criteria: str):
-        """
-        Wait for element to exist, and scroll it into view, but NOT checking that it is enabled
-        """
-        element = WebDriverWait(self.driver, self.timeout).until(
-            EC.visibility_of_element_located((by, criteria))
-        )
-        # scroll to visible
-        action = ActionChains(self.driver)
-        action.move_to_element(element).perform()
-        return element
+    def _after_action(self):
+        self.waits.run(self._after_action_steps())
+
+    def _locate(self, alias, record=True):
+        """
+        Find the element for a locator alias, scrolled into view and highlighted, used to fill the element cache
+        """
+        return self.waits.run(self._locate_steps(alias, record))
+
+    def fill(self, values, keystrokes=()):
+        """
+        Set many fields in one round trip, instead of one assignment at a time:
+            self.fill({"firstname": "Joe", "lastname": "Bloggs"})
+        Values are set by script, which fires the input and change events typing would. Fields that need real
+        keystrokes (key handlers, masks, autocomplete) can be listed in keystrokes, or in the page class
+        keystroke_locators, and are typed with send_keys afterwards as if assigned.
+        :param values: dict of locator alias to the text to put in it
+        :param keystrokes: aliases to type rather than set
+        """
+        with self.recorder.scope(self._page, "<fill>"):
+            typed = self.waits.run(self._fill_steps(values, keystrokes))
+        for alias in typed:
+            setattr(self, alias, values[alias])
+
+    def snapshot(self, attributes=(), aliases=None):
+        """
+        Read the state of every locator on the page in one script call, without waiting, scrolling or delays
+            before = self.snapshot(["class"])
+            ...
+            changed = before.diff(self.snapshot(["class"]))
+        :param attributes: names of extra attributes to read from each element
+        :param aliases: optional subset of the locators
+        :return: a read-only PageSnapshot of alias -> ElementState(present, text, value, visible, enabled,
+            attributes)
+        """
+        with self.recorder.scope(self._page, "<snapshot>"):
+            return self.waits.run(self._snapshot_steps(attributes, aliases))
+
+    def collection(self, alias, attributes=(), batch_size=None):
+        """
+        A collection locator with extra attributes to read for each row, self.alias gives one with text only
+        :param alias: key in collection_locators
+        :param attributes: attribute names
+        :param batch_size: optional rows per script call
+        :return: ElementCollection
+        """
+        if alias not in self.collection_locators:
+            raise Exception(f"No collection with the alias {alias} was defined!")
+        if batch_size:
+            return ElementCollection(self, alias, attributes, batch_size)
+        return ElementCollection(self, alias, attributes)
+
+    def invalidate_cache(self, alias=None):
+        """
+        Drop cached elements, call this if the page content was replaced without the elements going stale
+        :param alias: optional single locator alias to forget
+        """
+        self.element_cache.invalidate(alias)
 
     # todo: add a getattr and setattr to magically drive locators as object properties
     def __getattr__(self, alias):
         """
-        Attribute lookup helper, will return a webelement that is scrolled into view and visible, else will raise
+        Attribute lookup helper, will return a webelement that is scrolled into view and visible, else will raise.
+        Elements are cached per page, and are only looked up again once they go stale.
         :param alias: the key in the lookup dictionary
         :return: webelement
         """
         if alias == "locators":
             raise Exception("A PageFactory class locators dict was not defined!")
         if alias != "__len__":
-            self.log(f"__getattr__ {alias}")
+            self.debug("__getattr__ %s", alias)
 
         if alias in self.locators.keys():
-            locator = self.locators[alias]
-            # wait for element to be present
-            element = self._ensure_visible(locator[0], locator[1])
-            if self._highlight: self.highlight_web_element(element)
-            if self._delay: time.sleep(self._delay)
+            with self.recorder.scope(self._page, alias):
+                element = self.element_cache.get(alias)
+                self._after_action()
             return element
+        elif alias in self.collection_locators:
+            return ElementCollection(self, alias)
         else:
             raise Exception(
                 f"No page element with the alias {alias} was defined!\nTry adding it to the locators dictionary."
@@ -131,13 +353,11 @@ class PageFactory(Logger):
 
     def __setattr__(self, alias, value):
         if alias in self.locators.keys():
-            self.log(f"__setattr__ {alias} = '{value}'")
-            locator = self.locators[alias]
-            # wait for element to be present
-            element = self._ensure_visible(locator[0], locator[1])
-            if self._highlight: self.highlight_web_element(element)
-            element.clear()
-            element.send_keys(value)
+            self.debug("__setattr__ %s = '%s'", alias, value)
+            with self.recorder.scope(self._page, alias):
+                element = self.element_cache.get(alias)
+                element.clear()
+                element.send_keys(value)
         else:
             super(PageFactory, self).__setattr__(alias, value)
 
@@ -148,11 +368,11 @@ class PageFactory(Logger):
         :return: None
         """
         if self._highlight:
-            self.driver.execute_script("arguments[0].style.border='3px ridge #ff33ff'", element)
+            self.driver.execute_script(f"arguments[0].style.border='{HIGHLIGHT_BORDER}'", element)
 
 class PageTitleChecker(PageFactory):
 
-    def __init__(self, base, wait_title_contains, url=None, timeout=DEFAULT_TIMEOUT):
+    def __init__(self, base, wait_title_contains, url=None, timeout=None):
         """
         A test page object that has no locators on the page, and only waits for the page title to change
         :param base: a PageBaseTest object
@@ -0,0 +1,268 @@
+# JavaScript injected into the page by the page objects. Each script does in one WebDriver round trip
+# what would otherwise take one command (or one wait) per locator.
+#
+# Locators are passed to the scripts as [alias, by, value] triples, where "by" is the plain selenium
+# strategy string (By.ID == "id", By.XPATH == "xpath" and so on).
+
+# shared helpers, prefixed to every script below
+_HELPERS = """
+var pomFind = function (by, value, root) {
+  root = root || document;
+  var doc = root.ownerDocument || root;
+  var quoted = '"' + String(value).replace(/(["\\\\])/g, '\\\\$1') + '"';
+  var all;
+  switch (by) {
+    case 'id': all = root.querySelectorAll('[id=' + quoted + ']'); break;
+    case 'name': all = root.querySelectorAll('[name=' + quoted + ']'); break;
+    case 'css selector': all = root.querySelectorAll(value); break;
+    case 'class name': all = root.getElementsByClassName(value); break;
+    case 'tag name': all = root.getElementsByTagName(value); break;
+    case 'link text':
+    case 'partial link text':
+      all = Array.prototype.filter.call(root.getElementsByTagName('a'), function (a) {
+        var text = (a.innerText || a.textContent || '').trim();
+        return by === 'link text' ? text === value : text.indexOf(value) !== -1;
+      });
+      break;
+    case 'xpath':
+      var snap = doc.evaluate(value, root, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+      all = [];
+      for (var i = 0; i < snap.snapshotLength; i++) all.push(snap.snapshotItem(i));
+      break;
+    default: throw new Error('Unsupported locator strategy: ' + by);
+  }
+  return Array.prototype.slice.call(all);
+};
+var pomVisible = function (el) {
+  if (!el || !el.isConnected) return false;
+  for (var node = el; node && node.nodeType === 1; node = node.parentElement) {
+    var style = window.getComputedStyle(node);
+    if (style.display === 'none' || parseFloat(style.opacity) === 0) return false;
+  }
+  var own = window.getComputedStyle(el);
+  if (own.visibility === 'hidden' || own.visibility === 'collapse') return false;
+  var rect = el.getBoundingClientRect();
+  return rect.width > 0 && rect.height > 0;
+};
+var pomPending = function (locators) {
+  var pending = [];
+  for (var i = 0; i < locators.length; i++) {
+    var found = pomFind(locators[i][1], locators[i][2])[0];
+    if (!found) pending.push([locators[i][0], 'missing']);
+    else if (!pomVisible(found)) pending.push([locators[i][0], 'hidden']);
+  }
+  return pending;
+};
+var pomActivate = function (by, value, border) {
+  var el = pomFind(by, value)[0];
+  if (!el || !pomVisible(el)) return null;
+  var rect = el.getBoundingClientRect();
+  if (rect.top < 0 || rect.left < 0 || rect.bottom > window.innerHeight || rect.right > window.innerWidth) {
+    el.scrollIntoView({block: 'center', inline: 'nearest'});
+  }
+  if (border) el.style.border = border;
+  return el;
+};
+var pomBusy = function () {
+  // fetch and XHR are counted from the first time we look, requests already in flight then are not seen
+  if (!window.__pomNet) {
+    var net = window.__pomNet = {pending: 0};
+    var settled = function () { net.pending--; };
+    if (window.fetch) {
+      var fetch = window.fetch;
+      window.fetch = function () {
+        net.pending++;
+        var result = fetch.apply(this, arguments);
+        result.then(settled, settled);
+        return result;
+      };
+    }
+    var send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+      net.pending++;
+      this.addEventListener('loadend', settled);
+      return send.apply(this, arguments);
+    };
+  }
+  var busy = [];
+  if (document.readyState !== 'complete') busy.push('readyState');
+  if (window.__pomNet.pending > 0) busy.push('network');
+  // endlessly repeating animations (spinners, pulsing badges) never finish, so they do not count
+  if (document.getAnimations && document.getAnimations().some(function (a) {
+    return a.playState === 'running' && isFinite(a.effect ? a.effect.getComputedTiming().endTime : Infinity);
+  })) busy.push('animation');
+  return busy;
+};
+"""
+
+# arguments[0]: [[alias, by, value], ...]
+# returns [[alias, "missing" | "hidden"], ...] for every locator that is not yet visible
+LOCATOR_STATES = _HELPERS + "return pomPending(arguments[0]);"
+
+# returns {local: {key: value}, session: {key: value}}, the web storage of the current origin
+READ_STORAGE = """
+var read = function (name) {
+  var values = {};
+  try {
+    var storage = window[name];
+    for (var i = 0; i < storage.length; i++) values[storage.key(i)] = storage.getItem(storage.key(i));
+  } catch (e) {}  // some pages refuse storage access
+  return values;
+};
+return {local: read('localStorage'), session: read('sessionStorage')};
+"""
+
+# arguments: {key: value} for localStorage, {key: value} for sessionStorage, added to the current origin's storage
+WRITE_STORAGE = """
+var write = function (name, values) {
+  try { for (var key in values) window[name].setItem(key, values[key]); } catch (e) {}
+};
+write('localStorage', arguments[0]);
+write('sessionStorage', arguments[1]);
+"""
+
+# returns what is keeping the page busy, any of "readyState", "network" and "animation", or [] once it is quiet
+SETTLE_STATE = _HELPERS + "return pomBusy();"
+
+# arguments: by, value, border style or null
+# returns the element once it is visible, scrolled into view if it was not in the viewport and highlighted, or null
+# while it is missing or hidden. Together these used to be an explicit wait, an ActionChains move and a script call
+ACTIVATE_ELEMENT = _HELPERS + "return pomActivate(arguments[0], arguments[1], arguments[2]);"
+
+# arguments: [[alias, by, value, text], ...], border style or null
+# Sets the value of every field the way typing would leave it: through the native value setter (so frameworks that
+# track the value see the change), followed by bubbling input and change events. Checkboxes and radio buttons are
+# checked when text is truthy and not "false".
+# returns [[alias, "missing" | "hidden"], ...] for the fields it could not fill
+FILL_FIELDS = _HELPERS + """
+var fields = arguments[0], border = arguments[1], pending = [];
+for (var i = 0; i < fields.length; i++) {
+  var el = pomFind(fields[i][1], fields[i][2])[0], text = fields[i][3];
+  if (!el) { pending.push([fields[i][0], 'missing']); continue; }
+  if (!pomVisible(el)) { pending.push([fields[i][0], 'hidden']); continue; }
+  if (border) el.style.border = border;
+  el.focus();
+  if (el.type === 'checkbox' || el.type === 'radio') {
+    el.checked = !!text && text !== 'false';
+  } else {
+    var proto = el instanceof HTMLTextAreaElement ? HTMLTextAreaElement.prototype :
+                el instanceof HTMLSelectElement ? HTMLSelectElement.prototype : HTMLInputElement.prototype;
+    Object.getOwnPropertyDescriptor(proto, 'value').set.call(el, text);
+  }
+  el.dispatchEvent(new Event('input', {bubbles: true}));
+  el.dispatchEvent(new Event('change', {bubbles: true}));
+}
+if (document.activeElement && document.activeElement.blur) document.activeElement.blur();
+return pending;
+"""
+
+# arguments: [[alias, by, value], ...], [attribute name, ...]
+# returns {alias: null if missing, else [text, value, visible, enabled, [attribute values]]}
+SNAPSHOT = _HELPERS + """
+var locators = arguments[0], names = arguments[1], states = {};
+for (var i = 0; i < locators.length; i++) {
+  var el = pomFind(locators[i][1], locators[i][2])[0];
+  if (!el) { states[locators[i][0]] = null; continue; }
+  var visible = pomVisible(el);
+  states[locators[i][0]] = [
+    visible ? (el.innerText || '').trim() : '',
+    'value' in el && typeof el.value === 'string' ? el.value : null,
+    visible,
+    !(el.matches && el.matches(':disabled')),
+    names.map(function (name) { return el.getAttribute(name); })
+  ];
+}
+return states;
+"""
+
+# arguments: by, value, start, count, [attribute name, ...], with elements, scroll last, step
+# Reads count of the elements a collection locator matches, every step-th one from start. With scroll last, the last
+# matched element is then scrolled into view, which makes virtualized lists render their next rows.
+# returns {total: number matched, rows: [[text, [attribute values]], ...], elements: [WebElement, ...] or null}
+COLLECTION_ROWS = _HELPERS + """
+var all = pomFind(arguments[0], arguments[1]), rows = [], names = arguments[4], slice = [];
+for (var n = arguments[2]; n < all.length && slice.length < arguments[3]; n += arguments[7]) slice.push(all[n]);
+for (var i = 0; i < slice.length; i++) {
+  rows.push([(slice[i].innerText || slice[i].textContent || '').trim(),
+             names.map(function (name) { return slice[i].getAttribute(name); })]);
+}
+if (arguments[6] && all.length) all[all.length - 1].scrollIntoView({block: 'end'});
+return {total: all.length, rows: rows, elements: arguments[5] ? slice : null};
+"""
+
+# arguments: by, value, text
+# returns the index of the first element the collection locator matches whose text contains text, and the element
+COLLECTION_FIND = _HELPERS + """
+var all = pomFind(arguments[0], arguments[1]);
+for (var i = 0; i < all.length; i++) {
+  if ((all[i].innerText || all[i].textContent || '').indexOf(arguments[2]) !== -1) return [i, all[i]];
+}
+return null;
+"""
+
+# asynchronous: arguments kind, payload, timeout ms, recheck interval ms, callback
+# Resolves as soon as the condition holds rather than on a polling interval: it re-checks on every DOM mutation
+# (which includes <title> changes), on readystatechange and load, and every interval ms for changes that only CSS
+# makes.
+# The kinds are "title" (payload is a substring), "locators" (payload as for LOCATOR_STATES), "activate"
+# (payload [by, value, border] as for ACTIVATE_ELEMENT) and "settle" (payload is how many milliseconds SETTLE_STATE
+# must stay quiet, checked every animation frame). For "locators" the value is {pending: [...], appeared: {alias: ms
+# after the script started that it was first seen visible}}.
+# Calls back with {ok: true, value: result} or, after the timeout, {ok: false, value: whatever is still pending}
+WAIT_FOR = _HELPERS + """
+var kind = arguments[0], payload = arguments[1], timeout = arguments[2], interval = arguments[3];
+var done = arguments[arguments.length - 1];
+var started = Date.now(), appeared = {}, quietSince = null;
+var check = function () {
+  if (kind === 'settle') {
+    var busy = pomBusy(), now = Date.now();
+    quietSince = busy.length ? null : (quietSince === null ? now : quietSince);
+    return {ok: quietSince !== null && now - quietSince >= payload, value: busy};
+  }
+  if (kind === 'title') return {ok: document.title.indexOf(payload) !== -1, value: document.title};
+  if (kind === 'locators') {
+    var pending = pomPending(payload), waiting = {}, elapsed = Date.now() - started;
+    pending.forEach(function (p) { waiting[p[0]] = true; });
+    payload.forEach(function (l) { if (!waiting[l[0]] && !(l[0] in appeared)) appeared[l[0]] = elapsed; });
+    return {ok: pending.length === 0, value: {pending: pending, appeared: appeared}};
+  }
+  var el = pomActivate(payload[0], payload[1], payload[2]);
+  return {ok: !!el, value: el};
+};
+var finished = false, observer = null, poller = null, timer = null;
+var finish = function (result) {
+  if (finished) return;
+  finished = true;
+  if (observer) observer.disconnect();
+  clearInterval(poller);
+  clearTimeout(timer);
+  document.removeEventListener('readystatechange', attempt);
+  window.removeEventListener('load', attempt);
+  done(result);
+};
+var attempt = function () {
+  var result = check();
+  if (result.ok) finish(result);
+};
+attempt();
+if (!finished) {
+  observer = new MutationObserver(attempt);
+  observer.observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+  document.addEventListener('readystatechange', attempt);
+  window.addEventListener('load', attempt);
+  poller = setInterval(attempt, kind === 'settle' ? 16 : interval);
+  timer = setTimeout(function () { finish(check()); }, timeout);
+}
+"""
+
+
+def locator_args(locators, aliases=None):
+    """
+    Flatten a page locators dict into the [alias, by, value] form the scripts take
+    :param locators: a PageFactory locators dict
+    :param aliases: optional subset of the keys to include, defaults to all of them
+    :return: list
+    """
+    if aliases is None:
+        aliases = locators.keys()
+    return [[alias, locators[alias][0], locators[alias][1]] for alias in aliases]
@@ -0,0 +1,65 @@
+# Immutable records of what a page looked like at one moment, read for every locator in one script call.
+# Cheap to take, so assertions can look at a whole page at once, and two snapshots can be diffed between steps.
+import collections
+from collections.abc import Mapping
+from types import MappingProxyType
+
+# present: the locator matched an element, when False the other fields are empty
+# attributes: ((name, value), ...) for the attribute names asked for, value None when not set
+ElementState = collections.namedtuple("ElementState", "present text value visible enabled attributes")
+MISSING = ElementState(False, "", None, False, False, ())
+
+
+class PageSnapshot(Mapping):
+    """
+    Locator alias -> ElementState, for one page class at one moment
+    """
+    __slots__ = ("page", "_states")
+
+    def __init__(self, page, states):
+        """
+        :param page: page class name
+        :param states: dict of alias -> ElementState
+        """
+        object.__setattr__(self, "page", page)
+        object.__setattr__(self, "_states", MappingProxyType(dict(states)))
+
+    @classmethod
+    def from_script(cls, page, raw, attribute_names):
+        """
+        Build a snapshot from what PageScripts.SNAPSHOT returned
+        """
+        states = {}
+        for alias, state in raw.items():
+            if state is None:
+                states[alias] = MISSING
+            else:
+                text, value, visible, enabled, values = state
+                states[alias] = ElementState(True, text, value, visible, enabled,
+                                             tuple(zip(attribute_names, values)))
+        return cls(page, states)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("PageSnapshot is read-only")
+
+    def __getitem__(self, alias):
+        return self._states[alias]
+
+    def __iter__(self):
+        return iter(self._states)
+
+    def __len__(self):
+        return len(self._states)
+
+    def diff(self, later):
+        """
+        What changed between this snapshot and a later one
+        :param later: another PageSnapshot
+        :return: dict of alias -> (state here, state later) for every locator that differs
+        """
+        aliases = list(self) + [alias for alias in later if alias not in self]
+        return {alias: (self.get(alias, MISSING), later.get(alias, MISSING)) for alias in aliases
+                if self.get(alias, MISSING) != later.get(alias, MISSING)}
+
+    def __repr__(self):
+        return f"PageSnapshot({self.page}, {dict(self._states)!r})"
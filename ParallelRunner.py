@@ -0,0 +1,324 @@
+# Runs the tests of one or more test modules in parallel, one test at a time per worker process. Every worker
+# imports the tests itself, so it gets its own browser sessions and its own fixture web server on a free port (see
+# PageBaseTest.setUpClass). The results are replayed into a single unittest report.
+#
+# How long each test took is kept in a history file, and the next run hands out the longest tests first, so that a
+# slow end to end chain does not start last and leave the other workers idle while it finishes. A test with no
+# history yet is guessed to take as long as the typical test of its class. The same estimates split the suite into
+# shards of about equal total time, for spreading it over several machines. The machines only agree on the shards
+# when they read the same history, so sharded runs must be given one shared file, and leave it alone: each machine
+# writes what it measured to its own file, which are merged into the shared history once all of them are done.
+#
+#   python ParallelRunner.py main --workers 4
+#   python ParallelRunner.py main --shards 3 --shard-index 0 --history shared.json --durations shard0.json
+#   python ParallelRunner.py --history shared.json --merge shard0.json shard1.json shard2.json
+#   python ParallelRunner.py main --shards 3 --history shared.json --list-shards     print the shards as json
+#
+import argparse
+import os
+import sys
+import json
+import time
+import heapq
+import unittest
+import importlib
+import statistics
+from multiprocessing.util import Finalize
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from TestBase import CACHE_DIR
+from Helpers import atomic_write_json
+
+HISTORY_RUNS = 5  # most recent durations kept per test
+DEFAULT_ESTIMATE = 5.0  # seconds, for a new test when there is no history at all
+
+
+class DurationHistory(object):
+    """
+    Recent durations of each test, by test id, kept in a json file
+    """
+    def __init__(self, path=os.path.join(CACHE_DIR, "durations.json")):
+        self.path = path
+        try:
+            with open(path) as f:
+                self._runs = json.load(f)
+        except (OSError, ValueError):
+            self._runs = {}
+
+    def record(self, test_id, seconds):
+        runs = self._runs.setdefault(test_id, [])
+        runs.append(round(seconds, 3))
+        del runs[:-HISTORY_RUNS]
+
+    def estimate(self, test_id):
+        """
+        :return: seconds the test is expected to take, the median of its recent runs, or for a new test the
+            median estimate of the other tests in its class, else of the whole suite, else DEFAULT_ESTIMATE
+        """
+        runs = self._runs.get(test_id)
+        if runs:
+            return statistics.median(runs)
+        test_class = test_id.rsplit(".", 1)[0]
+        known = [statistics.median(runs) for other, runs in self._runs.items()
+                 if other.rsplit(".", 1)[0] == test_class]
+        known = known or [statistics.median(runs) for runs in self._runs.values()]
+        return statistics.median(known) if known else DEFAULT_ESTIMATE
+
+    def save(self):
+        try:
+            atomic_write_json(self.path, self._runs, indent=1, sort_keys=True)
+        except OSError:
+            pass  # the next run just schedules on estimates
+
+
+def longest_first(test_ids, history):
+    """
+    :return: the test ids, longest expected first
+    """
+    return sorted(test_ids, key=lambda test_id: (-history.estimate(test_id), test_id))
+
+
+def make_shards(test_ids, shards, history):
+    """
+    Split tests into shards of about equal expected time, longest first, each into the shard with least so far.
+    Only machines computing this from the same history file get the same shards, see main
+    :return: list of shards, each a list of test ids
+    """
+    bins = [(0.0, index, []) for index in range(shards)]
+    for test_id in longest_first(test_ids, history):
+        total, index, tests = heapq.heappop(bins)
+        tests.append(test_id)
+        heapq.heappush(bins, (total + history.estimate(test_id), index, tests))
+    return [tests for _, _, tests in sorted(bins, key=lambda shard: shard[1])]
+
+
+class _RecordingResult(unittest.TestResult):
+    """
+    Worker side result, keeps just enough of each outcome to send it back to the parent process
+    """
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self._started = {}
+
+    def startTest(self, test):
+        super().startTest(test)
+        self._started[test.id()] = time.perf_counter()
+
+    def _record(self, test, outcome, detail=None):
+        started = self._started.pop(test.id(), None)
+        duration = time.perf_counter() - started if started is not None else 0.0
+        description = test.shortDescription() if hasattr(test, "shortDescription") else None
+        self.records.append((test.id(), str(test), description, outcome, detail, duration))
+
+    def addSuccess(self, test):
+        super().addSuccess(test)
+        self._record(test, "success")
+
+    def addFailure(self, test, err):
+        super().addFailure(test, err)
+        self._record(test, "failure", self.failures[-1][1])
+
+    def addError(self, test, err):
+        super().addError(test, err)
+        self._record(test, "error", self.errors[-1][1])
+
+    def addSkip(self, test, reason):
+        super().addSkip(test, reason)
+        self._record(test, "skip", reason)
+
+    def addExpectedFailure(self, test, err):
+        super().addExpectedFailure(test, err)
+        self._record(test, "expected_failure", self.expectedFailures[-1][1])
+
+    def addUnexpectedSuccess(self, test):
+        super().addUnexpectedSuccess(test)
+        self._record(test, "unexpected_success")
+
+
+def _start_worker():
+    """
+    Worker initializer. Pool workers leave through os._exit, which skips atexit, so the clean ups that the tests
+    rely on atexit for are registered to run when the worker shuts down instead, highest priority first
+    """
+    import TestBase
+    from LatencyStore import LATENCIES
+    Finalize(None, TestBase.failure_writer.flush, exitpriority=40)  # captures still queued
+    Finalize(None, LATENCIES.flush, exitpriority=30)
+    Finalize(None, TestBase.WebAppBase.session_pool.close, exitpriority=20)  # quit the browsers
+    Finalize(None, lambda: TestBase._log_listener.stop(), exitpriority=10)  # print what they logged meanwhile
+
+
+def _run_test(test_id):
+    """
+    Worker entry point: run one test, its class set up and torn down around it
+    :return: list of result records
+    """
+    suite = unittest.defaultTestLoader.loadTestsFromName(test_id)
+    result = _RecordingResult()
+    suite(result)
+    return result.records
+
+
+class _RemoteTest(object):
+    """
+    Stands in for a test that ran in a worker process, so that the parent's TextTestResult can report it
+    """
+    def __init__(self, test_id, name, description):
+        self._id = test_id
+        self._name = name
+        self._description = description
+
+    def id(self):
+        return self._id
+
+    def shortDescription(self):
+        return self._description
+
+    def __str__(self):
+        return self._name
+
+
+class MergedResult(unittest.TextTestResult):
+    """
+    A TextTestResult that accepts already formatted tracebacks from the workers
+    """
+    def _exc_info_to_string(self, err, test):
+        if isinstance(err, str):
+            return err
+        return super()._exc_info_to_string(err, test)
+
+
+class ParallelSuite(object):
+    """
+    Something TextTestRunner.run() can run: fans the tests out over a process pool, longest first, and replays the
+    results into the runner's result object as they come back
+    """
+    def __init__(self, test_ids, workers, history=None, record=True):
+        """
+        :param test_ids: tests to run, "module.Class.test_method"
+        :param workers: number of worker processes
+        :param history: a DurationHistory to order the tests by, or None
+        :param record: also record the durations in the history and save it
+        """
+        self.test_ids = longest_first(test_ids, history) if history else list(test_ids)
+        self.workers = workers
+        self.history = history if record else None
+        self.durations = {}  # test id -> seconds, as measured in the workers
+
+    def __call__(self, result):
+        # the pool hands tests out in the order they were submitted, so idle workers always take the longest left
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_start_worker) as pool:
+            futures = {pool.submit(_run_test, test_id): test_id for test_id in self.test_ids}
+            for future in as_completed(futures):
+                try:
+                    records = future.result()
+                except Exception as ex:  # the worker died, report the test as an error
+                    test_id = futures[future]
+                    records = [(test_id, test_id, None, "error", f"Worker failed: {ex!r}\n", None)]
+                for record in records:
+                    self._replay(result, *record)
+                if result.shouldStop:
+                    pool.shutdown(wait=False, cancel_futures=True)  # drop the tests not started yet
+                    break
+        if self.history:
+            self.history.save()
+        return result
+
+    def _replay(self, result, test_id, name, description, outcome, detail, duration):
+        if duration is not None and outcome != "skip":  # a skip says nothing about how long the test takes
+            self.durations[test_id] = duration
+            if self.history:
+                self.history.record(test_id, duration)
+        test = _RemoteTest(test_id, name, description)
+        result.startTest(test)
+        if outcome == "success":
+            result.addSuccess(test)
+        elif outcome == "failure":
+            result.addFailure(test, detail)
+        elif outcome == "error":
+            result.addError(test, detail)
+        elif outcome == "skip":
+            result.addSkip(test, detail)
+        elif outcome == "expected_failure":
+            result.addExpectedFailure(test, detail)
+        else:
+            result.addUnexpectedSuccess(test)
+        result.stopTest(test)
+
+    def countTestCases(self):
+        return len(self.test_ids)
+
+
+def find_test_classes(module_names):
+    """
+    :param module_names: importable test module names
+    :return: list of (module name, class name) for every TestCase class that has tests
+    """
+    classes = []
+    for module_name in module_names:
+        module = importlib.import_module(module_name)
+        for name in sorted(dir(module)):
+            obj = getattr(module, name)
+            if (isinstance(obj, type) and issubclass(obj, unittest.TestCase) and obj.__module__ == module_name
+                    and unittest.defaultTestLoader.getTestCaseNames(obj)):
+                classes.append((module_name, name))
+    return classes
+
+
+def find_tests(module_names):
+    """
+    :return: the ids of every test in the modules' TestCase classes
+    """
+    return [f"{module_name}.{class_name}.{method}" for module_name, class_name in find_test_classes(module_names)
+            for method in unittest.defaultTestLoader.getTestCaseNames(getattr(sys.modules[module_name], class_name))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run test classes in parallel worker processes")
+    parser.add_argument("modules", nargs="*", help="test modules, for example: main")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("-v", "--verbose", action="store_const", const=2, default=1, dest="verbosity")
+    parser.add_argument("--history", default=None,
+                        help="file of test durations from earlier runs, default durations.json in the cache folder")
+    parser.add_argument("--shards", type=int, default=1, help="split the tests over this many machines")
+    parser.add_argument("--shard-index", type=int, default=0, help="which shard to run, from 0")
+    parser.add_argument("--list-shards", action="store_true", help="print the shards as json and exit")
+    parser.add_argument("--durations", default=None, help="write the durations measured in this run to this file")
+    parser.add_argument("--merge", nargs="+", metavar="FILE", default=None,
+                        help="add --durations files from sharded runs to the history, and exit")
+    args = parser.parse_args(argv)
+    if not 0 <= args.shard_index < args.shards:
+        parser.error(f"--shard-index must be from 0 to {args.shards - 1}")
+    if args.shards > 1 and args.history is None:
+        parser.error("--shards needs --history, a durations file every machine shares, or their shards differ")
+    if not args.modules and not args.merge:
+        parser.error("name the test modules to run")
+    history = DurationHistory(args.history or os.path.join(CACHE_DIR, "durations.json"))
+    if args.merge:
+        for path in args.merge:
+            with open(path) as f:
+                for test_id, seconds in json.load(f).items():
+                    history.record(test_id, seconds)
+        history.save()
+        return 0
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())  # like python -m unittest, find test modules in the current directory
+
+    shards = make_shards(find_tests(args.modules), args.shards, history)
+    if args.list_shards:
+        print(json.dumps([{"estimate": round(sum(history.estimate(test_id) for test_id in shard), 1),
+                           "tests": shard} for shard in shards], indent=1))
+        return 0
+    # a sharded run only measured its own shard, it must not change the history the other machines read
+    suite = ParallelSuite(shards[args.shard_index], args.workers, history, record=args.shards == 1)
+    runner = unittest.TextTestRunner(verbosity=args.verbosity, resultclass=MergedResult)
+    result = runner.run(suite)
+    if args.durations:
+        with open(args.durations, "w") as f:
+            json.dump(suite.durations, f, indent=1, sort_keys=True)
+    return 0 if result.wasSuccessful() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
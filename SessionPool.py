@@ -0,0 +1,159 @@
+# A pool of warm browser sessions. Starting a browser costs seconds, so instead of starting one in every test
+# setUp, tests lease a session from the pool and hand it back when they are done. The pool wipes the browser
+# state between leases, and retires sessions that have been used too often or that stop responding.
+import atexit
+import threading
+import urllib.parse
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.remote.command import Command
+
+DEFAULT_MAX_USES = 25  # retire a browser after this many tests, long lived browsers tend to bloat
+
+# clear web storage for the current origin, some browsers refuse storage access on about:blank
+RESET_STORAGE_SCRIPT = """
+try { window.localStorage.clear(); } catch (e) {}
+try { window.sessionStorage.clear(); } catch (e) {}
+"""
+
+
+def _origin(url):
+    """
+    :return: scheme://host:port of an http(s) url, None for anything else
+    """
+    parts = urllib.parse.urlsplit(url or "")
+    if parts.scheme in ("http", "https") and parts.netloc:
+        return f"{parts.scheme}://{parts.netloc}"
+    return None
+
+
+class SessionPool(object):
+    """
+    Leases webdriver sessions, keyed by browser name
+    """
+    def __init__(self, factory, max_uses=DEFAULT_MAX_USES, log=None):
+        """
+        :param factory: callable taking a browser name and returning a new webdriver
+        :param max_uses: number of leases after which a session is quit rather than reused
+        :param log: optional Logger
+        """
+        self._factory = factory
+        self.max_uses = max_uses
+        self._log = log
+        self._lock = threading.Lock()
+        self._idle = {}  # browser name -> [webdriver, ...]
+        self._uses = {}  # webdriver -> number of times leased
+        atexit.register(self.close)
+
+    def lease(self, browser):
+        """
+        Get a browser session, a warm one if the pool has one idle, else a newly started one
+        :param browser: browser name
+        :return: webdriver
+        """
+        while True:
+            with self._lock:
+                idle = self._idle.get(browser)
+                driver = idle.pop() if idle else None
+            if driver is None:
+                break
+            if self._is_healthy(driver):
+                self._trace(f"lease warm {browser} session")
+                return driver
+            self._retire(driver)
+        self._trace(f"lease new {browser} session")
+        driver = self._factory(browser)
+        self._track_origins(driver)
+        with self._lock:
+            self._uses[driver] = 0
+        return driver
+
+    def release(self, driver, browser):
+        """
+        Hand a leased session back, it is reset for the next test or retired
+        :param driver: a webdriver returned by lease()
+        :param browser: browser name it was leased for
+        """
+        with self._lock:
+            self._uses[driver] = self._uses.get(driver, 0) + 1
+            worn_out = self._uses[driver] >= self.max_uses
+        if worn_out or not self._reset(driver):
+            self._retire(driver)
+            return
+        with self._lock:
+            self._idle.setdefault(browser, []).append(driver)
+
+    def close(self):
+        """
+        Quit every idle session
+        """
+        with self._lock:
+            drivers = [driver for idle in self._idle.values() for driver in idle]
+            self._idle = {}
+        for driver in drivers:
+            self._retire(driver)
+
+    @staticmethod
+    def _track_origins(driver):
+        """
+        Note the origin of every url the session is sent to with get(), cookies and web storage belong to an
+        origin and can only be wiped from a page of that origin
+        """
+        origins = driver._pom_origins = set()
+        send = driver.execute
+
+        def execute(driver_command, params=None):
+            if driver_command == Command.GET:
+                origin = _origin((params or {}).get("url"))
+                if origin:
+                    origins.add(origin)
+            return send(driver_command, params)
+
+        driver.execute = execute
+
+    def _reset(self, driver):
+        """
+        Close extra windows, wipe cookies and web storage, and park the session on about:blank.
+        The wipe runs on the current page and then on the root page of every other origin the test opened with
+        get(), one page load per origin. An origin the test only reached through a link or a redirect, and then
+        left, is not known to the pool and keeps its cookies and storage.
+        :return: False if the session did not survive the reset
+        """
+        try:
+            handles = driver.window_handles
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(handles[0])
+            driver.execute_script(RESET_STORAGE_SCRIPT)
+            driver.delete_all_cookies()
+            origins = getattr(driver, "_pom_origins", set())
+            for origin in sorted(origins - {_origin(driver.current_url)}):
+                driver.get(origin + "/")
+                driver.execute_script(RESET_STORAGE_SCRIPT)
+                driver.delete_all_cookies()
+            origins.clear()
+            driver.get("about:blank")
+            return True
+        except WebDriverException as ex:
+            self._trace(f"session reset failed: {ex}")
+        return False
+
+    @staticmethod
+    def _is_healthy(driver):
+        try:
+            driver.current_url
+            return True
+        except WebDriverException:
+            return False
+
+    def _retire(self, driver):
+        with self._lock:
+            self._uses.pop(driver, None)
+        try:
+            driver.quit()
+        except WebDriverException:
+            pass  # already dead, which is probably why it is being retired
+
+    def _trace(self, message):
+        if self._log:
+            self._log.log(message)
@@ -0,0 +1,103 @@
+# Logged in browser sessions that can be put back, so that tests skip driving the login pages. After a real login
+# the session's cookies, localStorage and sessionStorage are saved, keyed by app and user, along with the page the
+# login ended on; later tests load them into a fresh browser and open that page again. Snapshots expire after a time to live, or when one of their cookies does, and they
+# are kept on disk under the cache folder so that parallel workers and later runs share them. They hold live
+# credentials, so the files are only readable by their owner.
+import os
+import re
+import json
+import time
+import threading
+import urllib.parse
+
+from PageScripts import READ_STORAGE, WRITE_STORAGE
+from Helpers import atomic_write_json
+
+SESSION_TTL = 30 * 60  # seconds a snapshot is trusted for
+
+
+class SessionStore(object):
+    """
+    Session snapshots, in memory and as json files in a folder
+    """
+    def __init__(self, folder, ttl=SESSION_TTL):
+        """
+        :param folder: where to keep the snapshot files, created when first needed
+        :param ttl: seconds before a snapshot expires
+        """
+        self.folder = folder
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshots = {}
+
+    def _path(self, app, user):
+        return os.path.join(self.folder, re.sub(r"[^\w.-]", "_", f"{app}-{user}") + ".json")
+
+    def save(self, driver, app, user):
+        """
+        Snapshot the session of the page the driver is on
+        :param app: name of the web app, or its base url
+        :param user: who is logged in
+        """
+        storage = driver.execute_script(READ_STORAGE) or {}
+        snapshot = {"url": driver.current_url, "saved": time.time(), "cookies": driver.get_cookies(),
+                    "local": storage.get("local", {}), "session": storage.get("session", {})}
+        with self._lock:
+            self._snapshots[(app, user)] = snapshot
+        try:
+            atomic_write_json(self._path(app, user), snapshot, mode=0o600)
+        except OSError:
+            pass  # still good for this process
+
+    def load(self, app, user):
+        """
+        :return: the snapshot, or None if there is none or it has expired
+        """
+        with self._lock:
+            snapshot = self._snapshots.get((app, user))
+        if snapshot is None:
+            try:
+                with open(self._path(app, user)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                return None
+        now = time.time()
+        expires = [cookie["expiry"] for cookie in snapshot["cookies"] if "expiry" in cookie]
+        if now - snapshot["saved"] > self.ttl or (expires and min(expires) <= now):
+            self.forget(app, user)
+            return None
+        return snapshot
+
+    def restore(self, driver, app, user, url):
+        """
+        Put a snapshot back into the browser. Cookies and storage can only be set for the page the browser is on,
+        so this opens url, on the same site as the snapshot, first. Then it opens the page the snapshot was saved
+        on, at the same path under url, which a logged out browser usually gets redirected away from
+        :param url: a page of the app to open first
+        :return: the url of the saved page it opened, or None if there is no usable snapshot
+        """
+        snapshot = self.load(app, user)
+        if snapshot is None:
+            return None
+        driver.get(url)
+        host = urllib.parse.urlsplit(url).hostname
+        for cookie in snapshot["cookies"]:
+            cookie = dict(cookie)
+            domain = cookie.pop("domain", host).lstrip(".")
+            if domain and host != domain and not host.endswith("." + domain):
+                continue  # a cookie for another site, which the browser would refuse
+            driver.add_cookie(cookie)
+        driver.execute_script(WRITE_STORAGE, snapshot["local"], snapshot["session"])
+        # the saved url may be from another run's fixture server, keep only where on the site it was
+        saved = urllib.parse.urlsplit(snapshot["url"])
+        page = urllib.parse.urljoin(url, urllib.parse.urlunsplit(("", "", saved.path, saved.query, "")))
+        driver.get(page)
+        return page
+
+    def forget(self, app, user):
+        with self._lock:
+            self._snapshots.pop((app, user), None)
+        try:
+            os.remove(self._path(app, user))
+        except OSError:
+            pass
@@ -0,0 +1,146 @@
+# Several page object flows sharing one browser, one tab each. A browser per flow costs hundreds of MB; a tab costs
+# a fraction of that. Every tab gets a TabDriver, which stands in for the webdriver: pages, stubs and the
+# WebElements they find all send their commands through it, and it switches the browser to its tab before each
+# one. A browser session runs one command at a time, so tabs take turns command by command, and their waits poll
+# (rather than waiting inside the page, see WaitEngine) so that other tabs get on with their work in between.
+#
+#   with TabMultiplexer(app) as tabs:
+#       results = tabs.run([lambda tab: DemoLoginPageUsernameV2(driver=tab, url=...).login_to_profile(...),
+#                           lambda tab: WelcomePage(tab, url=...).submit("first", "last")])
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from selenium.webdriver.remote.command import Command
+
+_MISSING = object()
+_OWN = ("_real", "_mux", "handle", "execute")  # TabDriver attributes that are not the shared driver's
+
+
+class TabDriver(object):
+    """
+    The webdriver as seen from one tab. Driver methods run with the TabDriver as self, so WebElements they
+    create send their commands back through it, and driver state is read from and written to the real driver
+    """
+    def __init__(self, mux, handle):
+        object.__setattr__(self, "_real", mux.driver)
+        object.__setattr__(self, "_mux", mux)
+        object.__setattr__(self, "handle", handle)
+        object.__setattr__(self, "_pom_async_waits", False)  # poll, an async wait would hold the session
+
+    def execute(self, driver_command, params=None):
+        real = self._real
+        with self._mux.lock:
+            self._mux.switch(self.handle)
+            return type(real).execute(self, driver_command, params)
+
+    def __getattr__(self, name):
+        if name.startswith("_pom_"):
+            raise AttributeError(name)  # per tab, see __setattr__
+        real = self._real
+        static = inspect.getattr_static(type(real), name, _MISSING)
+        if hasattr(type(static), "__set__"):  # a property, run its getter against us
+            return static.__get__(self, type(real))
+        if name in vars(real):
+            return vars(real)[name]
+        if hasattr(type(static), "__get__"):  # a method, bind it to us
+            return static.__get__(self, type(real))
+        if static is not _MISSING:
+            return static
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        # instrument() replaces execute, and the _pom_ attributes are per tab, everything else is the driver's
+        if name in _OWN or name.startswith("_pom_"):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._real, name, value)
+
+
+class _TabApp(object):
+    """
+    What page objects get as their base in a tab: the app, with the tab's driver
+    """
+    def __init__(self, app, driver):
+        self._app = app
+        self.webdriver = driver
+
+    def get_webdriver(self):
+        return self.webdriver
+
+    def get(self, url):
+        self.webdriver.get(self.rewrite_url(url))
+
+    def __getattr__(self, name):
+        return getattr(self._app, name)
+
+
+class TabMultiplexer(object):
+    """
+    Opens tabs in an app's browser and runs flows in them side by side
+    """
+    def __init__(self, app):
+        """
+        :param app: a WebAppBase (such as the test) whose browser to share
+        """
+        self.app = app
+        self.driver = app.get_webdriver()
+        self.lock = threading.RLock()
+        self._current = self._raw(Command.W3C_GET_CURRENT_WINDOW_HANDLE)
+        self._home = self._current
+        self.tabs = []
+
+    def _raw(self, command, params=None):
+        return type(self.driver).execute(self.driver, command, params)["value"]
+
+    def switch(self, handle):
+        # call with the lock held
+        if handle != self._current:
+            self._raw(Command.SWITCH_TO_WINDOW, {"handle": handle})
+            self._current = handle
+
+    def open_tab(self):
+        """
+        :return: a base for page objects, bound to a new tab; the first tab reuses the browser's own window
+        """
+        with self.lock:
+            if self.tabs:
+                handle = self._raw(Command.NEW_WINDOW, {"type": "tab"})["handle"]
+            else:
+                handle = self._home
+            tab = _TabApp(self.app, TabDriver(self, handle))
+            self.tabs.append(tab)
+        return tab
+
+    def run(self, flows):
+        """
+        Run flows concurrently, each in its own tab and thread
+        :param flows: callables taking the tab (use it where you would use the test: as the page object base, or
+            with WebApplicationStub)
+        :return: their results, in order
+        :raises: the first exception a flow raised, once all of them have finished
+        """
+        tabs = self.tabs[:len(flows)]
+        while len(tabs) < len(flows):
+            tabs.append(self.open_tab())
+        with ThreadPoolExecutor(max_workers=len(flows), thread_name_prefix="tab") as pool:
+            futures = [pool.submit(flow, tab) for flow, tab in zip(flows, tabs)]
+        return [future.result() for future in futures]
+
+    def close(self):
+        """
+        Close the tabs this opened, and go back to the browser's own window
+        """
+        with self.lock:
+            for tab in self.tabs:
+                if tab.webdriver.handle != self._home:
+                    self.switch(tab.webdriver.handle)
+                    self._raw(Command.CLOSE)
+                    self._current = None
+            self.switch(self._home)
+            self.tabs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,41 +1,205 @@
 # unit testing fixtures, replace these with your test framework's own classes and fixtures
+# The browser specific selenium and webdriver_manager modules are only imported by the WrapDriver that needs them,
+# importing this module should cost next to nothing.
+import os
+import re
 import sys
+import json
+import time
+import queue
+import atexit
+import shutil
+import logging
+import logging.handlers
 import unittest
-import datetime
-from selenium import webdriver
-from webdriver_manager.chrome import ChromeDriverManager
-from webdriver_manager.firefox import GeckoDriverManager
-from selenium.webdriver.firefox.firefox_binary import FirefoxBinary
+import subprocess
+import collections
+import urllib.parse
 from WebServer import WebServer
+from SessionPool import SessionPool, RESET_STORAGE_SCRIPT
+from SessionSnapshot import SessionStore
+from FailureCapture import FailureWriter
+from Helpers import atomic_write_json
 
 
 DEFAULT_TIMEOUT = 20
+FIXTURE_URL = "http://localhost:8080"  # tests are written against this, it is rewritten to the real fixture server
+CACHE_DIR = os.environ.get("POM_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "pom"))
+FAILURE_DIR = os.environ.get("POM_FAILURE_DIR", os.path.join(CACHE_DIR, "failures"))
+failure_writer = FailureWriter(FAILURE_DIR)
+LOG_LEVEL = os.environ.get("POM_LOG_LEVEL", "INFO").upper()  # DEBUG shows every element access
+LOG_BUFFER = os.environ.get("POM_LOG_BUFFER", "1") != "0"  # hold each test's log back, and only show it on failure
+LOG_BUFFER_LINES = 2000  # the most recent lines kept per test
+
+
+class _Formatter(logging.Formatter):
+    converter = time.gmtime
+
+    def format(self, record):
+        record.prefix = record.name.rpartition(".")[2]
+        return super().format(record)
+
+
+class _LogRouter(logging.handlers.QueueHandler):
+    """
+    Hands log records to a listener thread that prints them, so logging never waits on stdout. While a test runs
+    with LOG_BUFFER, the records go into the test's buffer instead, see PageBaseTest.run
+    """
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.buffer = None
+
+    def emit(self, record):
+        buffer = self.buffer
+        if buffer is not None:
+            buffer.append(record)  # formatted later, if the test fails
+        else:
+            super().emit(record)
+
+
+def _start_logging():
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(_Formatter("[%(asctime)s][%(prefix)s] %(message)s", "%H:%M:%S"))
+    listener = logging.handlers.QueueListener(_log_queue, console)
+    listener.start()
+    return listener
+
+
+_log_queue = queue.SimpleQueue()
+_log_router = _LogRouter(_log_queue)
+_log_formatter = _Formatter("[%(asctime)s][%(prefix)s] %(levelname)s %(message)s", "%H:%M:%S")
+_pom_logger = logging.getLogger("pom")
+_pom_logger.setLevel(LOG_LEVEL)
+_pom_logger.addHandler(_log_router)
+_pom_logger.propagate = False
+_log_listener = _start_logging()
+atexit.register(lambda: _log_listener.stop())
+if hasattr(os, "register_at_fork"):  # the listener thread does not survive into forked worker processes
+    os.register_at_fork(after_in_child=lambda: globals().update(_log_listener=_start_logging()))
 
 
 class Logger(object):
+    """
+    A named logger on top of stdlib logging. Messages take %-style arguments, which are only formatted when the
+    level is enabled, so hot paths should log at debug level with arguments rather than f-strings:
+        self.debug("__getattr__ %s", alias)
+    """
     def __init__(self, name):
         self.name = name
+        self._logger = logging.getLogger(f"pom.{name}")
 
-    def log(self, message):
-        time = datetime.datetime.utcnow().strftime("%H:%M:%S")
-        print(f"[{time}][{self.name}] {message}")
+    def log(self, message, *args, level=logging.INFO):
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, message, *args)
+
+    def debug(self, message, *args):
+        if self._logger.isEnabledFor(logging.DEBUG):
+            self._logger.debug(message, *args)
+
+    def warning(self, message, *args):
+        self._logger.warning(message, *args)
 
 
 class POMException(Exception):
     def __init__(self, driver, msg):
-        self.url = driver.current_url
+        """
+        Raising costs nothing beyond the exception, the browser state is only captured (see capture) when the
+        exception escapes a PageBaseTest test, so exceptions that are caught and expected stay cheap
+        :param driver: the webdriver to capture from, an AsyncWebDriver, or None
+        """
+        super().__init__(msg)
+        self.driver = driver
         self.msg = msg
-        # take a screenshot and link it
-        file = self.get_temp_filename()
-        driver.get_screenshot_as_file(file)
-        self.screenshot = file
+        self.url = None  # these are filled in by capture
+        self.screenshot = None
+        self.dom = None
+        self.report = None
+
+    def capture(self, test_id, writer=None, log=()):
+        """
+        Grab the screenshot, page source and url now, and have them written in the background, see FailureCapture
+        :param test_id: the failing test
+        :param writer: optional FailureWriter, defaults to the one writing to FAILURE_DIR
+        :param log: the test's log lines, to keep in the failure report
+        """
+        if self.report:
+            return
+        if self.driver is None:
+            return  # nothing to capture from
+        if hasattr(self.driver, "grab_evidence"):  # an AsyncWebDriver, its reads are coroutines
+            self.url, png, html = self.driver.grab_evidence()
+        else:
+            self.url = self.driver.current_url
+            png = self.driver.get_screenshot_as_png()
+            html = self.driver.page_source
+        self.screenshot, self.dom, self.report = (writer or failure_writer).submit(test_id, self.msg, self.url,
+                                                                                  png, html, log)
+        self.args = (f"{self.msg}\nurl: {self.url}\nfailure report: {self.report}",)
+
+
+class DriverCache(object):
+    """
+    Remembers resolved driver binary paths on disk, so that new processes find their driver without asking
+    webdriver_manager (and the network) again. Keys name the driver version, see WrapDriver.cache_key
+    """
+    def __init__(self, path=os.path.join(CACHE_DIR, "drivers.json")):
+        self.path = path
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, key):
+        """
+        :param key: see WrapDriver.cache_key
+        :return: the cached path, if the binary is still there, else None
+        """
+        path = self._load().get(key)
+        if path and os.path.isfile(path):
+            return path
+        return None
+
+    def put(self, key, path):
+        entries = self._load()
+        entries[key] = path
+        atomic_write_json(self.path, entries, indent=1)  # parallel workers may race us
 
-    def get_temp_filename(self):
-        import tempfile
-        import os
-        return os.path.join(tempfile._get_default_tempdir(), next(tempfile._get_candidate_names()) + '.png')
 
 class WrapDriver(object):
+    driver_name = None  # name of the driver binary, looked for on the PATH before asking the manager
+    browser_binary = None  # name of the browser binary, asked for its version, see cache_key
+    driver_version = os.environ.get("POM_DRIVER_VERSION", "latest")
+
+    @classmethod
+    def browser_version(cls):
+        """
+        :return: the version of the installed browser, as its --version prints it, or None if it can't be told
+        """
+        binary = cls.browser_binary and shutil.which(cls.browser_binary)
+        if not binary:
+            return None
+        try:
+            output = subprocess.run([binary, "--version"], capture_output=True, text=True, timeout=30).stdout
+        except (OSError, subprocess.SubprocessError):
+            return None
+        match = re.search(r"\d+(\.\d+)+", output)
+        return match.group(0) if match else None
+
+    @classmethod
+    def cache_key(cls, browser):
+        """
+        :return: the DriverCache key for this driver. The latest driver is cached per installed browser version,
+            so that a browser upgrade resolves its driver again; None if that version can't be told, which skips
+            the cache
+        """
+        if cls.driver_version != "latest":
+            return f"{browser}:{cls.driver_version}"
+        version = cls.browser_version()
+        return f"{browser}:latest:{version}" if version else None
+
     @staticmethod
     def get_manager():
         raise NotImplemented
@@ -46,24 +210,35 @@ class WrapDriver(object):
 
 
 class WrapChrome(WrapDriver):
+    driver_name = "geckodriver"  # see get_driver, this is really Firefox
+    browser_binary = "firefox"
+
     @staticmethod
     def get_manager():
+        #from webdriver_manager.chrome import ChromeDriverManager
         #return ChromeDriverManager()
+        from webdriver_manager.firefox import GeckoDriverManager
         return GeckoDriverManager()
 
     @staticmethod
     def get_driver(bin_path):
+        from selenium import webdriver
         #return webdriver.Chrome(bin_path)
         return webdriver.Firefox(bin_path)
 
 
 class WrapFireFox(WrapDriver):
+    driver_name = "geckodriver"
+    browser_binary = "firefox"
+
     @staticmethod
     def get_manager():
+        from webdriver_manager.firefox import GeckoDriverManager
         return GeckoDriverManager()
 
     @staticmethod
     def get_driver(bin_path):
+        from selenium import webdriver
         ff_options = webdriver.FirefoxOptions()
         #'size': {'width': 1000, 'height': 1000},
         #'position': {'x': 0, 'y': 0}
@@ -76,18 +251,34 @@ class WrapFireFox(WrapDriver):
         return wd
 
 
+class WrapFake(WrapDriver):
+    driver_name = None  # no browser, so no driver binary either
+
+    @staticmethod
+    def get_driver(bin_path):
+        # browserless, see FakeDriver. Fixture pages are read straight from disk
+        from FakeDriver import FakeDriver
+        from WebServer import FIXTURE_ROOT
+        return FakeDriver(local_root=FIXTURE_ROOT)
+
+
 
 class WebAppBase(object):
     """
     Base class for a test case 'session' or 'App' , this is a wrapper for any
     webdriver messiness
     """
-    _path = None
-    webdriver = None
+    _paths = {}  # browser name -> driver binary path, for this process
+    _driver_cache = DriverCache()
+    webdriver = None  # each instance gets its own, see start_browser and lease_browser
+    fixture_base = None  # actual address of the fixture web server, replaces FIXTURE_URL in urls
     browser = "chrome"  # see set_browser
     _browsers = {"chrome": WrapChrome,
-                 "firefox" : WrapFireFox}
+                 "firefox" : WrapFireFox,
+                 "fake": WrapFake}
     log = Logger("BAS")
+    session_store = SessionStore(os.path.join(CACHE_DIR, "sessions"))
+    session_restored = False  # True once restore_session put a saved login back, pages can then skip ahead
 
     @classmethod
     def set_browser(cls, browser_name):
@@ -95,56 +286,209 @@ class WebAppBase(object):
             raise NotImplemented
         cls.browser = browser_name
 
-    @classmethod
-    def start_browser(cls):
+    def start_browser(self):
 
-        WebAppBase.webdriver = cls._browsers[cls.browser].get_driver(cls._get_drv_path())
+        self.webdriver = self._new_driver(self.browser)
+
+    def lease_browser(self):
+        """
+        Like start_browser, but takes a warm browser from the session pool when one is available
+        """
+        self.webdriver = WebAppBase.session_pool.lease(self.browser)
+
+    def release_browser(self):
+        """
+        Give a leased browser back to the session pool, which resets it for the next test
+        """
+        WebAppBase.session_pool.release(self.webdriver, self.browser)
+        self.webdriver = None
+
+    @classmethod
+    def _new_driver(cls, browser):
+        wrapper = cls._browsers[browser]
+        return wrapper.get_driver(cls._get_drv_path() if wrapper.driver_name else None)
 
     @classmethod
     def _get_drv_path(cls):
-        if not WebAppBase._path:
+        """
+        Find the driver binary: already known to this process, else cached on disk by an earlier run, else on the
+        PATH, and only as a last resort downloaded by webdriver_manager
+        """
+        path = cls._paths.get(cls.browser)
+        if path:
+            return path
+        wrapper = cls._browsers[cls.browser]
+        key = wrapper.cache_key(cls.browser)
+        path = cls._driver_cache.get(key) if key else None
+        if not path and wrapper.driver_version == "latest" and wrapper.driver_name:
+            path = shutil.which(wrapper.driver_name)
+        if not path:
             #WebAppBase._path = ChromeDriverManager().install()
-            cls.log.log(f"Find path to {cls.browser} driver...")
-            manager = cls._browsers[cls.browser].get_manager()
-            WebAppBase._path = manager.install()
-            cls.log.log(f"Bin = {WebAppBase._path}")
-        return WebAppBase._path
+            cls.log.log("Find path to %s driver...", cls.browser)
+            path = wrapper.get_manager().install()
+            if key:
+                cls._driver_cache.put(key, path)
+        cls.log.log("Bin = %s", path)
+        cls._paths[cls.browser] = path  # the one dict on WebAppBase, unless a subclass has its own
+        return path
 
     def get_webdriver(self):
-        return WebAppBase.webdriver
+        return self.webdriver
+
+    def save_session(self, user, app=FIXTURE_URL):
+        """
+        Snapshot the cookies and web storage of a logged in user, call this once the login has gone through
+        :param user: who is logged in
+        :param app: base url of the web app
+        """
+        self.session_store.save(self.webdriver, app, user)
+
+    def restore_session(self, user, app=FIXTURE_URL, validate=None):
+        """
+        Log in by putting a saved session back, see SessionSnapshot
+        :param user: who to be
+        :param app: base url of the web app
+        :param validate: how to tell the browser really is logged in, a snapshot that fails it is thrown away. A
+            page class, which must load on the restored page, or a callable() returning True. By default the
+            restored page must not have redirected elsewhere, as sites do when the session has expired
+        :return: True if the session was restored
+        """
+        self.session_restored = False
+        page = self.session_store.restore(self.webdriver, app, user, self.rewrite_url(app))
+        if not page:
+            return False
+        try:
+            if validate is None:
+                valid = urllib.parse.urlsplit(self.webdriver.current_url).path == urllib.parse.urlsplit(page).path
+            elif isinstance(validate, type):
+                valid = validate(self) is not None
+            else:
+                valid = validate()
+        except POMException:
+            valid = False
+        if not valid:
+            self.log.log("saved session for %s is no longer valid", user)
+            self.session_store.forget(app, user)
+            self.webdriver.execute_script(RESET_STORAGE_SCRIPT)
+            self.webdriver.delete_all_cookies()
+            return False
+        self.session_restored = True
+        return True
+
+    def ensure_logged_in(self, user, login, validate=None, app=FIXTURE_URL):
+        """
+        Restore the user's saved session, and only when there is no usable one, log in for real and save it:
+            self.ensure_logged_in("user", lambda: CombineLoginOutSteps(self).login("user", "pass"))
+        :param user: who to be
+        :param login: callable() that logs user in through the UI
+        :param validate: see restore_session
+        :param app: base url of the web app
+        :return: True if a saved session was used
+        """
+        if self.restore_session(user, app, validate):
+            self.log.log("restored saved session for %s", user)
+            return True
+        login()
+        self.save_session(user, app)
+        return False
 
     def get(self, url):
-        WebAppBase.webdriver.get(url)
+        self.webdriver.get(self.rewrite_url(url))
+
+    def rewrite_url(self, url):
+        """
+        Point a url written against FIXTURE_URL at the fixture server this process actually started
+        :param url: absolute url
+        :return: url
+        """
+        if self.fixture_base and url.startswith(FIXTURE_URL):
+            return self.fixture_base + url[len(FIXTURE_URL):]
+        return url
+
+
+WebAppBase.session_pool = SessionPool(WebAppBase._new_driver, log=WebAppBase.log)
 
 
 class PageBaseTest(unittest.TestCase, WebAppBase):
     log = Logger("PB")
     dummy_web_server = None
+    pristine_browser = False  # set True in a test class that needs a freshly started browser for every test
 
     def setUp(self):
-        WebAppBase.set_browser("firefox")  # firefox or chrome
-        PageBaseTest.log.log(f"setUp: open {WebAppBase.browser}")
-        WebAppBase.start_browser()
+        WebAppBase.set_browser(os.environ.get("POM_BROWSER", "firefox"))  # firefox, chrome or fake
+        if self.pristine_browser:
+            PageBaseTest.log.log("setUp: open %s", WebAppBase.browser)
+            self.start_browser()
+        else:
+            PageBaseTest.log.log("setUp: lease %s", WebAppBase.browser)
+            self.lease_browser()
 
     def tearDown(self):
-        PageBaseTest.log.log("tearDown: quit web driver")
-        PageBaseTest.webdriver.quit()
+        if self.pristine_browser:
+            PageBaseTest.log.log("tearDown: quit web driver")
+            self.webdriver.quit()
+        else:
+            PageBaseTest.log.log("tearDown: release web driver")
+            self.release_browser()
 
     def get(self, url):
-        PageBaseTest.log.log(f"navigate: {url}")
+        PageBaseTest.log.log("navigate: %s", url)
         super().get(url)
 
+    def run(self, result=None):
+        # while the test runs its log goes into a buffer, attached to its report if it fails, see _callTestMethod
+        self._log_buffer = collections.deque(maxlen=LOG_BUFFER_LINES) if LOG_BUFFER else None
+        _log_router.buffer = self._log_buffer
+        try:
+            return super().run(result)
+        finally:
+            _log_router.buffer = None
+
+    def _callTestMethod(self, method):
+        # a POMException escaping the test method is captured here, before tearDown gives the browser back
+        try:
+            return super()._callTestMethod(method)
+        except unittest.SkipTest:
+            raise
+        except Exception as ex:
+            buffer = self._log_buffer
+            lines = [_log_formatter.format(record) for record in buffer] if buffer else []
+            if isinstance(ex, POMException):
+                try:
+                    ex.capture(self.id(), log=lines)
+                except Exception as capture_failed:  # the browser may be the thing that broke
+                    PageBaseTest.log.warning("Could not capture the failure: %r", capture_failed)
+            if lines and hasattr(ex, "add_note"):
+                ex.add_note("Log:\n" + "\n".join(lines))
+            elif buffer:
+                for record in buffer:  # no notes before python 3.11, print the log instead
+                    _log_queue.put(record)
+            raise
+
+    def budget(self, name, commands=None, ms=None):
+        """
+        Performance budget for a block of test code, fails the test if the block sends more WebDriver commands
+        or takes longer than allowed:
+            with self.budget("DemoLoginPageUsername.submit", commands=6, ms=300):
+                pglogin.submit("user")
+        :param name: what is being measured, for the failure message
+        :param commands: maximum number of WebDriver commands
+        :param ms: maximum milliseconds
+        """
+        from Instrumentation import instrument
+        return instrument(self.webdriver).budget(name, commands, ms)
+
     @classmethod
     def setUpClass(cls):
-        # start a web server
+        # start a web server, on a free port so that several test processes can run side by side
         PageBaseTest.dummy_web_server = WebServer()
-        executable = sys.executable
-        PageBaseTest.dummy_web_server.exec_command([executable, '-m', 'http.server', '8080'])
+        port = PageBaseTest.dummy_web_server.start()
+        WebAppBase.fixture_base = f"http://localhost:{port}"
 
     @classmethod
     def tearDownClass(cls):
         # stop it
         if PageBaseTest.dummy_web_server:
-            PageBaseTest.dummy_web_server.terminate_command()
+            PageBaseTest.dummy_web_server.stop()
 
 
@@ -0,0 +1,230 @@
+# Event driven waits. WebDriverWait polls every 500ms, which on average adds 250ms to every wait even when the page
+# is ready within milliseconds. Here a single asynchronous script (PageScripts.WAIT_FOR) waits inside the page and
+# calls back the moment the condition holds. Where the driver cannot run asynchronous scripts, we fall back to
+# polling the equivalent synchronous script.
+#
+# The waits are written once, as generators of driver steps: ("execute_script", script, *args), ("title",),
+# ("sleep", seconds) and so on. A step's result (or its exception) is sent back into the generator, which decides
+# what to do next without touching the driver itself. WaitEngine performs the steps with a blocking webdriver,
+# AsyncPageFactory.AsyncWaitEngine awaits them on an AsyncWebDriver, and page logic built from the same steps (see
+# PageFactory.PageSteps) runs on either.
+import time
+from selenium.common.exceptions import (JavascriptException, StaleElementReferenceException, TimeoutException,
+                                        UnknownMethodException, WebDriverException)
+
+from PageScripts import WAIT_FOR, LOCATOR_STATES, ACTIVATE_ELEMENT, SETTLE_STATE
+
+POLL_FREQUENCY = 0.1  # seconds between checks for changes only CSS makes, and between polls when falling back
+SETTLE_QUIET_MS = 50  # how long a page must stay quiet to count as settled
+SCRIPT_TIMEOUT_MARGIN = 2  # seconds the driver waits for an async script beyond the script's own timeout
+
+SLEEP = "sleep"  # the one step that is not a driver call
+PROPERTIES = ("title", "current_url", "page_source")  # steps that selenium has as properties, not methods
+
+# a page navigating away while our script waits in it shows up as one of these, we just try again in the new page
+_RETRY = (JavascriptException, StaleElementReferenceException, TimeoutException)
+
+
+def navigated(ex):
+    """
+    :return: True if a script failed because the page went away under it, rather than because the script broke
+        (a script error such as an invalid XPath is raised, not waited out)
+    """
+    if isinstance(ex, JavascriptException):
+        return "unload" in (ex.msg or "").lower()  # chrome and firefox both say the document was unloaded
+    return isinstance(ex, _RETRY)
+
+
+def unsupported(ex):
+    """
+    :return: True if the driver does not do asynchronous scripts at all, so waits must poll
+    """
+    message = (ex.msg or "").lower()
+    return isinstance(ex, UnknownMethodException) or "unknown command" in message or "unsupported" in message
+
+
+def run_steps(steps, perform):
+    """
+    Drive a generator of steps to the end
+    :param steps: generator yielding step tuples, see the top of this file
+    :param perform: callable(name, *args) doing one step, its result or exception goes back into the generator
+    :return: what the generator returns
+    """
+    result, error = None, None
+    while True:
+        try:
+            step = steps.send(result) if error is None else steps.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            result, error = perform(*step), None
+        except Exception as ex:
+            result, error = None, ex
+
+
+class WaitEngine(object):
+    """
+    Waits for titles, locators and elements on one webdriver
+    """
+    def __init__(self, driver):
+        self.driver = driver
+
+    def perform(self, name, *args):
+        """
+        Do one step on the driver
+        """
+        if name == SLEEP:
+            return time.sleep(*args)
+        if name in PROPERTIES:
+            return getattr(self.driver, name)
+        return getattr(self.driver, name)(*args)
+
+    def run(self, steps):
+        """
+        :param steps: generator of steps, such as the *_steps methods here
+        :return: what the generator returns
+        """
+        return run_steps(steps, self.perform)
+
+    def title_contains(self, substring, timeout):
+        """
+        :return: True once the page title contains substring, False on timeout
+        """
+        return self.run(self.title_contains_steps(substring, timeout))
+
+    def locators_visible(self, locator_args, timeout, appeared=None, poll_frequency=POLL_FREQUENCY):
+        """
+        :param locator_args: [[alias, by, value], ...] see PageScripts.locator_args
+        :param appeared: optional dict, filled in with alias -> seconds it took each locator to become visible
+        :param poll_frequency: seconds between checks
+        :return: [] once all are visible, else the [alias, reason] pairs still pending at the timeout
+        """
+        return self.run(self.locators_visible_steps(locator_args, timeout, appeared, poll_frequency))
+
+    def activate(self, by, value, border, timeout, poll_frequency=POLL_FREQUENCY):
+        """
+        Wait for an element to be visible, then scroll it into view and highlight it, see ACTIVATE_ELEMENT
+        :param poll_frequency: seconds between checks
+        :return: the WebElement
+        :raises TimeoutException: if it does not become visible in time
+        """
+        return self.run(self.activate_steps(by, value, border, timeout, poll_frequency))
+
+    def settle(self, cap, quiet_ms=SETTLE_QUIET_MS):
+        """
+        Wait until the page has finished loading, has no fetch or XHR requests in flight and no CSS animations or
+        transitions running, and has stayed that way for quiet_ms
+        :param cap: most seconds to wait
+        :return: (settled, busy) where busy lists what was still going on at the cap, see SETTLE_STATE
+        """
+        return self.run(self.settle_steps(cap, quiet_ms))
+
+    def title_contains_steps(self, substring, timeout):
+        def poll():
+            title = yield ("title",)
+            return substring in title, title
+
+        ok, _ = yield from self._wait("title", substring, timeout, poll)
+        return ok
+
+    def locators_visible_steps(self, locator_args, timeout, appeared=None, poll_frequency=POLL_FREQUENCY):
+        started = time.monotonic()
+        seen = {}
+
+        def poll():
+            pending = yield ("execute_script", LOCATOR_STATES, locator_args)
+            waiting = {alias for alias, _ in pending}
+            for alias, _, _ in locator_args:
+                if alias not in waiting:
+                    seen.setdefault(alias, int((time.monotonic() - started) * 1000))
+            return not pending, {"pending": pending, "appeared": seen}
+
+        _, state = yield from self._wait("locators", locator_args, timeout, poll, poll_frequency)
+        if state is None:
+            return [[alias, "missing"] for alias, _, _ in locator_args]
+        if appeared is not None:
+            appeared.update((alias, ms / 1000) for alias, ms in state["appeared"].items())
+        return state["pending"]
+
+    def activate_steps(self, by, value, border, timeout, poll_frequency=POLL_FREQUENCY):
+        def poll():
+            element = yield ("execute_script", ACTIVATE_ELEMENT, by, value, border)
+            return element is not None, element
+
+        ok, element = yield from self._wait("activate", [by, value, border], timeout, poll, poll_frequency)
+        if not ok:
+            raise TimeoutException(f"Element {by}={value} not visible after {timeout}s")
+        return element
+
+    def settle_steps(self, cap, quiet_ms=SETTLE_QUIET_MS):
+        quiet_since = [None]
+
+        def poll():
+            busy = (yield ("execute_script", SETTLE_STATE)) or []
+            now = time.monotonic()
+            if busy:
+                quiet_since[0] = None
+            elif quiet_since[0] is None:
+                quiet_since[0] = now
+            return quiet_since[0] is not None and now - quiet_since[0] >= quiet_ms / 1000, busy
+
+        ok, busy = yield from self._wait("settle", quiet_ms, cap, poll)
+        return ok, busy or []
+
+    def _wait(self, kind, payload, timeout, poll, poll_frequency=POLL_FREQUENCY):
+        """
+        :param poll: fallback check, a generator function of steps returning (ok, value)
+        :param poll_frequency: seconds between checks, both in the page and when polling
+        :return: (ok, value)
+        """
+        deadline = time.monotonic() + timeout
+        if getattr(self.driver, "_pom_async_waits", True):
+            yield from self._ensure_script_timeout(timeout)
+            result = None
+            while True:
+                remaining = deadline - time.monotonic()
+                try:
+                    result = yield ("execute_async_script", WAIT_FOR, kind, payload, max(0, int(remaining * 1000)),
+                                    int(poll_frequency * 1000))
+                except _RETRY as ex:
+                    if not navigated(ex):
+                        raise
+                except WebDriverException as ex:
+                    if not unsupported(ex):
+                        raise
+                    self.driver._pom_async_waits = False  # this driver can't do it, poll from now on
+                    break
+                else:
+                    if not isinstance(result, dict):
+                        self.driver._pom_async_waits = False
+                        break
+                    if result.get("ok") or remaining <= 0:
+                        return bool(result.get("ok")), result.get("value")
+                # a navigation interrupted the script, or it gave up early: pause, then go round again
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                yield (SLEEP, min(poll_frequency, remaining))
+            if isinstance(result, dict):
+                return False, result.get("value")
+        return (yield from self._poll(deadline, poll, poll_frequency))
+
+    def _poll(self, deadline, poll, poll_frequency):
+        state = (False, None)
+        while True:
+            try:
+                state = yield from poll()
+            except (JavascriptException, StaleElementReferenceException) as ex:
+                if not navigated(ex):
+                    raise
+            remaining = deadline - time.monotonic()
+            if state[0] or remaining <= 0:
+                return state
+            yield (SLEEP, min(poll_frequency, remaining))
+
+    def _ensure_script_timeout(self, timeout):
+        # the async script enforces its own timeout, the driver's must be longer. Only costs a command when it grows
+        needed = timeout + SCRIPT_TIMEOUT_MARGIN
+        if getattr(self.driver, "_pom_script_timeout", 0) < needed:
+            yield ("set_script_timeout", needed)
+            self.driver._pom_script_timeout = needed
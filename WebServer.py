@@ -1,76 +1,75 @@
-# for the purposess of this example, I've added a very minimal and noise
-# web-server using python   ['python', '-m', 'http.server', '8080']
+# for the purposess of this example, I've added a very minimal web-server that serves the html fixture pages in
+# this folder, running on a thread inside the test process.
 # you won't need this file at all except to run the self-tests here.
 #
-import subprocess
+import os
 import threading
-import io
+import functools
+import collections
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
 
+FIXTURE_ROOT = os.path.dirname(os.path.abspath(__file__))
+LOG_LINES = 500  # the request log only keeps this many of the most recent lines
 
-class WebServer(object):
-
-    stdout_result = 1
-    stderr_result = 1
-    stop = False
-    stdout_buffer = io.StringIO()
-    stderr_buffer = io.StringIO()
-
-    def stdout_thread(self, pipe):
-        #global stdout_result
-        while True:
-            out = pipe.stdout.read(1)
-            WebServer.stdout_result = pipe.poll()
-            if out == [] and WebServer.stdout_result is not None:
-                break
 
-            if out != []:
-                #sys.stdout.write("".join(chr(x) for x in out))
-                #sys.stdout.flush()
-                WebServer.stdout_buffer.write("".join(chr(x) for x in out))
-            if WebServer.stop:
-                print("== STDOUT ==")
-                WebServer.stdout_buffer.seek(0)
-                print(WebServer.stdout_buffer.read())
-                break
+class _FixtureHandler(SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep connections alive between page and stylesheet requests
 
-    def stderr_thread(self, pipe):
-        while True:
-            err = pipe.stderr.read(1)
-            WebServer.stderr_result = pipe.poll()
-            if err == [] and WebServer.stderr_result is not None:
-                break
+    def log_message(self, format, *args):
+        self.server.log_buffer.append(f"{self.address_string()} {format % args}")
 
-            if err != []:
-                #sys.stderr.write("".join(chr(x) for x in err))
-                #sys.stderr.flush()
-                WebServer.stderr_buffer.write("".join(chr(x) for x in err))
 
-            if WebServer.stop:
-                print("== STDERR ==")
-                WebServer.stderr_buffer.seek(0)
-                print(WebServer.stderr_buffer.read())
-                break
-
-    def exec_command(self, command, cwd=None):
-        if cwd is not None:
-            print('[' + ' '.join(command) + '] in ' + cwd)
-        else:
-            print('[' + ' '.join(command) + ']')
+class WebServer(object):
 
-        self.p = subprocess.Popen(
-            command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd
-        )
+    def __init__(self, root=FIXTURE_ROOT, log_lines=LOG_LINES):
+        """
+        :param root: folder to serve
+        :param log_lines: size of the request log ring buffer
+        """
+        self.root = root
+        self.log_buffer = collections.deque(maxlen=log_lines)
+        self.port = None
+        self._server = None
+        self._thread = None
 
+    def start(self, host="localhost", port=0, timeout=5):
+        """
+        Start serving, returns once the server is accepting connections
+        :param host: interface to listen on
+        :param port: 0 picks a free port
+        :param timeout: seconds to wait for the server thread
+        :return: the port number
+        """
+        handler = functools.partial(_FixtureHandler, directory=self.root)
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._server.log_buffer = self.log_buffer
+        self.port = self._server.server_address[1]
+        ready = threading.Event()
+        self._thread = threading.Thread(name='fixture_server', target=self._serve, args=(ready,), daemon=True)
+        self._thread.start()
+        if not ready.wait(timeout):
+            raise RuntimeError(f"Fixture web server did not start within {timeout}s")
+        return self.port
 
-        self.out_thread = threading.Thread(name='stdout_thread', target=self.stdout_thread, args=(self.p,))
-        self.err_thread = threading.Thread(name='stderr_thread', target=self.stderr_thread, args=(self.p,))
+    def _serve(self, ready):
+        # the socket is already bound and listening, so connections queue up until the loop below picks them up
+        ready.set()
+        self._server.serve_forever(poll_interval=0.05)
 
-        self.err_thread.start()
-        self.out_thread.start()
+    def url(self, path=""):
+        return f"http://localhost:{self.port}/{path}"
 
-    def terminate_command(self):
-        self.p.terminate()
-        WebServer.stop = True
-        self.out_thread.join()
-        self.err_thread.join()
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
 
+    def dump_log(self):
+        """
+        Log the most recent requests, for when a page did not load the way a test expected
+        """
+        from TestBase import Logger  # TestBase imports this module, so not at the top
+        Logger("WEB").log("== WEB SERVER LOG ==\n%s", "\n".join(self.log_buffer))
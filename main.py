@@ -4,15 +4,34 @@
 #
 from selenium.webdriver.common.by import By
 from selenium import __version__ as selenium_version
+from selenium.common.exceptions import WebDriverException, JavascriptException, UnknownMethodException
+import os
 import time
+import asyncio
+import tempfile
+import unittest
+import unittest.mock
+import urllib.error
+import urllib.request
 
 # PageObject base classes
-from TestBase import PageBaseTest
-from PageFactory import WebApplicationStub, PageFactory, PageTitleChecker
+from TestBase import PageBaseTest, WebAppBase, WrapDriver, DriverCache
+from PageFactory import WebApplicationStub, PageFactory, PageTitleChecker, SETTLE, turbo, set_turbo
 from TestBase import POMException
+from SessionSnapshot import SessionStore
+from SessionPool import SessionPool, RESET_STORAGE_SCRIPT
+from WebServer import WebServer
+from PageScripts import READ_STORAGE, WRITE_STORAGE, SETTLE_STATE
 
 # PageOjects that return fresh Pageobjects
-from PageChains import DemoLoginPageUsernameV2
+from PageChains import DemoLoginPageUsernameV2, DemoProfilePageV2
+from PageChains import ChainingPageFactory, next_page, register_page, MAP, TRANSITIONS
+from TabMultiplexer import TabMultiplexer
+from AsyncPageFactory import AsyncWebDriver, DemoLoginPageUsernameAsync, DemoProfilePageAsync
+from LoadRunner import flow, LoadRunner
+from LatencyStore import LATENCIES, LatencyStore, MIN_SAMPLES, MIN_TIMEOUT
+from ParallelRunner import DurationHistory, make_shards, find_tests, ParallelSuite
+from WaitEngine import WaitEngine, SLEEP
 
 WEB_LOGIN_URL = "http://localhost:8080/loginuser.html"
 
@@ -32,8 +51,7 @@ class WelcomePage(PageFactory):
     }
 
     def submit(self, firstname, lastname):
-        self.firstname = firstname
-        self.lastname = lastname
+        self.fill({"firstname": firstname, "lastname": lastname})
         self.btnContinue.click()
 
 
@@ -66,6 +84,10 @@ class DemoLoginPageUsername(PageFactory):
         "editUserName": (By.ID, "usernameOrEmail"),
         "btnContinue": (By.NAME, "Continue")
     }
+    # the server list rows, see _test_login_logout
+    collection_locators = {
+        "servers": (By.XPATH, "//p[@class='name']/../../..")
+    }
 
     def submit(self, username):
         # edtUserName become class variable from PageFactory
@@ -90,6 +112,17 @@ class DemoLoginPagePassword(PageFactory):
         self.btnLogin.click()
 
 
+class BrokenLoginPage(PageFactory):
+    """
+    The login page, with two locators that are not on it
+    """
+    locators = {
+        "editUserName": (By.ID, "usernameOrEmail"),
+        "editEmail": (By.ID, "email"),
+        "btnRegister": (By.XPATH, "//button[@name='Register']")
+    }
+
+
 class DemoHomePage(PageFactory):
     """
     On home page once logged in,
@@ -108,6 +141,10 @@ class DemoProfilePage(PageFactory):
     locators = {
         "btnLogout": (By.NAME, "LogOut")
     }
+    # and a list, the footer lines
+    collection_locators = {
+        "footerLines": (By.XPATH, "//footer/p")
+    }
 
     def logout(self):
         self.btnLogout.click()
@@ -131,6 +168,20 @@ class CombineLoginOutSteps(WebApplicationStub):
         pgProfile.logout()
 
 
+# Flows for LoadRunner, for example: python LoadRunner.py main login_logout --sessions 4 --rate 2
+@flow("login_logout")
+def login_logout(app, username="user", password="pass"):
+    steps = CombineLoginOutSteps(app)
+    steps.login(username, password)
+    steps.logout()
+
+
+@flow("profile_chain")
+def profile_chain(app, username="user", password="pass"):
+    login_page = DemoLoginPageUsernameV2(driver=app, url=WEB_LOGIN_URL)
+    login_page.login_to_profile(username=username, password=password).next()
+
+
 class TestPageObjects(PageBaseTest):
 
     def _test_login_smoke(self):
@@ -157,19 +208,556 @@ class TestPageObjects(PageBaseTest):
         pg_welcome = WelcomePage(self)
         pg_welcome.submit("firstname", "lastname")
 
+    def test_welcome_snapshot(self):
+        """
+        Snapshots read the whole page in one go, diff two of them to see what a step changed
+        """
+        self.get("http://localhost:8080/welcome.html")
+        pg_welcome = WelcomePage(self)
+        before = pg_welcome.snapshot(["class"])
+        self.assertFalse(before["btnContinue"].enabled)
+        pg_welcome.fill({"firstname": "firstname"})
+        changed = before.diff(pg_welcome.snapshot(["class"]))
+        self.assertEqual(list(changed), ["firstname"])
+        self.assertEqual(changed["firstname"][1].value, "firstname")
+
+    def test_profile_collection(self):
+        """
+        Collections read every match of a locator lazily, in batches
+        """
+        self.get("http://localhost:8080/profile.html")
+        pg_profile = DemoProfilePage(self)
+        self.assertEqual(len(pg_profile.footerLines), 2)
+        self.assertTrue(pg_profile.footerLines[0].text.startswith("Copyright"))
+        lines = pg_profile.collection("footerLines", ["class"], batch_size=1)
+        self.assertEqual([dict(row.attributes)["class"] for row in lines], ["fl_left", "fl_right"])
+        self.assertEqual(lines.find("Template")[0], 1)
+        self.assertEqual([row.index for row in lines[::-1]], [1, 0])
+
+    def test_collection_indexes(self):
+        """
+        Negative indexes count from the end and stop there, slices with a step only read the rows they pick
+        """
+        self.get("http://localhost:8080/profile.html")
+        lines = DemoProfilePage(self).footerLines
+        self.assertEqual(lines[-2].index, 0)
+        for index in (-3, -9, 2):
+            with self.assertRaises(IndexError):
+                lines[index]
+        rows = list(lines)
+        for step in (5, -5, 2, -2, -1):
+            self.assertEqual(lines[::step], rows[::step])
+        self.assertEqual(lines[1:0:-1], rows[1:0:-1])
+
+    def test_navigate_to_profile(self):
+        """
+        navigate_to finds its own way through the registered page chain
+        """
+        login_page = DemoLoginPageUsernameV2(driver=self, url=WEB_LOGIN_URL, animation_delay=0)
+        profile_page = login_page.navigate_to(DemoProfilePageV2, username="user", password="pass")
+        self.assertIsInstance(profile_page, DemoProfilePageV2)
+
+    def test_next_page(self):
+        """
+        @next_page waits only for the ready locators, passes on a page of the next class, and builds a new page
+        for a method returning self
+        """
+        class ResultsPage(ChainingPageFactory):
+            locators = {"btnLogout": (By.NAME, "LogOut"), "btnMore": (By.NAME, "NotOnThisPage")}
+
+            @next_page("ResultsPage", ready=["btnLogout"])
+            def next_results(self):
+                return self  # a "next" button paging through results, the next page is of this same class
+
+            @next_page("ResultsPage", ready=["btnLogout"])
+            def skip_results(self):
+                self.skipped_to = self.next_results()
+                return self.skipped_to
+
+            @next_page("ResultsPage")
+            def all_results(self):
+                return self
+
+        register_page(ResultsPage)
+        try:
+            page = ResultsPage(driver=self, url=DemoProfilePageV2.direct_url, ready_locators=["btnLogout"],
+                               timeout=0.2, animation_delay=0)
+            more = page.next_results()
+            self.assertIsInstance(more, ResultsPage)
+            self.assertIsNot(more, page)
+            self.assertEqual(more.ready_locators, ["btnLogout"])
+            self.assertIs(page.skip_results(), page.skipped_to)
+            with self.assertRaises(POMException):  # without ready= the new page waits for all of its locators
+                page.all_results()
+        finally:
+            MAP.pop("ResultsPage")
+            TRANSITIONS.pop("ResultsPage")
+
+    def test_session_restore(self):
+        """
+        The second login puts the saved session back instead of driving the login pages
+        """
+        def login():
+            CombineLoginOutSteps(self).login("user", "pass")
+            self.webdriver.add_cookie({"name": "token", "value": "abc"})
+            self.webdriver.execute_script(WRITE_STORAGE, {"theme": "dark"}, {})
+
+        def log_out():
+            self.webdriver.delete_all_cookies()
+            self.webdriver.execute_script(RESET_STORAGE_SCRIPT)
+
+        with tempfile.TemporaryDirectory() as folder:
+            self.session_store = SessionStore(folder)
+            self.assertFalse(self.ensure_logged_in("user", login))
+            self.assertFalse(self.session_restored)
+            log_out()
+            self.assertTrue(self.ensure_logged_in("user", login, validate=DemoHomePage))
+            self.assertTrue(self.session_restored)
+            self.assertEqual({cookie["name"]: cookie["value"] for cookie in self.webdriver.get_cookies()},
+                             {"token": "abc"})
+            self.assertEqual(self.webdriver.execute_script(READ_STORAGE)["local"], {"theme": "dark"})
+            log_out()
+            self.assertTrue(self.restore_session("user"))  # the saved page opens without a redirect
+            log_out()
+            self.assertFalse(self.restore_session("user", validate=lambda: False))  # expired, say
+            self.assertEqual(os.listdir(folder), [])
+
+    def test_web_server(self):
+        """
+        The fixture server serves the pages over http, and logs the requests it answered
+        """
+        server = WebServer()
+        port = server.start()
+        try:
+            with urllib.request.urlopen(server.url("loginuser.html")) as response:
+                self.assertEqual(response.status, 200)
+                self.assertIn("<title>", response.read().decode())
+            with self.assertRaises(urllib.error.HTTPError) as missing:
+                urllib.request.urlopen(f"http://localhost:{port}/missing.html")
+            self.assertEqual(missing.exception.code, 404)
+            missing.exception.close()
+            with self.assertLogs("pom.WEB") as logged:
+                server.dump_log()
+            self.assertIn('"GET /loginuser.html HTTP/1.1" 200', logged.output[0])
+            self.assertIn('"GET /missing.html HTTP/1.1" 404', logged.output[0])
+        finally:
+            server.stop()
+
+    def test_session_pool_reset(self):
+        """
+        A session handed back to the pool comes out clean on every site the last test opened
+        """
+        urls = (WEB_LOGIN_URL, "http://127.0.0.1:8080/welcome.html")  # two origins, one server
+        pool = SessionPool(WebAppBase._new_driver)
+        driver = pool.lease(self.browser)
+        try:
+            for url in urls:
+                driver.get(url)
+                driver.add_cookie({"name": "token", "value": "abc"})
+                driver.execute_script(WRITE_STORAGE, {"theme": "dark"}, {"step": "2"})
+            pool.release(driver, self.browser)
+            self.assertIs(pool.lease(self.browser), driver)
+            for url in urls:
+                driver.get(url)
+                self.assertEqual(driver.get_cookies(), [])
+                self.assertEqual(driver.execute_script(READ_STORAGE), {"local": {}, "session": {}})
+        finally:
+            pool.release(driver, self.browser)
+            pool.close()
+
+    def test_flows_in_tabs(self):
+        """
+        Two flows at once, in two tabs of the one browser
+        """
+        def to_profile(tab):
+            login_page = DemoLoginPageUsernameV2(driver=tab, url=WEB_LOGIN_URL, animation_delay=0)
+            return login_page.login_to_profile(username="user", password="pass")
+
+        def welcome(tab):
+            pg_welcome = WelcomePage(tab, url="http://localhost:8080/welcome.html")
+            pg_welcome.fill({"firstname": "firstname"})
+            return pg_welcome.snapshot()["firstname"].value
+
+        with TabMultiplexer(self) as tabs:
+            profile_page, firstname = tabs.run([to_profile, welcome])
+        self.assertIsInstance(profile_page, DemoProfilePageV2)
+        self.assertEqual(firstname, "firstname")
+        self.assertEqual(len(self.webdriver.window_handles), 1)
+
+    def test_async_sessions(self):
+        """
+        One event loop driving several browser sessions through the login chain at once
+        """
+        from FakeDriver import FakeWebDriverServer
+        from WebServer import FIXTURE_ROOT
+        server = FakeWebDriverServer(FIXTURE_ROOT)  # a real run would point at a selenium grid or geckodriver
+
+        async def login():
+            driver = await AsyncWebDriver.start(server.url)
+            try:
+                login_page = await DemoLoginPageUsernameAsync.open(driver, url=WEB_LOGIN_URL, app=self)
+                return await login_page.login_to_profile("user", "pass")
+            finally:
+                await driver.quit()
+
+        async def login_all():
+            return await asyncio.gather(*(login() for _ in range(5)))
+
+        try:
+            pages = asyncio.run(login_all())
+        finally:
+            server.stop()
+        self.assertTrue(all(isinstance(page, DemoProfilePageAsync) for page in pages))
+
+    def test_failure_capture_dedupe(self):
+        """
+        The same screenshot and page source seen by two failing tests are stored once, each test gets its report
+        """
+        from FailureCapture import FailureWriter
+        with tempfile.TemporaryDirectory() as folder:
+            writer = FailureWriter(folder)
+            first = writer.submit("main.T.test_a", "not found", "http://localhost/", b"png", "<html></html>")
+            second = writer.submit("main.T.test_b", "not found", "http://localhost/", b"png", "<html></html>")
+            writer.flush()
+            self.assertEqual(first[:2], second[:2])
+            self.assertEqual(sorted(os.listdir(os.path.join(folder, "blobs"))),
+                             sorted(os.path.basename(path) for path in first[:2]))
+            self.assertTrue(os.path.isfile(first[2]) and os.path.isfile(second[2]))
+
+    def test_async_failure_capture(self):
+        """
+        Raising from an async page reads nothing from the browser, capturing the failure later does
+        """
+        from FakeDriver import FakeWebDriverServer
+        from FailureCapture import FailureWriter
+        from WebServer import FIXTURE_ROOT
+        server = FakeWebDriverServer(FIXTURE_ROOT)
+
+        async def fail():
+            driver = await AsyncWebDriver.start(server.url)
+            try:
+                await DemoProfilePageAsync.open(driver, url=WEB_LOGIN_URL, app=self, timeout=0.2)
+            except POMException as ex:
+                return driver, ex
+
+        try:
+            driver, ex = asyncio.run(fail())  # the event loop the session ran on is gone now
+            self.assertIsNone(ex.url)
+            with tempfile.TemporaryDirectory() as folder:
+                writer = FailureWriter(folder)
+                ex.capture(self.id(), writer)
+                writer.flush()
+                self.assertTrue(ex.url.endswith("/loginuser.html"))
+                self.assertTrue(os.path.isfile(ex.report))
+            asyncio.run(driver.quit())
+        finally:
+            server.stop()
+
+    def test_async_request_timeout(self):
+        """
+        A WebDriver endpoint that never answers fails the command, rather than hanging the task
+        """
+        async def ask():
+            connections = []
+            server = await asyncio.start_server(lambda reader, writer: connections.append(writer), "localhost", 0)
+            driver = AsyncWebDriver(f"http://localhost:{server.sockets[0].getsockname()[1]}", "session", timeout=0.2)
+            try:
+                with self.assertRaises(WebDriverException):
+                    await driver.title()
+            finally:
+                for writer in connections:
+                    writer.close()
+                server.close()
+            self.assertEqual(driver._idle, [])  # the unanswered connection was closed, not kept
+
+        asyncio.run(ask())
+
+    def test_load_flow(self):
+        """
+        Replay the login chain as load, two sessions for a second
+        """
+        report = LoadRunner("profile_chain", sessions=2, rate=10, ramp_up=0.2, duration=1).run()
+        print("\n".join(report.lines()))
+        self.assertFalse(report.failures)
+        self.assertGreater(report.throughput, 0)
+        self.assertIn(("DemoLoginPageUsernameV2", "editUserName"), report.steps)
+
+    def test_missing_locators_report(self):
+        """
+        A broken page fails after one timeout, shared by the whole page, and names every locator that is missing
+        """
+        self.get(WEB_LOGIN_URL)
+        started = time.monotonic()
+        with self.assertRaises(POMException) as caught:
+            BrokenLoginPage(self, timeout=1)
+        elapsed = time.monotonic() - started
+        self.assertIn("editEmail (missing)", caught.exception.msg)
+        self.assertIn("btnRegister (missing)", caught.exception.msg)
+        self.assertNotIn("editUserName", caught.exception.msg)
+        self.assertGreaterEqual(elapsed, 1)
+        self.assertLess(elapsed, 1.9)  # one timeout, not one per locator
+
+    def test_wait_fallbacks(self):
+        """
+        A driver without async scripts makes waits poll from then on, a page unloading under a wait is waited again
+        """
+        from FakeDriver import FakeDriver
+        from WebServer import FIXTURE_ROOT
+        calls = []
+
+        def no_async_scripts(*args):
+            calls.append(args)
+            raise UnknownMethodException("unknown command: execute/async")
+
+        driver = FakeDriver(local_root=FIXTURE_ROOT)
+        driver.get(WEB_LOGIN_URL)
+        driver.execute_async_script = no_async_scripts
+        waits = WaitEngine(driver)
+        self.assertTrue(waits.title_contains("Page Object", 1))
+        self.assertFalse(driver._pom_async_waits)
+        self.assertTrue(waits.title_contains("Page Object", 1))
+        self.assertFalse(waits.title_contains("Welcome", 0.1))  # timed out by polling
+        self.assertEqual(len(calls), 1)
+
+        driver = FakeDriver(local_root=FIXTURE_ROOT)
+        driver.get(WEB_LOGIN_URL)
+        execute_async_script = driver.execute_async_script
+        calls.clear()
+
+        def unloads_once(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                raise JavascriptException("javascript error: document unloaded while waiting for result")
+            return execute_async_script(*args)
+
+        driver.execute_async_script = unloads_once
+        self.assertTrue(WaitEngine(driver).title_contains("Page Object", 1))
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(getattr(driver, "_pom_async_waits", True))
+
+        def broken(*args):
+            raise JavascriptException("javascript error: SyntaxError: missing ) after argument list")
+
+        driver.execute_async_script = broken
+        with self.assertRaises(JavascriptException):  # a script that breaks is raised, not waited out
+            WaitEngine(driver).title_contains("Page Object", 1)
+
+    def test_settle(self):
+        """
+        settle() is done once the page goes quiet, and at the cap reports what kept it busy
+        """
+        from FakeDriver import FakeDriver
+        from WebServer import FIXTURE_ROOT
+        driver = FakeDriver(local_root=FIXTURE_ROOT)
+        driver.get(WEB_LOGIN_URL)
+        waits = WaitEngine(driver)
+        self.assertEqual(waits.settle(1), (True, []))
+        driver.execute_async_script = lambda *args: {"ok": False, "value": ["fetch"]}  # a request that never ends
+        self.assertEqual(waits.settle(0.2), (False, ["fetch"]))
+
+        driver._pom_async_waits = False  # and the same by polling
+        execute_script = driver.execute_script
+        self.assertEqual(waits.settle(1, quiet_ms=50), (True, []))
+
+        def animating(script, *args):
+            return ["animation"] if script == SETTLE_STATE else execute_script(script, *args)
+
+        driver.execute_script = animating
+        started = time.monotonic()
+        self.assertEqual(waits.settle(0.2), (False, ["animation"]))
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_log_buffer(self):
+        """
+        A test's log is dropped when the test passes, and attached to its report when it fails
+        """
+        import TestBase
+
+        class Logged(PageBaseTest):
+            def setUp(self):
+                pass  # no browser needed, just the log
+
+            def tearDown(self):
+                pass
+
+            def test_passes(self):
+                PageBaseTest.log.log("on the way up")
+
+            def test_fails(self):
+                PageBaseTest.log.log("on the way down")
+                self.fail("down")
+
+        result = unittest.TestResult()
+        outer = TestBase._log_router.buffer  # this test's own buffer
+        try:
+            with unittest.mock.patch.object(TestBase, "LOG_BUFFER", True), \
+                    unittest.mock.patch.object(TestBase._log_router, "enqueue") as printed:
+                Logged("test_passes").run(result)
+                Logged("test_fails").run(result)
+        finally:
+            TestBase._log_router.buffer = outer
+        printed.assert_not_called()
+        self.assertEqual((result.testsRun, len(result.failures)), (2, 1))
+        self.assertIn("INFO on the way down", result.failures[0][1])
+        self.assertNotIn("on the way up", result.failures[0][1])
+
+    def test_turbo(self):
+        """
+        Pages created in turbo mode neither highlight elements nor wait after actions
+        """
+        class LoginPage(PageFactory):
+            locators = DemoLoginPageUsername.locators
+
+        was = turbo()
+        try:
+            set_turbo(False)
+            page = LoginPage(self, WEB_LOGIN_URL, highlight=True, animation_delay=0.5)
+            self.assertEqual((page._highlight, list(page._after_action_steps())), (True, [(SLEEP, 0.5)]))
+            set_turbo(True)
+            page = LoginPage(self, WEB_LOGIN_URL, highlight=True, animation_delay=0.5)
+            self.assertEqual((page._highlight, list(page._after_action_steps())), (False, []))
+        finally:
+            set_turbo(was)
+
+    def test_element_cache(self):
+        """
+        Locators are looked up once, and again only when the page replaced the element
+        """
+        self.get(WEB_LOGIN_URL)
+        pglogin = DemoLoginPageUsername(self)
+        self.assertIs(pglogin.editUserName, pglogin.editUserName)
+        self.assertEqual((pglogin.element_cache.misses, pglogin.element_cache.hits), (1, 1))
+        self.get(WEB_LOGIN_URL)  # a new document, the cached element is stale now
+        with unittest.mock.patch.object(LATENCIES, "record") as record:
+            pglogin.editUserName = "user"
+        record.assert_not_called()  # finding it again is no page load, it must not shorten the learned timeouts
+        self.assertEqual(pglogin.element_cache.stats(), {"hits": 2, "misses": 1, "stale": 1, "cached": 1})
+        self.assertEqual(pglogin.snapshot(aliases=["editUserName"])["editUserName"].value, "user")
+
+    def test_learned_timeouts(self):
+        """
+        Locators get the page timeout until there is history, then three times their p99, per browser
+        """
+        store = LatencyStore(None)
+        for _ in range(MIN_SAMPLES - 1):
+            store.record("firefox", "DemoLoginPageUsername", "editUserName", 1.0)
+        self.assertEqual(store.timeout("firefox", "DemoLoginPageUsername", "editUserName", 20), 20)
+        store.record("firefox", "DemoLoginPageUsername", "editUserName", 1.5)
+        self.assertEqual(store.timeout("firefox", "DemoLoginPageUsername", "editUserName", 20), 4.5)
+        self.assertEqual(store.timeout("firefox", "DemoLoginPageUsername", "editUserName", 3), 3)
+        for _ in range(MIN_SAMPLES):
+            store.record("fake", "DemoLoginPageUsername", "editUserName", 0.0)
+        self.assertEqual(store.timeout("fake", "DemoLoginPageUsername", "editUserName", 20), MIN_TIMEOUT)
+        self.assertEqual(store.timeout("firefox", "DemoLoginPageUsername", "editUserName", 20), 4.5)
+
+    def test_make_shards(self):
+        """
+        Shards balance the expected durations, and every test lands in exactly one
+        """
+        durations = {"main.T.t1": 8, "main.T.t2": 5, "main.T.t3": 4, "main.T.t4": 3, "main.T.t5": 2}
+        test_ids = sorted(durations) + ["main.T.new"]  # no history, estimated from its class
+        with tempfile.TemporaryDirectory() as folder:
+            history = DurationHistory(f"{folder}/durations.json")
+            for test_id, seconds in durations.items():
+                history.record(test_id, seconds)
+            history.save()
+            shards = make_shards(test_ids, 2, history)
+            # another machine reading the same history file, listing the tests in another order
+            self.assertEqual(make_shards(list(reversed(test_ids)), 2, DurationHistory(history.path)), shards)
+            self.assertEqual(sorted(sum(shards, [])), sorted(test_ids))
+            # the new test is estimated at 4s, the median of its class
+            totals = [sum(history.estimate(test_id) for test_id in shard) for shard in shards]
+            self.assertEqual(sorted(totals), [12, 14])
+
+    def test_parallel_suite(self):
+        """
+        Tests named by module run in a worker process and report into the one result, a stop drops the rest
+        """
+        test_ids = [f"main.TestPageObjects.{name}"
+                    for name in ("test_welcome", "test_welcome_snapshot", "test_profile_collection")]
+        self.assertLess(set(test_ids), set(find_tests(["main"])))
+        suite = ParallelSuite(test_ids, 1)
+        result = unittest.TestResult()
+        suite(result)
+        self.assertEqual((result.testsRun, result.failures, result.errors), (3, [], []))
+        self.assertEqual(sorted(suite.durations), sorted(test_ids))
+
+        class StopAfterOne(unittest.TestResult):
+            def stopTest(self, test):
+                super().stopTest(test)
+                self.stop()
+
+        result = StopAfterOne()
+        ParallelSuite(test_ids, 1)(result)
+        self.assertEqual(result.testsRun, 1)
+
+    def test_driver_cache(self):
+        """
+        Driver paths are cached per installed browser version: a new process finds the cached driver, a browser
+        upgrade or a deleted binary resolves it again
+        """
+        installed = []
+
+        class Manager(object):
+            def install(self):
+                path = os.path.join(folder, f"driver{len(installed)}")
+                open(path, "w").close()
+                installed.append(path)
+                return path
+
+        class StubDriver(WrapDriver):
+            driver_name = "pom-no-such-driver"
+            version = "115.0"
+
+            @staticmethod
+            def get_manager():
+                return Manager()
+
+            @classmethod
+            def browser_version(cls):
+                return cls.version
+
+        with tempfile.TemporaryDirectory() as folder:
+            class App(WebAppBase):
+                browser = "stub"
+                _browsers = {"stub": StubDriver}
+                _paths = {}  # what this process has resolved
+                _driver_cache = DriverCache(os.path.join(folder, "drivers.json"))
+
+            first = App._get_drv_path()
+            App._paths.clear()  # a new process
+            self.assertEqual(App._get_drv_path(), first)
+            self.assertEqual(len(installed), 1)
+            StubDriver.version = "116.0"
+            App._paths.clear()
+            upgraded = App._get_drv_path()
+            self.assertNotEqual(upgraded, first)
+            os.remove(upgraded)
+            App._paths.clear()
+            self.assertEqual(App._get_drv_path(), installed[-1])
+            self.assertEqual(len(installed), 3)
+
+    def test_login_within_budget(self):
+        """
+        Performance budget: entering the user name is a handful of WebDriver commands, fail if that regresses
+        """
+        self.get(WEB_LOGIN_URL)
+        pglogin = DemoLoginPageUsername(self)
+        with self.budget("DemoLoginPageUsername.submit", commands=6, ms=500):
+            pglogin.submit("user")
+        print("\n".join(pglogin.recorder.report()))
+
     def _test_login_logout(self):
         """
         EXAMPLE 1: Of simple page object use
         """
         self.get("http://localhost:8080/loginuser.html")
         pglogin = DemoLoginPageUsername(self)
-        from selenium.webdriver.support.wait import WebDriverWait
-        from selenium.webdriver.support import expected_conditions as EC
         server = 'TM80'
-        row = WebDriverWait(pglogin.driver, timeout=5).until(
-            EC.visibility_of_element_located((By.XPATH,
-                f"//p[@class='name' and contains(text(),'{server}')]/../../.."))
-        )
+        found = pglogin.servers.find(server, timeout=5)  # one script call, however long the server list is
+        if found is None:
+            raise POMException(self.webdriver, f"Server {server} is not in the server list")
+        index, row = found
         pglogin.highlight_web_element(row)
         elem = row.find_element(By.XPATH, "//i[@class='material-icons connect-icon']")
         pglogin.highlight_web_element(elem)
@@ -261,7 +849,7 @@ class TestPageObjects(PageBaseTest):
         print("Repeat, but this time go directly to profile page")
         login_page = DemoLoginPageUsernameV2(driver=self,
                                              url=WEB_LOGIN_URL,
-                                             animation_delay=0.5
+                                             animation_delay=SETTLE
                                             )
         profile_page = login_page.login_to_profile(username="user",
                                                    password="pass")